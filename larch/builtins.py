@@ -6,7 +6,6 @@ import sys
 import copy
 from glob import glob
 from itertools import chain
-from pydoc import pager
 import help
 
 from .symboltable import Group, GroupAlias
@@ -123,6 +122,11 @@ def _reload(mod,larch=None,**kw):
     except NameError:
         pass
 
+def pager(text):
+    "pydoc.pager(text), importing pydoc (which is slow to import) when used"
+    import pydoc
+    pydoc.pager(text)
+
 def show_more(text,filename=None,writer=None,pagelength=30,prefix=''): # pragma: no cover
     """show lines of text in the style of more """
 
@@ -185,6 +189,58 @@ def _cs(namespace, larch=None, **kws):
         namespace = GroupAlias(obj=namespace, name="Alias for %s" % namespace)
     larch.symtable._sys.localGroup = namespace
 
+def _profile_on(clear=False, larch=None, **kws):
+    """start timing larch statements and procedures, adding to the
+    timings so far unless clear=True"""
+    larch.profile_on(clear=clear)
+
+def _profile_off(larch=None, **kws):
+    "stop timing larch statements and procedures"
+    larch.profile_off()
+
+def _profile_report(sort='tottime', limit=20, procedures=False,
+                    output=None, format='text', larch=None, **kws):
+    """report timings from profile_on():
+    sort by 'ncalls', 'tottime', 'cumtime', 'bytes' or 'line', showing
+    limit statements (or procedures, with procedures=True), or write
+    all timings to file output in format 'text', 'pstats' or 'callgrind'"""
+    profiler = larch.profile_data
+    if profiler is None:
+        print("no profile: use profile_on() first", file=larch.writer)
+        return
+    if output is None or format == 'text':
+        text = profiler.report(sort=sort, limit=limit, procedures=procedures)
+        if output is None:
+            return text
+        with open(output, 'w') as fh:
+            fh.write(text)
+    else:
+        profiler.write(output, format=format)
+
+def _pmap(proc, sequence, nworkers=None, chunksize=None, errors='raise',
+          larch=None, **kws):
+    """map a procedure over a sequence with a pool of nworkers processes,
+    returning the list of results in order.  Items for which proc fails
+    give None, and their errors are reported unless errors='ignore'."""
+    from .parallel import pmap
+    return pmap(larch, proc, sequence, nworkers=nworkers,
+                chunksize=chunksize, errors=errors)
+
+def _save_session(dirname, larch=None, **kws):
+    """save the groups and variables of the session to directory dirname,
+    to be restored with load_session().  Large arrays are saved to files
+    of their own, and restored by mapping them into memory."""
+    from .session import save_session
+    skipped = save_session(dirname, larch, **kws)
+    if skipped:
+        print("cannot save: %s" % ', '.join(skipped), file=larch.writer)
+
+def _load_session(dirname, larch=None, **kws):
+    """restore a session saved with save_session() from directory
+    dirname, replacing variables of the same names"""
+    from .session import load_session
+    load_session(dirname, larch)
+
 class LarchCheck(object):
     '''makes sure func gets executed with a larch interpreter available.'''
 
@@ -1,3 +1,5 @@
+from functools import partial
+
 class Closure(object):
     """Give a reference to a function with arguments so that it 
     can be called later, optionally changing the argument list.  
@@ -32,9 +34,70 @@ class Closure(object):
     def __call__(self, *args, **c_kwds):
         if self.func is None:
             return None
-        # avoid overwriting self.kwds here!!
-        kwds = {}
-        for key, val in list(self.kwds.items()):
-            kwds[key] = val
+        # avoid overwriting self.kwds here!!  Unpacking with ** makes
+        # a new dict, so only merging keywords needs a copy.
+        if not c_kwds:
+            return self.func(*args, **self.kwds)
+        if not self.kwds:
+            return self.func(*args, **c_kwds)
+        kwds = self.kwds.copy()
         kwds.update(c_kwds)
         return self.func(*args, **kwds)
+
+class BoundCall(partial):
+    """a function with keyword arguments bound to it, as made by
+    bind_call().  As a functools.partial, it is called without running
+    any Python code to merge the keyword arguments."""
+    def __repr__(self):
+        return "<function %s>" % (getattr(self.func, '__name__', self.func))
+    __str__ = __repr__
+
+# flag of code objects taking **kwargs.  The code is read directly, as
+# importing inspect would take longer than starting the interpreter.
+CO_VARKEYWORDS = 0x08
+
+def argument_names(func):
+    """(names of the arguments, whether it takes **kwargs) for a Python
+    function or method, or None for other objects"""
+    func = getattr(func, 'im_func', func)
+    code = getattr(func, 'func_code', None)
+    if code is None:
+        return None
+    return (code.co_varnames[:code.co_argcount],
+            bool(code.co_flags & CO_VARKEYWORDS))
+
+# keyword argument names taken by functions, for bind_call()
+_keyword_names = {}
+
+def keyword_names(func):
+    """set of the names of arguments that func takes, or None if it takes
+    any keyword argument (or cannot be inspected).  Cached per function."""
+    try:
+        return _keyword_names[func]
+    except (KeyError, TypeError):
+        pass
+    spec = argument_names(func)
+    if spec is None:
+        spec = argument_names(getattr(func, '__call__', None))
+    names = None
+    if spec is not None and not spec[1]:
+        names = frozenset(spec[0])
+    try:
+        _keyword_names[func] = names
+    except TypeError:
+        pass
+    return names
+
+def bind_call(func, **kwds):
+    """func with those of kwds that it takes bound to it, for builtins and
+    plugin functions that are called often.  This is func itself if it
+    takes none of them, and otherwise a BoundCall.  Unlike a Closure,
+    keyword arguments that func does not take are left out."""
+    names = keyword_names(func)
+    if names is not None:
+        kwds = dict([(key, val) for key, val in kwds.items() if key in names])
+    if not kwds:
+        return func
+    bound = BoundCall(func, **kwds)
+    bound.__doc__ = getattr(func, '__doc__', None)
+    return bound
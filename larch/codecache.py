@@ -0,0 +1,134 @@
+'''On-disk cache of converted and parsed larch modules
+
+Importing a .lar file means converting the Larch text to Python with
+InputText and parsing each block with ast.parse, which is repeated for
+every import in every session.  As with .pyc files for Python, the result
+is saved to a '.larc' file next to the source (or, if that directory is
+not writable, in a per-user cache directory), and re-used as long as the
+source file is unchanged.
+
+A .larc file holds a pickled header and a pickled list of
+(python_text, filename, lineno, ast_tree) for each block of the module.
+The header names the versions of larch and Python that wrote it, as the
+ASTs (and what the compiler makes of them) differ between versions, and
+a cache written by another version is converted again.
+'''
+from __future__ import print_function
+import os
+import sys
+import ast
+import hashlib
+import tempfile
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from . import site_config
+from .inputText import InputText
+
+CACHE_VERSION = 1
+CACHE_SUFFIX = 'c'
+MAGIC = 'LARC%i' % CACHE_VERSION
+
+def cache_magic():
+    "magic of the .larc files of this larch and Python (see module doc)"
+    from .interpreter import __version__
+    return (MAGIC, __version__, tuple(sys.version_info[:2]))
+
+def user_cache_dir():
+    "per-user directory for .larc files when a source directory is read-only"
+    return os.path.join(site_config.user_home, '.larch', 'cache')
+
+def cache_files(filename):
+    """list of candidate .larc files for a larch source file:
+    next to the source, then in the user cache directory"""
+    filename = os.path.abspath(filename)
+    tag = hashlib.md5(filename.encode('utf-8')).hexdigest()[:16]
+    basename = '%s_%s%s' % (tag, os.path.basename(filename), CACHE_SUFFIX)
+    return [filename + CACHE_SUFFIX,
+            os.path.join(user_cache_dir(), basename)]
+
+def source_key(filename):
+    """key identifying the current contents of a source file:
+    (size, mtime, md5 of text)"""
+    stat = os.stat(filename)
+    with open(filename, 'rb') as inf:
+        digest = hashlib.md5(inf.read()).hexdigest()
+    return (stat.st_size, stat.st_mtime, digest)
+
+def convert(filename):
+    """convert and parse a larch file, returning a list of
+    (python_text, filename, lineno, ast_tree), or None if the
+    file has a syntax error."""
+    inp = InputText(interactive=False, filename=filename)
+    blocks = []
+    try:
+        with open(filename) as inf:
+            for lineno, line in enumerate(inf):
+                inp.put(line, filename=filename, lineno=lineno)
+                while len(inp) > 0:
+                    text, fname, t_lineno = inp.get()
+                    blocks.append((text, fname, t_lineno, ast.parse(text)))
+    except SyntaxError:
+        return None
+    if inp.block or inp.keys or not inp.input_complete:
+        # unfinished block at end of file
+        return None
+    return blocks
+
+def load(filename):
+    """return list of cached blocks for a larch file,
+    or None if there is no up-to-date cache"""
+    key = magic = None
+    for cfile in cache_files(filename):
+        if not os.path.isfile(cfile):
+            continue
+        if key is None:
+            key = source_key(filename)
+        if magic is None:
+            magic = cache_magic()
+        try:
+            with open(cfile, 'rb') as inf:
+                header = pickle.load(inf)
+                if header != (magic, os.path.abspath(filename), key):
+                    continue
+                return pickle.load(inf)
+        except Exception:
+            continue
+    return None
+
+def save(filename, blocks):
+    """write blocks for a larch file to the first writable cache file.
+    Returns the name of the cache file, or None if none could be written."""
+    header = (cache_magic(), os.path.abspath(filename),
+              source_key(filename))
+    for cfile in cache_files(filename):
+        dirname, tmpname = os.path.dirname(cfile), None
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.larc')
+            with os.fdopen(fd, 'wb') as outf:
+                pickle.dump(header, outf, 2)
+                pickle.dump(blocks, outf, 2)
+            os.rename(tmpname, cfile)
+            return cfile
+        except (IOError, OSError, pickle.PicklingError):
+            if tmpname is not None and os.path.exists(tmpname):
+                os.unlink(tmpname)
+    return None
+
+def get_blocks(filename):
+    """blocks for a larch file, from the cache if possible, else converted
+    (and then saved to the cache).  Returns None on syntax errors."""
+    blocks = load(filename)
+    if blocks is None:
+        blocks = convert(filename)
+        if blocks is not None:
+            save(filename, blocks)
+    else:
+        # the cache may have been written for another path to the file
+        blocks = [(text, filename, lineno, tree)
+                  for text, fname, lineno, tree in blocks]
+    return blocks
@@ -0,0 +1,608 @@
+'''Compile Larch AST to trees of Python closures
+
+Interpreter.interp() finds a handler for every node it visits by name,
+which costs a string build, a dictionary lookup and a try/except per node
+every time a node is run.  The Compiler here walks a parsed tree once and
+returns a zero-argument callable for it, with the callables for all child
+nodes already bound in, so that loop bodies and Procedure bodies can be
+re-run without any per-node dispatch.
+
+The on_xxx() handlers of the Interpreter remain the reference semantics:
+each c_xxx() builder below mirrors the matching handler, and any node
+without a builder is run through its handler.
+
+Errors raised inside a compiled statement are reported by the nearest
+call to Interpreter.interp(), which is the enclosing top-level statement
+or Procedure statement, rather than by the innermost node.
+'''
+from __future__ import division, print_function
+import ast
+import sys
+import operator
+import weakref
+
+from .util import DefinedVariable, LAZY_ITERATORS
+
+OPERATORS = {ast.Is:     operator.is_,
+             ast.IsNot:  operator.is_not,
+             ast.In:     lambda a, b: a in b,
+             ast.NotIn:  lambda a, b: a not in b,
+             ast.Add:    operator.add,
+             ast.BitAnd: operator.and_,
+             ast.BitOr:  operator.or_,
+             ast.BitXor: operator.xor,
+             ast.Div:    operator.truediv,
+             ast.FloorDiv: operator.floordiv,
+             ast.LShift: operator.lshift,
+             ast.RShift: operator.rshift,
+             ast.Mult:   operator.mul,
+             ast.Pow:    operator.pow,
+             ast.Sub:    operator.sub,
+             ast.Mod:    operator.mod,
+             ast.Eq:     operator.eq,
+             ast.Gt:     operator.gt,
+             ast.GtE:    operator.ge,
+             ast.Lt:     operator.lt,
+             ast.LtE:    operator.le,
+             ast.NotEq:  operator.ne,
+             ast.Invert: operator.invert,
+             ast.Not:    operator.not_,
+             ast.UAdd:   operator.pos,
+             ast.USub:   operator.neg}
+
+# in-place operators for augmented assignment, which use __iadd__ and
+# the like where the target has them (as numpy arrays do)
+INPLACE_OPERATORS = {ast.Add:      operator.iadd,
+                     ast.BitAnd:   operator.iand,
+                     ast.BitOr:    operator.ior,
+                     ast.BitXor:   operator.ixor,
+                     ast.Div:      operator.itruediv,
+                     ast.FloorDiv: operator.ifloordiv,
+                     ast.LShift:   operator.ilshift,
+                     ast.RShift:   operator.irshift,
+                     ast.Mult:     operator.imul,
+                     ast.Pow:      operator.ipow,
+                     ast.Sub:      operator.isub,
+                     ast.Mod:      operator.imod}
+
+def _none():
+    "code for a missing (None) node"
+    return None
+
+def _listify(ret):
+    "as Interpreter.interp(), turn enumerate results into lists"
+    if isinstance(ret, enumerate):
+        return list(ret)
+    return ret
+
+class Compiler(object):
+    """compile AST nodes to closures for a larch Interpreter
+
+    compile(node) returns a callable taking no arguments that has the
+    same effect as larch.interp(node).  Compiled code is cached per node
+    (weakly, so that it goes away with the AST).
+    """
+    def __init__(self, larch):
+        self.larch = larch
+        self.codes = weakref.WeakKeyDictionary()
+
+    def compile(self, node):
+        "return (cached) compiled code for a node"
+        try:
+            return self.codes[node]
+        except KeyError:
+            code = self.codes[node] = self.build(node)
+            return code
+
+    def build(self, node):
+        "build code for a node and (recursively) all of its children"
+        if node is None:
+            return _none
+        builder = getattr(self, 'c_%s' % node.__class__.__name__.lower(),
+                          None)
+        if builder is not None:
+            code = builder(node)
+            if code is not None:
+                return code
+        return self.fallback(node)
+
+    def fallback(self, node):
+        "run a node through its Interpreter handler"
+        larch = self.larch
+        try:
+            handler = larch.node_handlers[node.__class__.__name__.lower()]
+        except KeyError:
+            return lambda: larch.unimplemented(node)
+        return lambda: handler(node)
+
+    def build_block(self, nodes):
+        "list of codes for a block of statements"
+        return [self.build(tnode) for tnode in nodes]
+
+    def build_iter(self, node):
+        """code for the sequence of a for loop or comprehension, giving
+        iterators for calls of range(), zip() and enumerate() (mirrors
+        Interpreter.iterate())"""
+        if not (isinstance(node, ast.Call) and
+                isinstance(node.func, ast.Name) and
+                node.func.id in LAZY_ITERATORS and not node.keywords and
+                node.starargs is None and node.kwargs is None):
+            return self.build(node)
+        larch = self.larch
+        ctx = larch._context
+        builtin, lazy, lazy_args = LAZY_ITERATORS[node.func.id]
+        func, call = self.build(node.func), self.build(node)
+        args = []
+        for i, arg in enumerate(node.args):
+            if lazy_args is None or i in lazy_args:
+                args.append(self.build_iter(arg))
+            else:
+                args.append(self.build(arg))
+        def code():
+            if func() is not builtin:
+                return call()
+            vals = [arg() for arg in args]
+            if ctx.error:
+                return ()
+            return lazy(*vals)
+        return code
+
+    def build_assign(self, node):
+        """code to assign a value to a target node (mirrors node_assign):
+        returns a function of one argument, the value"""
+        larch = self.larch
+        ctx = larch._context
+        if node.__class__ == ast.Name:
+            set_symbol = larch.symtable.set_symbol
+            name = node.id
+            def assign(val):
+                if ctx.error:
+                    return
+                set_symbol(name, value=val)
+        elif node.__class__ == ast.Attribute:
+            obj, attr = self.build(node.value), node.attr
+            load = node.ctx.__class__ == ast.Load
+            def assign(val):
+                if ctx.error:
+                    return
+                if load:
+                    larch.raise_exception(node,
+                                          "cannot assign to attribute %s" % attr)
+                setattr(obj(), attr, val)
+        elif node.__class__ == ast.Subscript:
+            obj, xslice = self.build(node.value), self.build(node.slice)
+            if isinstance(node.slice, ast.Index):
+                def assign(val):
+                    if ctx.error:
+                        return
+                    obj().__setitem__(xslice(), val)
+            elif isinstance(node.slice, ast.Slice):
+                def assign(val):
+                    if ctx.error:
+                        return
+                    sym, sval = obj(), xslice()
+                    sym.__setslice__(sval.start, sval.stop, val)
+            else:
+                def assign(val):
+                    if ctx.error:
+                        return
+                    sym, sval = obj(), xslice()
+                    if isinstance(node.slice, ast.ExtSlice):
+                        sym[(sval)] = val
+        elif node.__class__ in (ast.Tuple, ast.List):
+            assigners = [self.build_assign(telem) for telem in node.elts]
+            nelts = len(assigners)
+            def assign(val):
+                if ctx.error:
+                    return
+                if len(val) == nelts:
+                    for tassign, tval in zip(assigners, val):
+                        tassign(tval)
+                else:
+                    raise ValueError('too many values to unpack')
+        else:
+            def assign(val):
+                larch.node_assign(node, val)
+        return assign
+
+    # builders for ast components, matching Interpreter.on_xxx
+    def c_expr(self, node):
+        "expression"
+        return self.build(node.value)
+
+    c_index = c_expr
+
+    def c_return(self, node):
+        "return statement"
+        larch, value = self.larch, self.build(node.value)
+        ctx = larch._context
+        def code():
+            ctx.retval = value()
+        return code
+
+    def c_module(self, node):
+        "module def: each statement is interpreted on its own"
+        larch, body = self.larch, node.body
+        def code():
+            out = None
+            for tnode in body:
+                out = larch.interp(tnode)
+            return out
+        return code
+
+    def c_pass(self, node):
+        "pass statement"
+        return _none
+
+    def c_ellipsis(self, node):
+        "ellipses"
+        return lambda: Ellipsis
+
+    def c_break(self, node):
+        "break / continue"
+        larch = self.larch
+        ctx = larch._context
+        def code():
+            ctx._interrupt = node
+            return node
+        return code
+
+    c_continue = c_break
+
+    def c_num(self, node):
+        'return number'
+        val = node.n
+        return lambda: val
+
+    def c_str(self, node):
+        'return string'
+        val = node.s
+        return lambda: val
+
+    def c_list(self, node):
+        "list"
+        elts = self.build_block(node.elts)
+        return lambda: [elt() for elt in elts]
+
+    def c_tuple(self, node):
+        "tuple"
+        elts = self.build_block(node.elts)
+        return lambda: tuple([elt() for elt in elts])
+
+    def c_dict(self, node):
+        "dictionary"
+        items = [(self.build(k), self.build(v))
+                 for k, v in zip(node.keys, node.values)]
+        return lambda: dict([(k(), v()) for k, v in items])
+
+    def c_name(self, node):
+        "Name node"
+        if node.ctx.__class__ in (ast.Del, ast.Param):
+            return None
+        get_symbol, name = self.larch.symtable.get_symbol, node.id
+        def code():
+            val = get_symbol(name)
+            if isinstance(val, DefinedVariable):
+                val = val.evaluate()
+            return val
+        return code
+
+    def c_attribute(self, node):
+        "extract attribute"
+        if node.ctx.__class__ != ast.Load:
+            return None
+        larch, value, attr = self.larch, self.build(node.value), node.attr
+        def code():
+            sym = value()
+            if hasattr(sym, attr):
+                val = getattr(sym, attr)
+                if isinstance(val, DefinedVariable):
+                    val = val.evaluate()
+                return val
+            return larch.on_attribute(node)
+        return code
+
+    def c_assign(self, node):
+        "simple assignment"
+        larch, value = self.larch, self.build(node.value)
+        ctx = larch._context
+        targets = [self.build_assign(tnode) for tnode in node.targets]
+        if len(targets) == 1:
+            target = targets[0]
+            def code():
+                val = value()
+                if ctx.error:
+                    return
+                target(val)
+        else:
+            def code():
+                val = value()
+                if ctx.error:
+                    return
+                for target in targets:
+                    target(val)
+        return code
+
+    def c_augassign(self, node):
+        "augmented assign, in place (mirrors on_augassign)"
+        larch, op = self.larch, INPLACE_OPERATORS[node.op.__class__]
+        ctx = larch._context
+        target, value = node.target, self.build(node.value)
+        if target.__class__ == ast.Name:
+            current = self.build(target)
+            assign = self.build_assign(target)
+            def code():
+                val = op(current(), value())
+                if ctx.error:
+                    return
+                assign(val)
+        elif target.__class__ == ast.Attribute:
+            obj, attr = self.build(target.value), target.attr
+            def code():
+                sym = obj()
+                if ctx.error:
+                    return
+                if not hasattr(sym, attr):
+                    return larch.on_augassign(node)
+                cur = getattr(sym, attr)
+                if isinstance(cur, DefinedVariable):
+                    cur = cur.evaluate()
+                val = op(cur, value())
+                if ctx.error:
+                    return
+                setattr(sym, attr, val)
+        elif target.__class__ == ast.Subscript:
+            obj, xslice = self.build(target.value), self.build(target.slice)
+            def code():
+                sym, index = obj(), xslice()
+                if ctx.error:
+                    return
+                val = op(sym[index], value())
+                if ctx.error:
+                    return
+                sym[index] = val
+        else:
+            return None
+        return code
+
+    def c_slice(self, node):
+        "simple slice"
+        lower, upper = self.build(node.lower), self.build(node.upper)
+        step = self.build(node.step)
+        return lambda: slice(lower(), upper(), step())
+
+    def c_extslice(self, node):
+        "extended slice"
+        dims = self.build_block(node.dims)
+        return lambda: tuple([dim() for dim in dims])
+
+    def c_subscript(self, node):
+        "subscript handling"
+        if node.ctx.__class__ not in (ast.Load, ast.Store):
+            return None
+        value, nslice = self.build(node.value), self.build(node.slice)
+        if isinstance(node.slice, (ast.Index, ast.Slice, ast.Ellipsis)):
+            return lambda: value().__getitem__(nslice())
+        elif isinstance(node.slice, ast.ExtSlice):
+            return lambda: value()[(nslice())]
+        return None
+
+    def c_unaryop(self, node):
+        "unary operator"
+        op, operand = OPERATORS[node.op.__class__], self.build(node.operand)
+        return lambda: op(operand())
+
+    def c_binop(self, node):
+        "binary operator"
+        op = OPERATORS[node.op.__class__]
+        left, right = self.build(node.left), self.build(node.right)
+        return lambda: op(left(), right())
+
+    def c_boolop(self, node):
+        "boolean operator"
+        first, rest = self.build(node.values[0]), self.build_block(node.values[1:])
+        if node.op.__class__ == ast.Or:
+            def code():
+                val = first()
+                if not val:
+                    for tval in rest:
+                        val = val or tval()
+                        if val:
+                            break
+                return val
+        else:
+            def code():
+                val = first()
+                if val:
+                    for tval in rest:
+                        val = val and tval()
+                        if not val:
+                            break
+                return val
+        return code
+
+    def c_compare(self, node):
+        "comparison operators"
+        left = self.build(node.left)
+        comps = [(OPERATORS[oper.__class__], self.build(rnode))
+                 for oper, rnode in zip(node.ops, node.comparators)]
+        if len(comps) == 1:
+            (comp, right), = comps
+            return lambda: comp(left(), right())
+        def code():
+            lval = left()
+            out  = True
+            for comp, right in comps:
+                rval = right()
+                out  = out and comp(lval, rval)
+                lval = rval
+                if not out:
+                    break
+            return out
+        return code
+
+    def c_print(self, node):
+        "print statement"
+        larch, dest = self.larch, self.build(node.dest)
+        ctx = larch._context
+        values, end = self.build_block(node.values), ''
+        if node.nl:
+            end = '\n'
+        def code():
+            fout = dest() or larch.writer
+            out = [tval() for tval in values]
+            if out and not ctx.error:
+                print(*out, file=fout, end=end)
+        return code
+
+    def c_if(self, node):
+        "regular if-then-else statement"
+        test = self.build(node.test)
+        body, orelse = self.build_block(node.body), self.build_block(node.orelse)
+        def code():
+            block = orelse
+            if test():
+                block = body
+            for tcode in block:
+                tcode()
+        return code
+
+    def c_ifexp(self, node):
+        "if expressions"
+        test = self.build(node.test)
+        body, orelse = self.build(node.body), self.build(node.orelse)
+        return lambda: body() if test() else orelse()
+
+    def c_while(self, node):
+        "while blocks"
+        larch, test = self.larch, self.build(node.test)
+        ctx = larch._context
+        body, orelse = self.build_block(node.body), self.build_block(node.orelse)
+        def code():
+            while test():
+                ctx._interrupt = None
+                for tcode in body:
+                    tcode()
+                    if ctx._interrupt is not None:
+                        break
+                if isinstance(ctx._interrupt, ast.Break):
+                    break
+            else:
+                for tcode in orelse:
+                    tcode()
+            ctx._interrupt = None
+        return code
+
+    def c_for(self, node):
+        "for blocks"
+        larch, iterable = self.larch, self.build_iter(node.iter)
+        ctx = larch._context
+        target = self.build_assign(node.target)
+        body, orelse = self.build_block(node.body), self.build_block(node.orelse)
+        def code():
+            for val in iterable():
+                target(val)
+                if ctx.error:
+                    return
+                ctx._interrupt = None
+                for tcode in body:
+                    tcode()
+                    if ctx.error:
+                        return
+                    if ctx._interrupt is not None:
+                        break
+                if isinstance(ctx._interrupt, ast.Break):
+                    break
+            else:
+                for tcode in orelse:
+                    tcode()
+            ctx._interrupt = None
+        return code
+
+    def c_folded(self, node):
+        "constant expression, valid while the names it uses are unchanged"
+        symtable, value = self.larch.symtable, node.value
+        original = self.build(node.original)
+        def code():
+            if node.check(symtable):
+                return value
+            return original()
+        return code
+
+    def c_fused(self, node):
+        "elementwise expression run in blocks, or else as written"
+        larch, original = self.larch, self.build(node.original)
+        def code():
+            return node.evaluate(larch, original, nthreads=larch.fuse_threads)
+        return code
+
+    def c_vectorfor(self, node):
+        "for loop run as array operations, or else as a for loop"
+        larch, loop = self.larch, self.build(node.loop)
+        def code():
+            if not node.run(larch):
+                larch.symtable._sys.vectorize.fallbacks += 1
+                loop()
+        return code
+
+    def c_listcomp(self, node):
+        "list comprehension (single generator only)"
+        if len(node.generators) != 1:
+            return None
+        larch, gen = self.larch, node.generators[0]
+        ctx = larch._context
+        iterable = self.build_iter(gen.iter)
+        target = self.build_assign(gen.target)
+        ifs, elt = self.build_block(gen.ifs), self.build(node.elt)
+        def code():
+            out = []
+            for val in iterable():
+                target(val)
+                if ctx.error:
+                    return
+                add = True
+                for cond in ifs:
+                    add = add and cond()
+                if add:
+                    out.append(elt())
+            return out
+        return code
+
+    def c_call(self, node):
+        "function/procedure execution"
+        larch, func = self.larch, self.build(node.func)
+        args = self.build_block(node.args)
+        if (node.starargs is not None or node.kwargs is not None or
+            [key for key in node.keywords if not isinstance(key, ast.keyword)]):
+            return None
+        keywords = [(key.arg, self.build(key.value)) for key in node.keywords]
+
+        def check(fcn):
+            if not hasattr(fcn, '__call__'):
+                msg = "'%s' is not callable!!" % (fcn)
+                larch.raise_exception(node, msg=msg, py_exc=sys.exc_info())
+            return fcn
+
+        if keywords:
+            def code():
+                fcn = check(func())
+                return _listify(fcn(*[arg() for arg in args],
+                                    **dict([(key, val()) for key, val in keywords])))
+        elif len(args) == 0:
+            def code():
+                return _listify(check(func())())
+        elif len(args) == 1:
+            arg0, = args
+            def code():
+                fcn = check(func())
+                return _listify(fcn(arg0()))
+        elif len(args) == 2:
+            arg0, arg1 = args
+            def code():
+                fcn = check(func())
+                return _listify(fcn(arg0(), arg1()))
+        else:
+            def code():
+                fcn = check(func())
+                return _listify(fcn(*[arg() for arg in args]))
+        return code
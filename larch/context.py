@@ -0,0 +1,35 @@
+'''Execution state kept separately for each thread
+
+An Interpreter keeps the state of the code it is running (the errors
+found so far, the pending return value and break or continue, and the
+current expression, file and line), and its SymbolTable keeps the frame
+of the running procedure (the local and module groups and the stack of
+saved frames).  If that state were shared, two threads evaluating Larch
+code at once would see and change each other's errors and frames.
+
+ContextAttr(name) makes an attribute of an object a view of the same
+attribute of its ContextState, a threading.local held as the object's
+_context.  Each thread that uses the object first sees the values given
+by the defaults() function of the ContextState, and then its own values.
+Code can still use larch.error or symtable._sys.localGroup as before.
+'''
+import threading
+from operator import attrgetter
+
+class ContextState(threading.local):
+    """per-thread values of the context attributes of an object,
+    starting from the dict given by defaults()"""
+    def __init__(self, defaults):
+        self.__dict__.update(defaults())
+
+def ContextAttr(name):
+    """property for an attribute whose value is kept in the ContextState
+    of the instance (its _context attribute), separately for each
+    thread.  Reading it is the most frequent use, and needs no call of
+    a Python function."""
+    def fset(obj, val):
+        setattr(obj._context, name, val)
+    def fdel(obj):
+        delattr(obj._context, name)
+    return property(attrgetter('_context.' + name), fset, fdel,
+                    "'%s', kept for each thread" % name)
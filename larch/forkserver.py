@@ -0,0 +1,310 @@
+'''Fork server for running many short larch scripts
+
+Running a script with 'larch -e script.lar' imports numpy and larch,
+makes an Interpreter and runs startup.lar and the rc files before the
+script itself.  A fork server does this once:  serve(address) makes an
+Interpreter, loads the _builtin and _math groups and imports the
+modules asked for, then listens on a Unix socket at address.  Each job
+submitted is run in a process forked from the server, starting from the
+state left by this startup (and not from that of other jobs), so that a
+job costs little more than a fork.
+
+submit(address, scripts) runs a job:  larch scripts (and .py modules,
+imported by name as with bin/larch) are run in order in the directory
+of the caller, their stdout and stderr are written to those of the
+caller as they come, and the exit status of the job is returned:  0, 1
+if any script failed with a larch error, the status given to exit(), or
+128 + the signal number if the job was killed.
+
+From the shell:
+
+    larch --server /tmp/larch.sock &
+    larch_submit /tmp/larch.sock script1.lar script2.lar
+
+The stdin of a job is /dev/null, and its environment that of the
+server.  This module imports larch only to run the server, so that the
+client (bin/larch_submit) starts without numpy.
+
+The protocol is a sequence of frames, each a kind (one byte), the
+length of the data (4 bytes, network order) and the data:  the client
+sends a REQUEST (JSON of {'cwd': dirname, 'scripts': [fnames]}), and the
+server sends STDOUT and STDERR frames as the job writes, then a single
+STATUS frame (the exit status, as text).
+'''
+from __future__ import print_function
+import os
+import sys
+import json
+import errno
+import struct
+import select
+import signal
+import socket
+
+REQUEST, STDOUT, STDERR, STATUS = b'R', b'O', b'E', b'X'
+HEADER = struct.Struct('!cI')
+BUFSIZE = 65536
+
+# seconds between checks for finished jobs while no job is submitted
+POLL_SECONDS = 1.0
+
+def send_frame(sock, kind, data):
+    "send a frame of a kind"
+    sock.sendall(HEADER.pack(kind, len(data)) + data)
+
+def recv_exactly(sock, nbytes):
+    "nbytes from a socket, or None at end of file before any"
+    chunks = []
+    while nbytes > 0:
+        chunk = sock.recv(min(nbytes, BUFSIZE))
+        if not chunk:
+            if chunks:
+                raise IOError('connection closed within a frame')
+            return None
+        chunks.append(chunk)
+        nbytes -= len(chunk)
+    return b''.join(chunks)
+
+def recv_frame(sock):
+    "(kind, data) of the next frame, or (None, None) at end of file"
+    header = recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None, None
+    kind, nbytes = HEADER.unpack(header)
+    data = b''
+    if nbytes > 0:
+        data = recv_exactly(sock, nbytes)
+        if data is None:
+            raise IOError('connection closed within a frame')
+    return kind, data
+
+def submit(address, scripts, cwd=None, stdout=None, stderr=None):
+    """run scripts as a job of the fork server at address, writing its
+    output to stdout and stderr (default those of sys) and returning its
+    exit status"""
+    stdout = stdout or sys.stdout
+    stderr = stderr or sys.stderr
+    request = dict(cwd=os.path.abspath(cwd or os.getcwd()),
+                   scripts=list(scripts))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+        send_frame(sock, REQUEST, json.dumps(request).encode('utf-8'))
+        while True:
+            kind, data = recv_frame(sock)
+            if kind == STDOUT:
+                stdout.write(data.decode('utf-8', 'replace'))
+                stdout.flush()
+            elif kind == STDERR:
+                stderr.write(data.decode('utf-8', 'replace'))
+                stderr.flush()
+            elif kind == STATUS:
+                return int(data)
+            else:
+                raise IOError('fork server closed the connection')
+    finally:
+        sock.close()
+
+def exit_status(status):
+    "exit status of a process, from a status of os.waitpid()"
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+def run_scripts(larch, scripts):
+    """run scripts as bin/larch does, returning the exit status.  A
+    script calling sys.exit() ends the job with its status."""
+    status = 0
+    for fname in scripts:
+        larch.error = []
+        if fname.endswith('.py'):
+            larch('import %s' % fname[:-3])
+        else:
+            larch.eval_file(fname)
+        if larch.error:
+            exc = larch.error[-1].exc_info[1]
+            if isinstance(exc, SystemExit):
+                raise exc
+            if fname.endswith('.py'):
+                print('%s: %s' % larch.error[-1].get_error())
+            status = 1
+    return status
+
+class ForkServer(object):
+    """a fork server (see module doc), listening at address once
+    start() has made its Interpreter and imported the modules preload.
+    jobs counts the jobs submitted."""
+    def __init__(self, address, preload=()):
+        self.address = os.path.abspath(address)
+        self.preload = preload
+        self.larch = None
+        self.sock = None
+        self.jobs = 0
+
+    def start(self):
+        "make and warm up the Interpreter, then listen"
+        import larch
+        self.larch = larch.Interpreter()
+        symtable = self.larch.symtable
+        symtable._builtin._load_all()
+        symtable._math._load_all()
+        for name in self.preload:
+            self.larch('import %s' % name)
+            if self.larch.error:
+                raise ImportError(self.larch.error[-1].get_error()[1])
+        self.remove_stale()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.address)
+        self.sock.listen(socket.SOMAXCONN)
+
+    def remove_stale(self):
+        """remove the socket of a server that has gone, or raise
+        IOError if a server is listening at the address"""
+        if not os.path.exists(self.address):
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.address)
+        except socket.error:
+            os.unlink(self.address)
+        else:
+            raise IOError("a server is listening at '%s'" % self.address)
+        finally:
+            sock.close()
+
+    def serve_forever(self):
+        "run jobs until interrupted or terminated, then close the socket"
+        previous = signal.signal(signal.SIGTERM, terminate)
+        try:
+            while True:
+                self.reap()
+                try:
+                    ready = select.select([self.sock], [], [],
+                                          POLL_SECONDS)[0]
+                except select.error as err:
+                    if err.args[0] == errno.EINTR:
+                        continue
+                    raise
+                if ready:
+                    conn = self.sock.accept()[0]
+                    self.fork_job(conn)
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+            self.close()
+
+    def close(self):
+        "stop listening, removing the socket"
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+
+    def reap(self):
+        "wait for the jobs that have finished"
+        while True:
+            try:
+                pid = os.waitpid(-1, os.WNOHANG)[0]
+            except OSError:
+                return
+            if pid == 0:
+                return
+
+    def fork_job(self, conn):
+        "run a job for a connection in a new process"
+        self.jobs += 1
+        pid = os.fork()
+        if pid != 0:
+            conn.close()
+            return
+        status = 1
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            self.sock.close()
+            status = self.job(conn)
+        except:
+            import traceback
+            traceback.print_exc()
+        finally:
+            os._exit(status)
+
+    def job(self, conn):
+        """read a request from a connection, run it in a new process and
+        forward its output and exit status (in the process of the job)"""
+        kind, data = recv_frame(conn)
+        if kind != REQUEST:
+            return 1
+        request = json.loads(data.decode('utf-8'))
+        outr, outw = os.pipe()
+        errr, errw = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            os.close(outr)
+            os.close(errr)
+            self.run_worker(request, outw, errw)
+        os.close(outw)
+        os.close(errw)
+        kinds = {outr: STDOUT, errr: STDERR}
+        try:
+            while kinds:
+                for fd in select.select(list(kinds), [], [])[0]:
+                    data = os.read(fd, BUFSIZE)
+                    if data:
+                        send_frame(conn, kinds[fd], data)
+                    else:
+                        os.close(fd)
+                        del kinds[fd]
+        except socket.error:
+            # the client has gone
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+            return 1
+        status = exit_status(os.waitpid(pid, 0)[1])
+        send_frame(conn, STATUS, str(status).encode('ascii'))
+        conn.close()
+        return 0
+
+    def run_worker(self, request, outw, errw):
+        "run the scripts of a request, writing to outw and errw, and exit"
+        status = 1
+        try:
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            os.dup2(outw, 1)
+            os.dup2(errw, 2)
+            for fd in (devnull, outw, errw):
+                os.close(fd)
+            os.chdir(request['cwd'])
+            status = run_scripts(self.larch, request['scripts'])
+        except SystemExit as exc:
+            status = exc.code
+            if status is None:
+                status = 0
+            elif not isinstance(status, int):
+                print(status, file=sys.stderr)
+                status = 1
+        except:
+            import traceback
+            traceback.print_exc()
+        finally:
+            for out in (sys.stdout, sys.stderr):
+                try:
+                    out.flush()
+                except:
+                    pass
+            os._exit(status)
+
+def terminate(signum, frame):
+    "SIGTERM handler of a server:  exit, closing the socket"
+    raise SystemExit(0)
+
+def serve(address, preload=()):
+    """run a fork server at address (see module doc) until interrupted
+    or terminated"""
+    server = ForkServer(address, preload=preload)
+    server.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
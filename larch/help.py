@@ -1,7 +1,14 @@
 main = """This is Larch main help"""
 
-import helpTopics
-Help_topics = helpTopics.generate()
+_topics = None
+
+def help_topics():
+    """dictionary of help topics, made from helpTopics when first used"""
+    global _topics
+    if _topics is None:
+        import helpTopics
+        _topics = helpTopics.generate()
+    return _topics
 
 class Helper(object):
     """Helper looks up an displays help topics
@@ -20,8 +27,9 @@ class Helper(object):
 
         for arg in args:
             if arg is None: continue
-            if isinstance(arg,(str,unicode)) and arg in Help_topics:
-                self.addtext(Help_topics[arg])
+            topics = help_topics()
+            if isinstance(arg,(str,unicode)) and arg in topics:
+                self.addtext(topics[arg])
             else:
                 self.show_symbol(arg)
 
@@ -4,6 +4,12 @@ from __future__ import division, print_function, with_statement
 import os
 import sys
 import ast
+import imp
+import copy
+import time
+import weakref
+import threading
+from collections import OrderedDict
 from itertools import izip_longest, chain
 try:
     import numpy
@@ -13,9 +19,17 @@ except ImportError:
 
 from . import inputText
 from . import builtins
+from . import codecache
+from . import optimize
 from .symboltable import SymbolTable, Group, isgroup
-from .util import LarchExceptionHolder, Procedure, DefinedVariable
-from .closure import Closure
+from .util import (LarchExceptionHolder, Procedure, DefinedVariable,
+                   LAZY_ITERATORS)
+from .closure import Closure, bind_call
+from .compiler import Compiler, INPLACE_OPERATORS
+from .profiler import Profiler
+from .reactive import ReactiveGraph
+from .modulepath import ModuleIndex
+from .context import ContextState, ContextAttr
 from .inputText import InputText
 
 __version__ = '0.9.3'
@@ -60,7 +74,8 @@ if sys.version_info[0] == 2:
 
 # TODO test
 def find_larchrcs():
-    '''finds the user larchrc files. Tries in this order:
+    '''finds the user larchrc file, returning a list of the first
+    found of these (or an empty list):
     1. $LARCHRC
     2. $HOME/.larchrc
     3. $USERPROF/_larchrc (Windows)
@@ -69,7 +84,7 @@ def find_larchrcs():
     larchrc = os.getenv('LARCHRC')
     if larchrc is not None:
         if os.path.isfile(larchrc):
-            return larchrc 
+            return [larchrc]
 
     # try UNIX and then Windows styles
     for var, prefix in [('HOME', '.'), ('USERPROF', '_')]:
@@ -77,8 +92,8 @@ def find_larchrcs():
         if homedir is not None:
             larchrc = os.path.join(homedir, prefix + 'larchrc')
             if os.path.isfile(larchrc):
-                return larchrc 
-    return None
+                return [larchrc]
+    return []
 
 def search_dirs(filename, dirs, only_first=True):
     '''search_dirs(filename, dirs[, only_first=True]) -> list or string
@@ -99,8 +114,33 @@ def search_dirs(filename, dirs, only_first=True):
             return None
     else: return rv
 
+def yield_statements(body):
+    """set of the statements of a procedure body that contain a yield,
+    not counting those of procedures defined inside it.  If there are
+    any, this includes the statements containing a return (outside of
+    try blocks), as a generator stops there even without a value."""
+    out = set()
+    def visit(node, kinds):
+        if isinstance(node, (ast.FunctionDef, ast.Lambda)):
+            return False
+        if (ast.Return in kinds and node not in out and
+            isinstance(node, (ast.TryExcept, ast.TryFinally))):
+            return False
+        found = isinstance(node, kinds)
+        for child in ast.iter_child_nodes(node):
+            found = visit(child, kinds) or found
+        if found and isinstance(node, ast.stmt):
+            out.add(node)
+        return found
+    for node in body:
+        visit(node, (ast.Yield,))
+    if out:
+        for node in body:
+            visit(node, (ast.Yield, ast.Return))
+    return out
+
 #------------------------------------------------------------------------------
-class Interpreter:
+class Interpreter(object):
     """larch program compiler and interpreter.
   This module compiles expressions and statements to AST representation,
   using python's ast module, and then executes the AST representation
@@ -110,60 +150,171 @@ class Interpreter:
   but that may have been translated as with the inputText module.
 
   The following Python syntax is not supported:
-      Exec, Lambda, Class, Global, Generators, Yield, Decorators
+      Exec, Lambda, Class, Global, Decorators
         
   In addition, Function is greatly altered so as to allow a Larch procedure.
+
+  For loops and comprehensions iterate lazily:  range(), zip() and
+  enumerate() given as the sequence to loop over are run as xrange(),
+  izip() and enumerate() (see iterate()), so that no list is built.
+  Generator expressions are evaluated as they are iterated over, in
+  the frame where they were made.  A procedure with a yield statement
+  is a generator:  calling it returns a Python generator that runs the
+  body up to each yield in turn (see generate()).  yield is supported
+  as a statement of its own, inside if, for and while blocks, but not
+  within an expression or a try block, and values cannot be sent.
+
+  With use_compiler=True, nodes are compiled once to Python closures (see
+  the compiler module) and re-run without per-node dispatch.  The on_xxx
+  handlers here remain the reference semantics for both modes.
+
+  With vectorize=True, elementwise loops over array indices are run as
+  numpy array operations (see the optimize module).  The loops found are
+  listed in _sys.vectorize.loops.  With fold_constants=True, constant
+  expressions are evaluated once, when parsed.  With fuse=True,
+  elementwise expressions over large arrays are evaluated in blocks,
+  without whole-array temporaries, using fuse_threads threads;  the
+  runs in blocks, and the tries that were not (fallbacks), are counted
+  in _sys.fuse.
+
+  add_hook(event, func) registers a function to be called as Larch
+  code runs, for tools such as the profiler and the larchcov coverage
+  collector.  Every hook is called as func(node, fname, lineno, arg),
+  where fname and lineno give the line of the statement being run:
+
+      'statement'   before a statement, with arg None
+      'statement_done'  after a statement (even if it failed), with arg
+                    the value returned by interp()
+      'call'        when a Procedure is called:  node is the Procedure,
+                    fname and lineno where it is defined, arg None
+      'return'      when a Procedure returns, with arg its return value
+      'exception'   when an error is added by raise_exception(), with
+                    arg the LarchExceptionHolder
+      'value'       after each expression, with arg its value
+
+  While no hook is registered, nothing is checked or called.  With
+  use_compiler=True, statements in compiled blocks (loop and if bodies)
+  run without the statement hooks, as do all expressions.
+
+  profile_on() and profile_off() switch on and off timing of Larch
+  statements and procedures (see the profiler module).
+
+  The state of the code being run (error, retval, _interrupt, expr,
+  fname and lineno) is kept separately for each thread, as is the frame
+  of the symbol table (see the context module and SymbolTable), so that
+  a pool of threads can evaluate code with one Interpreter at the same
+  time.  Hooks, the profiler and use_compiler=True are not thread-safe.
+
+  reactive is a ReactiveGraph of expressions evaluated again when the
+  symbols they read change (see the reactive module).  Nodes made dirty
+  by a statement run by eval() or push() are recomputed once it is done.
   """
 
     supported_nodes = ('assert', 'assign', 'attribute', 'augassign', 'binop',
                        'boolop', 'break', 'call', 'compare', 'continue',
                        'delete', 'dict', 'ellipsis', 'excepthandler', 'expr',
-                       'expression', 'extslice', 'for', 'functiondef', 'if',
+                       'expression', 'extslice', 'folded', 'for', 'fused',
+                       'functiondef', 'generatorexp', 'if',
                        'ifexp', 'import', 'importfrom', 'index', 'interrupt',
                        'list', 'listcomp', 'module', 'name', 'num', 'pass',
                        'print', 'raise', 'repr', 'return', 'slice', 'str',
-                       'subscript', 'tryexcept', 'tuple', 'unaryop', 'while')
+                       'subscript', 'tryexcept', 'tuple', 'unaryop',
+                       'vectorfor', 'while')
+
+    # number of parsed ASTs kept by compile(), keyed by (text, fname)
+    parse_cache_size = 256
+
+    hook_events = ('statement', 'statement_done', 'call', 'return',
+                   'exception', 'value')
+
+    # state of the code being run, kept for each thread
+    error      = ContextAttr('error')
+    retval     = ContextAttr('retval')
+    _interrupt = ContextAttr('_interrupt')
+    expr       = ContextAttr('expr')
+    fname      = ContextAttr('fname')
+    lineno     = ContextAttr('lineno')
+
+    @staticmethod
+    def _context_defaults():
+        "state of the code being run, for a new thread"
+        return dict(error=[], retval=None, _interrupt=None, expr=None,
+                    fname='<StdInput>', lineno=-5)
 
     def __init__(self, symtable=None, writer=None, **kwargs):
+        self._started = time.time()
         self.writer = writer or sys.stdout
+        self._context = ContextState(self._context_defaults)
+        self._lock = threading.Lock()
        
         if symtable is None:
             symtable = SymbolTable(larch=self)
         self.symtable   = symtable
-        self._interrupt = None
-        self.error      = [] 
-        self.expr       = None
-        self.retval     = None
-        self.fname     = '<StdInput>'
-        self.lineno    = -5
+        symtable._sys.startup = []
+        self.startup_phase('symtable')
+        self.hooks     = dict([(event, ()) for event in self.hook_events])
+        self.tracing   = False
+        self.profile_data = None
         builtingroup = getattr(symtable,'_builtin')
         mathgroup    = getattr(symtable,'_math')
 
-        options = dict(interactive=False)
+        options = dict(interactive=False, use_compiler=False,
+                       use_codecache=True, vectorize=False,
+                       fold_constants=False, fuse=False, fuse_threads=1)
         options.update(kwargs)
         self.input = InputText(interactive=options['interactive'])
-
-        for sym in builtins.from_builtin:
-            setattr(builtingroup, sym, __builtins__[sym])
-
+        self.use_compiler = options['use_compiler']
+        self.use_codecache = options['use_codecache']
+        self.vectorize = options['vectorize']
+        self.fold_constants = options['fold_constants']
+        self.fuse = options['fuse']
+        self.fuse_threads = options['fuse_threads']
+        self.compiler = Compiler(self)
+        self.parse_cache = OrderedDict()
+        self.optimized = weakref.WeakKeyDictionary()
+        symtable._sys.parse_cache = Group(name='parse_cache',
+                                          hits=0, misses=0)
+        symtable._sys.vectorize = Group(name='vectorize',
+                                        loops=[], fallbacks=0)
+        symtable._sys.fuse = Group(name='fuse', runs=0, fallbacks=0)
+        symtable._sys.definedvars = Group(name='definedvars',
+                                          hits=0, misses=0)
+        self.reactive = ReactiveGraph(self)
+        self.module_index = ModuleIndex()
+        self.python_index = ModuleIndex()
+
+        # the members of _builtin and _math are made when first used
+        builtingroup._defer(builtins.from_builtin, __builtins__.get)
         if HAS_NUMPY:
-            for sym in builtins.from_numpy:
-                setattr(mathgroup, sym, getattr(numpy, sym))
-            
-                for fname, sym in list(builtins.numpy_renames.items()):
-                    setattr(mathgroup, fname, getattr(numpy, sym))
-
-        for fname, fcn in list(builtins.local_funcs.items()):
-            setattr(builtingroup, fname,
-                    Closure(func=fcn, larch=self))
+            mathgroup._defer(builtins.from_numpy,
+                             lambda sym: getattr(numpy, sym))
+            renames = builtins.numpy_renames
+            mathgroup._defer(renames,
+                             lambda fname: getattr(numpy, renames[fname]))
+
+        # local_funcs are wrapped in LarchCheck, which is not needed
+        # once larch is bound
+        local_funcs = builtins.local_funcs
+        builtingroup._defer(local_funcs, lambda fname:
+                            bind_call(local_funcs[fname].func, larch=self))
         setattr(builtingroup, 'definevar',
                 Closure(func=self.set_definedvariable))
-        
+
         self.node_handlers = {}
         for tnode in self.supported_nodes:
             self.node_handlers[tnode] = getattr(self, "on_%s" % tnode)
-        
+        self.startup_phase('builtins')
+
         self.read_rcfile()
+        self.startup_phase('rcfiles')
+
+    def startup_phase(self, name):
+        """add the time since the last phase of __init__ to the list of
+        (phase, seconds) in _sys.startup, as shown by larch
+        --startup-profile"""
+        now = time.time()
+        self.symtable._sys.startup.append((name, now - self._started))
+        self._started = now
 
     def read_rcfile(self, *args):
         '''sources an rcfile written in larch
@@ -191,6 +342,25 @@ class Interpreter:
 
         return rv # True if file was syntactically correct
 
+    def eval_cached(self, filename):
+        '''sources larch file as eval_file(), but using the converted and
+        parsed blocks from its .larc cache (see codecache), which is
+        written if missing or out of date.'''
+
+        blocks = None
+        if self.use_codecache:
+            blocks = codecache.get_blocks(filename)
+        if blocks is None:
+            return self.eval_file(filename)
+
+        for text, fname, lineno, tree in blocks:
+            tree = self.optimize(tree, fname=fname, lineno=lineno)
+            self.interp(tree, expr=text, fname=fname, lineno=lineno)
+            if self.error != []:
+                print(self.error[-1].get_error())
+                return False
+        return True
+
     def push(self, line):
         '''accumulates source until it has something syntactically valid, then
         executes that and clears the buffer.
@@ -211,7 +381,9 @@ class Interpreter:
             block, filename, lineno = self.input.get()
             if block is None:
                 raise IndexError
-            parsed_code = ast.parse(block)
+            parsed_code = self.parse(block, fname=filename)
+            parsed_code = self.optimize(parsed_code, fname=filename,
+                                        lineno=lineno)
         except IndexError:
             return False
         except SyntaxError, e:
@@ -219,13 +391,87 @@ class Interpreter:
                 return False
             else: raise e
 
-        self.interp(parsed_code)
+        self.interp(parsed_code, fname=filename, lineno=lineno)
+        if self.reactive.dirty:
+            self.reactive.flush()
         return self.error == []
 
-    def set_definedvariable(self, name, expr):
-        """define a defined variable (re-evaluate on access)"""
+    def set_definedvariable(self, name, expr, cache=True):
+        """define a defined variable (re-evaluate on access, or with
+        cache=True when a symbol it reads has changed)"""
         self.symtable.set_symbol(name,
-                                 DefinedVariable(expr=expr, larch=self))
+                                 DefinedVariable(expr=expr, larch=self,
+                                                 cache=cache))
+
+    def add_hook(self, event, func):
+        """call func(node, fname, lineno, arg) on event, one of
+        hook_events (see class doc)"""
+        if event not in self.hooks:
+            raise ValueError("unknown hook event '%s'" % event)
+        self.hooks[event] = self.hooks[event] + (func,)
+        self._set_tracing()
+
+    def remove_hook(self, event, func):
+        "remove a function added with add_hook()"
+        hooks = list(self.hooks[event])
+        if func in hooks:
+            hooks.remove(func)
+            self.hooks[event] = tuple(hooks)
+        self._set_tracing()
+
+    def _set_tracing(self):
+        "use _traced_interp() in place of interp() while there are hooks"
+        self.tracing = any(self.hooks.values())
+        if self.tracing:
+            self.interp = self._traced_interp
+        else:
+            self.__dict__.pop('interp', None)
+
+    def run_hooks(self, event, node, fname, lineno, arg=None):
+        "call the hooks for event"
+        for hook in self.hooks[event]:
+            hook(node, fname, lineno, arg)
+
+    def _traced_interp(self, node, expr=None, fname=None, lineno=None):
+        "interp(), running the hooks added with add_hook()"
+        ctx = self._context
+        hooks = self.hooks
+        if not isinstance(node, ast.stmt):
+            ret = Interpreter.interp(self, node, expr=expr,
+                                     fname=fname, lineno=lineno)
+            for hook in hooks['value']:
+                hook(node, ctx.fname, ctx.lineno, ret)
+            return ret
+
+        tfname, tlineno = fname, lineno
+        if tfname is None:
+            tfname = ctx.fname
+        if tlineno is None:
+            tlineno = ctx.lineno
+        tlineno = tlineno + getattr(node, 'lineno', 0)
+        for hook in hooks['statement']:
+            hook(node, tfname, tlineno, None)
+        ret = None
+        try:
+            ret = Interpreter.interp(self, node, expr=expr,
+                                     fname=fname, lineno=lineno)
+            return ret
+        finally:
+            for hook in hooks['statement_done']:
+                hook(node, tfname, tlineno, ret)
+
+    def profile_on(self, clear=False):
+        """start timing statements and procedures, adding to the
+        timings so far unless clear is True"""
+        if self.profile_data is None or clear:
+            self.profile_off()
+            self.profile_data = Profiler(self)
+        self.profile_data.start()
+
+    def profile_off(self):
+        "stop timing statements and procedures"
+        if self.profile_data is not None:
+            self.profile_data.stop()
 
     def unimplemented(self, node):
         "unimplemented nodes"
@@ -259,6 +505,8 @@ class Interpreter:
         self._interrupt = ast.Break()
         self.error.append(err)
         self.symtable._sys.last_error = err
+        if self.tracing:
+            self.run_hooks('exception', node, fname, lineno, err)
 
         # print("_Raise ", self.error)
         
@@ -266,11 +514,63 @@ class Interpreter:
     #  compile:  string statement -> ast
     #  interp :  ast -> result
     #  eval   :  string statement -> result = interp(compile(statement))
+    def parse(self, text, fname=None):
+        """parse text to Ast representation, using a bounded LRU cache
+        of parsed trees keyed by (text, fname).
+
+        The same tree is handed out for every hit, so nothing may modify
+        an AST in place once parsed:  handlers build new lists instead.
+        Raises SyntaxError for invalid text (which is not cached).
+        """
+        key = (text, fname)
+        stats = self.symtable._sys.parse_cache
+        cache = self.parse_cache
+        with self._lock:
+            tree = cache.pop(key, None)
+            if tree is not None:
+                stats.hits += 1
+                cache[key] = tree
+                return tree
+        tree = ast.parse(text)
+        with self._lock:
+            stats.misses += 1
+            while len(cache) >= max(1, self.parse_cache_size):
+                cache.popitem(last=False)
+            cache[key] = tree
+        return tree
+
+    def optimize(self, tree, fname=None, lineno=0):
+        """apply the optimization passes that are switched on (see the
+        optimize module) to a parsed tree.  The tree itself is left
+        unchanged, and the optimized copy is kept for as long as the
+        tree is in use."""
+        flags = (self.fold_constants, self.vectorize, self.fuse)
+        if not any(flags):
+            return tree
+        try:
+            oflags, otree = self.optimized[tree]
+            if oflags == flags:
+                return otree
+        except KeyError:
+            pass
+        otree = copy.deepcopy(tree)
+        if self.fold_constants:
+            otree = optimize.fold_constants(otree, self.symtable._math)
+        if self.vectorize:
+            report = self.symtable._sys.vectorize.loops
+            otree = optimize.vectorize_loops(otree, fname=fname,
+                                             lineno=lineno, report=report)
+        if self.fuse:
+            otree = optimize.fuse_expressions(otree, self.symtable._math)
+        self.optimized[tree] = (flags, otree)
+        return otree
+
     def compile(self, text, fname=None, lineno=-4):
         """compile statement/expression to Ast representation    """
         self.expr  = text
         try:
-            return ast.parse(text)
+            return self.optimize(self.parse(text, fname=fname),
+                                 fname=fname)
         except:
             self.raise_exception(None, msg='Syntax Error',
                                  expr=text, fname=fname, lineno=lineno,
@@ -284,25 +584,33 @@ class Interpreter:
             return None
         if isinstance(node, str):
             node = self.compile(node)
+        ctx = self._context
         if lineno is not None:
-            self.lineno = lineno
+            ctx.lineno = lineno
         if fname  is not None:
-            self.fname  = fname
+            ctx.fname  = fname
         if expr   is not None:
-            self.expr   = expr
+            ctx.expr   = expr
        
         # get handler for this node:
         #   on_xxx with handle nodes of type 'xxx', etc
-        try:
-            handler = self.node_handlers[node.__class__.__name__.lower()]
-        except KeyError:
-            return self.unimplemented(node)
+        #   or, in compiled mode, the compiled code for the node
+        if self.use_compiler:
+            code = self.compiler.compile(node)
+        else:
+            try:
+                handler = self.node_handlers[node.__class__.__name__.lower()]
+            except KeyError:
+                return self.unimplemented(node)
 
         # run the handler:  this will likely generate
         # recursive calls into this interp method.
         try:
             #print(" Interp NODE ", ast.dump(node))
-            ret = handler(node)
+            if self.use_compiler:
+                ret = code()
+            else:
+                ret = handler(node)
             if isinstance(ret, enumerate):
                 ret = list(ret)
             return ret
@@ -337,6 +645,8 @@ class Interpreter:
             self.raise_exception(node, msg='Eval Error', expr=expr,
                                  fname=fname, lineno=lineno,
                                  py_exc=sys.exc_info())
+        if self.reactive.dirty:
+            self.reactive.flush()
         return out
         
     def dump(self, node, **kw):
@@ -354,7 +664,8 @@ class Interpreter:
 
     def on_return(self, node): # ('value',)
         "return statement"
-        self.retval = self.interp(node.value)
+        ctx = self._context
+        ctx.retval = self.interp(node.value)
         return
     
     def on_repr(self, node):
@@ -383,7 +694,8 @@ class Interpreter:
     # for break and continue: set the instance variable _interrupt
     def on_interrupt(self, node):    # ()
         "interrupt handler"
-        self._interrupt = node
+        ctx = self._context
+        ctx._interrupt = node
         return node
 
     def on_break(self, node):
@@ -439,7 +751,8 @@ class Interpreter:
         """here we assign a value (not the node.value object) to a node
         this is used by on_assign, but also by for, list comprehension, etc.
         """
-        if len(self.error) > 0:
+        ctx = self._context
+        if len(ctx.error) > 0:
             return
         if nod.__class__ == ast.Name:
             sym = self.symtable.set_symbol(nod.id, value=val)
@@ -495,21 +808,53 @@ class Interpreter:
 
     def on_assign(self, node):    # ('targets', 'value')
         "simple assignment"
+        ctx = self._context
         val = self.interp(node.value)
-        if len(self.error) > 0:
+        if len(ctx.error) > 0:
             return        
         for tnode in node.targets:
             self.node_assign(tnode, val)
         return # return val
 
     def on_augassign(self, node):    # ('target', 'op', 'value')
-        "augmented assign"
-        # print( "AugASSIGN ", node.target, node.value)
-        return self.on_assign(ast.Assign(targets=[node.target],
-                                         value=ast.BinOp(left = node.target,
-                                                         op   = node.op,
-                                                         right= node.value)))
-       
+        """augmented assign, as in Python:  the in-place operator (as
+        __iadd__) is applied to the value of the target, so that arrays
+        are changed in place, and the result is assigned back to the
+        target.  The object and index of an attribute or subscript
+        target are evaluated once."""
+        ctx = self._context
+        oper = INPLACE_OPERATORS[node.op.__class__]
+        target = node.target
+        if target.__class__ == ast.Name:
+            cur = self.interp(target)
+            if len(ctx.error) > 0:
+                return
+            val = oper(cur, self.interp(node.value))
+            self.node_assign(target, val)
+        elif target.__class__ == ast.Attribute:
+            sym = self.interp(target.value)
+            if len(ctx.error) > 0:
+                return
+            if not hasattr(sym, target.attr):
+                msg = "%s does not have attribute '%s'" % (sym, target.attr)
+                return self.raise_exception(node, msg=msg)
+            cur = getattr(sym, target.attr)
+            if isinstance(cur, DefinedVariable):
+                cur = cur.evaluate()
+            val = oper(cur, self.interp(node.value))
+            if len(ctx.error) == 0:
+                setattr(sym, target.attr, val)
+        elif target.__class__ == ast.Subscript:
+            sym, index = self.interp(target.value), self.interp(target.slice)
+            if len(ctx.error) > 0:
+                return
+            val = oper(sym[index], self.interp(node.value))
+            if len(ctx.error) == 0:
+                sym[index] = val
+        else:
+            msg = "illegal expression for augmented assignment"
+            self.raise_exception(node, msg=msg)
+
     def on_slice(self, node):    # ():('lower', 'upper', 'step')
         "simple slice"
         return slice(self.interp(node.lower), self.interp(node.upper),
@@ -563,10 +908,10 @@ class Interpreter:
 
     def on_boolop(self, node):    # ('op', 'values')
         "boolean operator"
-        val = self.interp(node.values.pop(0))
+        val = self.interp(node.values[0])
         is_and = ast.Or != node.op.__class__
         if (is_and and val) or (not is_and and not val):
-            for n in node.values:
+            for n in node.values[1:]:
                 val =  OPERATORS[node.op.__class__](val, self.interp(n))
                 if (is_and and not val) or (not is_and and val):
                     break
@@ -616,55 +961,219 @@ class Interpreter:
 
     def on_while(self, node):    # ('test', 'body', 'orelse')
         "while blocks"
+        ctx = self._context
         while self.interp(node.test):
-            self._interrupt = None
+            ctx._interrupt = None
             for tnode in node.body:
                 self.interp(tnode)
-                if self._interrupt is not None:
+                if ctx._interrupt is not None:
                     break
-            if isinstance(self._interrupt, ast.Break):
+            if isinstance(ctx._interrupt, ast.Break):
                 break
         else:
             for tnode in node.orelse:
                 self.interp(tnode)
-        self._interrupt = None
+        ctx._interrupt = None
+
+    def iterate(self, node):
+        """iterable for the sequence of a for loop or comprehension:  a
+        call of one of the builtins range(), zip() or enumerate() gives
+        an iterator (see util.LAZY_ITERATORS), rather than a list"""
+        ctx = self._context
+        if not (isinstance(node, ast.Call) and
+                isinstance(node.func, ast.Name) and
+                node.func.id in LAZY_ITERATORS and not node.keywords and
+                node.starargs is None and node.kwargs is None):
+            return self.interp(node)
+        builtin, lazy, lazy_args = LAZY_ITERATORS[node.func.id]
+        func = self.interp(node.func)
+        if func is not builtin:
+            return self.interp(node)
+        args = []
+        for i, arg in enumerate(node.args):
+            if lazy_args is None or i in lazy_args:
+                args.append(self.iterate(arg))
+            else:
+                args.append(self.interp(arg))
+        if len(ctx.error) > 0:
+            return ()
+        return lazy(*args)
+
+    def comprehension(self, generators, iterable=None):
+        """run the loops of a comprehension, yielding once for each
+        assignment of the targets for which all conditions are true.
+        iterable is the sequence of the first loop, if already found."""
+        ctx = self._context
+        gen, rest = generators[0], generators[1:]
+        if iterable is None:
+            iterable = self.iterate(gen.iter)
+        for val in iterable:
+            self.node_assign(gen.target, val)
+            if len(ctx.error) > 0:
+                return
+            add = True
+            for cond in gen.ifs:
+                add = self.interp(cond)
+                if not add:
+                    break
+            if len(ctx.error) > 0:
+                return
+            if not add:
+                continue
+            if rest:
+                for _ in self.comprehension(rest):
+                    yield
+            else:
+                yield
+            if len(ctx.error) > 0:
+                return
 
     def on_for(self, node):    # ('target', 'iter', 'body', 'orelse')
         "for blocks"
-        for val in self.interp(node.iter):
+        ctx = self._context
+        for val in self.iterate(node.iter):
             self.node_assign(node.target, val)
-            if len(self.error) > 0:
+            if len(ctx.error) > 0:
                 return            
-            self._interrupt = None
+            ctx._interrupt = None
             for tnode in node.body:
                 self.interp(tnode)
-                if len(self.error) > 0:
+                if len(ctx.error) > 0:
                     return                
-                if self._interrupt is not None:
+                if ctx._interrupt is not None:
                     break
-            if isinstance(self._interrupt, ast.Break):
+            if isinstance(ctx._interrupt, ast.Break):
                 break
         else:
             for tnode in node.orelse:
                 self.interp(tnode)
-        self._interrupt = None
+        ctx._interrupt = None
+
+    def on_vectorfor(self, node):    # ('loop',)
+        "for loop run as array operations, or else as a for loop"
+        if not node.run(self):
+            self.symtable._sys.vectorize.fallbacks += 1
+            self.on_for(node.loop)
+
+    def on_folded(self, node):    # ('original',)
+        "constant expression, valid while the names it uses are unchanged"
+        if node.check(self.symtable):
+            return node.value
+        return self.interp(node.original)
+
+    def on_fused(self, node):    # ('original',)
+        "elementwise expression run in blocks, or else as written"
+        return node.evaluate(self, lambda: self.interp(node.original),
+                             nthreads=self.fuse_threads)
 
     def on_listcomp(self, node):    # ('elt', 'generators') 
         "list comprehension"
-        out = []
-        for tnode in node.generators:
-            if tnode.__class__ == ast.comprehension:
-                for val in self.interp(tnode.iter):
-                    self.node_assign(tnode.target, val)
-                    if len(self.error) > 0:
-                        return                    
-                    add = True
-                    for cond in tnode.ifs:
-                        add = add and self.interp(cond)
-                    if add:
-                        out.append(self.interp(node.elt))
+        ctx = self._context
+        out = [self.interp(node.elt)
+               for _ in self.comprehension(node.generators)]
+        if len(ctx.error) > 0:
+            return
         return out
 
+    def on_generatorexp(self, node):    # ('elt', 'generators')
+        """generator expression:  the sequence of the first loop is found
+        now, and the rest is run as the generator is iterated over, in
+        the current frame"""
+        ctx = self._context
+        stable = self.symtable
+        frame = (stable._sys.localGroup, stable._sys.moduleGroup)
+        iterable = self.iterate(node.generators[0].iter)
+        if len(ctx.error) > 0:
+            return
+        def values():
+            loops = self.comprehension(node.generators, iterable=iterable)
+            while True:
+                stable.save_frame()
+                stable.set_frame(frame)
+                try:
+                    next(loops)
+                    val = self.interp(node.elt)
+                finally:
+                    stable.restore_frame()
+                if len(ctx.error) > 0:
+                    return
+                yield val
+        return values()
+
+    def generate(self, nodes, yields, fname=None, lineno=None):
+        """run a block of statements of a generator procedure, as a
+        Python generator of the values of its yield statements.  The
+        statements in yields, those containing a yield, are run here,
+        and all others with interp()."""
+        ctx = self._context
+        for node in nodes:
+            if node not in yields:
+                self.interp(node, expr='<>', fname=fname, lineno=lineno)
+                if (len(ctx.error) > 0 or ctx.retval is not None or
+                    ctx._interrupt is not None):
+                    return
+                continue
+            tlineno = lineno + node.lineno
+            if self.tracing:
+                self.run_hooks('statement', node, fname, tlineno)
+            if isinstance(node, ast.Expr) and isinstance(node.value, ast.Yield):
+                val = self.interp(node.value.value, expr='<>',
+                                  fname=fname, lineno=lineno)
+                if self.tracing:
+                    self.run_hooks('statement_done', node, fname, tlineno, val)
+                if len(ctx.error) > 0:
+                    return
+                yield val
+                continue
+            if self.tracing:
+                self.run_hooks('statement_done', node, fname, tlineno)
+            if isinstance(node, ast.Return):
+                # any value is dropped, as in Python 2:  retval is only
+                # set to stop the generator
+                self.interp(node.value, expr='<>', fname=fname, lineno=lineno)
+                ctx.retval = node
+            elif isinstance(node, ast.If):
+                block = node.orelse
+                if self.interp(node.test, expr='<>', fname=fname,
+                               lineno=lineno):
+                    block = node.body
+                for val in self.generate(block, yields, fname, lineno):
+                    yield val
+            elif isinstance(node, (ast.For, ast.While)):
+                if isinstance(node, ast.For):
+                    def loop():
+                        for val in self.iterate(node.iter):
+                            self.node_assign(node.target, val)
+                            yield
+                else:
+                    def loop():
+                        while self.interp(node.test, expr='<>', fname=fname,
+                                          lineno=lineno):
+                            yield
+                for _ in loop():
+                    if len(ctx.error) > 0:
+                        return
+                    ctx._interrupt = None
+                    for val in self.generate(node.body, yields, fname, lineno):
+                        yield val
+                    if len(ctx.error) > 0 or ctx.retval is not None:
+                        return
+                    if isinstance(ctx._interrupt, ast.Break):
+                        break
+                else:
+                    for val in self.generate(node.orelse, yields, fname,
+                                             lineno):
+                        yield val
+                ctx._interrupt = None
+            else:
+                msg = 'yield is only supported as a statement'
+                if isinstance(node, ast.TryExcept):
+                    msg = 'yield is not supported in a try block'
+                self.raise_exception(node, msg=msg)
+            if (len(ctx.error) > 0 or ctx.retval is not None or
+                ctx._interrupt is not None):
+                return
+
 
     #
     def on_excepthandler(self, node): # ('type', 'name', 'body')
@@ -710,6 +1219,9 @@ class Interpreter:
             self.raise_exception(node, msg=msg, py_exc=sys.exc_info())
 
         args = [self.interp(targ) for targ in node.args]
+        if (not node.keywords and node.starargs is None and
+            node.kwargs is None):
+            return func(*args)
         if node.starargs is not None:
             args = args + self.interp(node.starargs)
         
@@ -730,21 +1242,24 @@ class Interpreter:
         if node.decorator_list != []:
             print("Warning: decorated procedures not supported!")
 
+        # note: node may be shared (see parse()), so must not be modified
+        nargs = len(node.args.args) - len(node.args.defaults)
         kwargs = []
-        while node.args.defaults:
-            defval = self.interp(node.args.defaults.pop())
-            key    = self.interp(node.args.args.pop())
-            kwargs.append((key, defval))
-        kwargs.reverse()
-        args = [tnode.id for tnode in node.args.args]
+        for argnode, defnode in zip(node.args.args[nargs:],
+                                    node.args.defaults):
+            kwargs.append((self.interp(argnode), self.interp(defnode)))
+        args = [tnode.id for tnode in node.args.args[:nargs]]
         doc = None
-        if isinstance(node.body[0], ast.Expr):
-            docnode = node.body.pop(0)
-            doc = self.interp(docnode.value)
+        body = node.body
+        if isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Str):
+            doc = self.interp(body[0].value)
+            body = body[1:]
         # 
         proc = Procedure(node.name, larch= self, doc= doc,
-                         body   = node.body,
+                         body   = body,
                          fname  = self.fname,   lineno = self.lineno,
+                         defline = self.lineno + node.lineno,
+                         yields = yield_statements(body),
                          args   = args,   kwargs = kwargs,
                          vararg = node.args.vararg,
                          varkws = node.args.kwarg)
@@ -786,14 +1301,13 @@ class Interpreter:
         """
         # print("IMPORT MOD ", name, asname, fromlist)
         st_sys     = self.symtable._sys
-        sys.path.extend([ p for p in st_sys.path 
-            if p not in sys.path and os.path.exists(p) ])
 
         # step 1  import the module to a global location
         #   either sys.modules for python modules
         #   or  st_sys.modules for larch modules
         # reload takes effect here in the normal python way:
         if do_reload or name not in chain(st_sys.modules, sys.modules):
+            self.update_module_path()
             thismod = (self.import_larch(name) or 
                 self.import_python(name, do_reload))
         # previously loaded module, just do lookup
@@ -815,6 +1329,14 @@ class Interpreter:
                 setattr(targetgroup, alias or sym, getattr(thismod, sym))
         # print("DONE")
     # end of import_module
+    def update_module_path(self):
+        """bring the module index (see the modulepath module) up to date
+        with the directories of _sys.path, adding those that exist to
+        sys.path for python modules"""
+        if self.module_index.update(self.symtable._sys.path):
+            sys.path.extend([ p for p in self.symtable._sys.path
+                if p not in sys.path and os.path.exists(p) ])
+
     def import_python(self, mod, do_reload=False):
         '''try to find name as a python module, import it, and return it.'''
 
@@ -822,7 +1344,7 @@ class Interpreter:
             mod = sys.modules[mod]
             self.clear_pyc(mod.__file__)
             f = reload
-        else: f = __import__
+        else: f = self.load_python
 
         try: 
             thismod = f(mod)
@@ -832,14 +1354,43 @@ class Interpreter:
             return
         return thismod
 
+    def load_python(self, name):
+        '''import a python module as __import__ does, finding top-level
+        modules along sys.path with the python module index.  Dotted
+        names, builtin and frozen modules, modules claimed by importers
+        of sys.meta_path and those not in the index are left to
+        __import__.'''
+
+        if ('.' in name or imp.is_builtin(name) or imp.is_frozen(name) or
+            any([finder.find_module(name) is not None
+                 for finder in sys.meta_path])):
+            return __import__(name)
+        self.python_index.update(sys.path)
+        dirname = self.python_index.find_python(name)
+        if dirname is None:
+            return __import__(name)
+        imp.acquire_lock()
+        try:
+            if name in sys.modules:
+                return sys.modules[name]
+            fh, filename, desc = imp.find_module(name, [dirname])
+            try:
+                return imp.load_module(name, fh, filename, desc)
+            finally:
+                if fh is not None:
+                    fh.close()
+        finally:
+            imp.release_lock()
+
     def import_larch(self, name):
-        '''try to find name as a larch module, import it, and return it.'''
+        '''try to find name as a larch module, import it, and return it.
+        The module index must be up to date (see update_module_path).'''
 
-        filename = search_dirs("%s.lar" % name, self.symtable._sys.path)
+        filename = self.module_index.find(name, '.lar')
         if filename is not None:
             self.symtable._sys.modules[name] = thismod = Group(name=name)
             with self.symtable.in_frame(thismod, thismod):
-                self.eval_file(filename)
+                self.eval_cached(filename)
             if len(self.error) > 0:
                 self.symtable._sys.modules.pop(name)
             else: 
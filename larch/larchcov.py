@@ -0,0 +1,187 @@
+'''Line coverage of Larch code
+
+Coverage records the lines of the Larch statements that are run, using
+the 'statement' hook of the Interpreter (see Interpreter.add_hook()),
+and compares them with the statements found in each .lar file, as
+converted and parsed by the codecache module.  This covers the files
+run directly as well as the modules they import.
+
+Statements inside a compiled block or a vectorized loop do not run the
+hooks, so coverage should be collected without use_compiler, vectorize
+or fold_constants.
+
+usage:  python -m larch.larchcov [-q] [-t timeout] [-o report] file.lar ...
+
+runs each file in a new Interpreter, from the directory of the file,
+and prints a report for all files run or imported.  A file that runs
+for more than timeout seconds is stopped (where signal.alarm exists).
+'''
+from __future__ import print_function
+import os
+import sys
+import ast
+import signal
+import optparse
+from cStringIO import StringIO
+
+from . import codecache
+
+def statement_lines(filename):
+    """set of line numbers of the statements of a .lar file, or None
+    if it cannot be converted and parsed"""
+    blocks = codecache.get_blocks(filename)
+    if blocks is None:
+        return None
+    lines, docs = set(), set()
+    for text, fname, lineno, tree in blocks:
+        for node in ast.walk(tree):
+            if isinstance(node, ast.FunctionDef):
+                body = node.body
+                # docstrings are not run as statements
+                if (len(body) > 1 and isinstance(body[0], ast.Expr) and
+                    isinstance(body[0].value, ast.Str)):
+                    docs.add(body[0])
+            if isinstance(node, ast.stmt) and node not in docs:
+                lines.add(lineno + node.lineno)
+    return lines
+
+def line_ranges(lines):
+    "'1-3, 7' for lines [1, 2, 3, 7]"
+    out = []
+    for line in sorted(lines):
+        if out and out[-1][1] == line - 1:
+            out[-1][1] = line
+        else:
+            out.append([line, line])
+    return ', '.join([first == last and '%i' % first or '%i-%i' % (first, last)
+                      for first, last in out])
+
+class Timeout(Exception):
+    "raised when a file runs for too long"
+
+def _timeout(signum, frame):
+    raise Timeout('timed out')
+
+class Coverage(object):
+    """collect the lines of Larch statements run by one or more
+    Interpreters"""
+
+    def __init__(self):
+        # absolute file name -> set of line numbers run
+        self.executed = {}
+        # file names as given by the interpreter -> absolute file names,
+        # found when first seen, as they may be relative to a directory
+        # that is only current while running
+        self.names = {}
+
+    def start(self, larch):
+        "start recording statements run by an Interpreter"
+        larch.add_hook('statement', self.statement)
+
+    def stop(self, larch):
+        "stop recording statements run by an Interpreter"
+        larch.remove_hook('statement', self.statement)
+        self.names = {}
+
+    def statement(self, node, fname, lineno, arg):
+        "record a statement"
+        try:
+            self.executed[self.names[fname]].add(lineno)
+        except KeyError:
+            if fname not in self.names:
+                self.names[fname] = fname
+                if fname is not None:
+                    self.names[fname] = os.path.abspath(fname)
+            self.executed.setdefault(self.names[fname], set()).add(lineno)
+
+    def run_file(self, filename, quiet=False, timeout=None):
+        """run a .lar file with a new Interpreter, from the directory of
+        the file, for at most timeout seconds.  Returns False if the file
+        could not be run."""
+        from .interpreter import Interpreter
+        filename = os.path.abspath(filename)
+        if codecache.get_blocks(filename) is None:
+            print("cannot convert %s" % filename, file=sys.stderr)
+            return False
+        writer = quiet and StringIO() or sys.stdout
+        cwd = os.getcwd()
+        os.chdir(os.path.dirname(filename))
+        use_alarm = timeout is not None and hasattr(signal, 'SIGALRM')
+        if use_alarm:
+            handler = signal.signal(signal.SIGALRM, _timeout)
+            signal.alarm(timeout)
+        try:
+            larch = Interpreter(writer=writer)
+            self.start(larch)
+            ret = larch.eval_cached(filename)
+            self.stop(larch)
+        finally:
+            if use_alarm:
+                signal.alarm(0)
+                signal.signal(signal.SIGALRM, handler)
+            os.chdir(cwd)
+        return ret
+
+    def files(self):
+        """dict of absolute file name -> set of lines run, for
+        the files that exist"""
+        return dict([(fname, lines) for fname, lines in self.executed.items()
+                     if fname is not None and os.path.isfile(fname)])
+
+    def analysis(self, filename):
+        """(statement lines, lines run, lines missed) for a file, or
+        None if it cannot be parsed"""
+        filename = os.path.abspath(filename)
+        statements = statement_lines(filename)
+        if statements is None:
+            return None
+        run = self.files().get(filename, set()) & statements
+        return statements, run, statements - run
+
+    def report(self, filenames=None):
+        """text report of coverage for filenames, by default all
+        files that were run"""
+        if filenames is None:
+            filenames = self.files().keys()
+        filenames = sorted([os.path.abspath(f) for f in filenames])
+        cwd = os.getcwd()
+        fmt = '%-40s %6s %6s %6s   %s'
+        out = [fmt % ('Name', 'Stmts', 'Miss', 'Cover', 'Missing')]
+        nstat, nmiss = 0, 0
+        for fname in filenames:
+            result = self.analysis(fname)
+            if result is None:
+                continue
+            statements, run, missed = result
+            nstat, nmiss = nstat + len(statements), nmiss + len(missed)
+            cover = 100.0 * len(run) / max(1, len(statements))
+            out.append(fmt % (os.path.relpath(fname, cwd), len(statements),
+                              len(missed), '%.0f%%' % cover,
+                              line_ranges(missed)))
+        cover = 100.0 * (nstat - nmiss) / max(1, nstat)
+        out.append(fmt % ('TOTAL', nstat, nmiss, '%.0f%%' % cover, ''))
+        return '\n'.join(out)
+
+def main(args=None):
+    "run .lar files and report their coverage"
+    parser = optparse.OptionParser(usage='%prog [-q] [-t timeout] '
+                                   '[-o report] file.lar ...')
+    parser.add_option('-q', '--quiet', action='store_true', default=False,
+                      help='hide output of the larch files')
+    parser.add_option('-t', '--timeout', type='int', default=None,
+                      help='stop each file after this many seconds')
+    parser.add_option('-o', '--output', default=None,
+                      help='write report to file')
+    options, files = parser.parse_args(args)
+    cover = Coverage()
+    for fname in files:
+        cover.run_file(fname, quiet=options.quiet, timeout=options.timeout)
+    report = cover.report()
+    if options.output is None:
+        print(report)
+    else:
+        with open(options.output, 'w') as fh:
+            fh.write(report + '\n')
+
+if __name__ == '__main__':
+    main()
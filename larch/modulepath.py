@@ -0,0 +1,127 @@
+'''Index of the module files in the directories of the module search path
+
+Finding a module by looking in each directory of _sys.path lists every
+directory on every import.  A ModuleIndex keeps the listing of each
+directory, with its modification time:  update(path) reads only the
+directories that are new to the path or have changed since they were
+read (so that a file added to a directory is found), and find() looks
+up a module file in a single dictionary of the first directory holding
+each file name along the path.  find_python() gives the directory that
+python's import would take a top-level module from, as long as no entry
+before it is a file (as a zip file) that cannot be listed.
+
+On filesystems keeping modification times in whole seconds, a file
+added within the same second as a listing would not change the time, so
+listings made within RACY_SECONDS of such a time are read again next
+time.
+'''
+import os
+import imp
+import time
+
+# kinds of module files:  larch and python modules, and python packages
+# (directories with an __init__.py), given the suffix PACKAGE
+MODULE_SUFFIXES = ('.lar', '.py')
+PACKAGE = '/'
+
+# suffixes of python modules, in the order tried by import after packages
+PYTHON_SUFFIXES = tuple([suffix for suffix, mode, kind in imp.get_suffixes()])
+PACKAGE_INITS = ('__init__.py', '__init__.pyc', '__init__.pyo')
+
+RACY_SECONDS = 2.0
+
+class ModuleIndex(object):
+    """module files in the directories of a search path (see module
+    doc).  reads counts the directory listings made."""
+    def __init__(self):
+        self.dirs = {}          # dirname -> (mtime or None, files)
+        self.path = None        # the path indexed, as a tuple
+        self.files = {}         # file name -> first dirname holding it
+        self.order = {}         # dirname -> first position in path
+        self.unlisted = set()   # entries that exist but cannot be listed
+        self.reads = 0
+
+    def refresh(self, dirname):
+        """read the listing of a directory if it is not known or has
+        changed, returning whether its files changed"""
+        try:
+            mtime = os.stat(dirname).st_mtime
+        except OSError:
+            mtime = None
+        entry = self.dirs.get(dirname)
+        if entry is not None and entry[0] == mtime and mtime is not None:
+            return False
+        files = {}
+        self.unlisted.discard(dirname)
+        if mtime is not None:
+            self.reads += 1
+            try:
+                files = dict.fromkeys(os.listdir(dirname), dirname)
+            except OSError:
+                mtime = None
+                self.unlisted.add(dirname)
+            else:
+                if (mtime == int(mtime) and
+                    time.time() - mtime < RACY_SECONDS):
+                    mtime = None
+        if entry is not None and entry[1] == files:
+            self.dirs[dirname] = (mtime, entry[1])
+            return False
+        self.dirs[dirname] = (mtime, files)
+        return True
+
+    def update(self, path):
+        """bring the index up to date with a search path (a list of
+        directories), returning whether it changed.  Directories already
+        indexed are only read again if they have changed.  Relative
+        directories are taken from the current directory."""
+        path = tuple([os.path.abspath(dirname) for dirname in path])
+        changed = path != self.path
+        for dirname in set(path):
+            changed = self.refresh(dirname) or changed
+        if changed:
+            files = {}
+            for dirname in reversed(path):
+                files.update(self.dirs[dirname][1])
+            for dirname in set(self.dirs) - set(path):
+                del self.dirs[dirname]
+                self.unlisted.discard(dirname)
+            self.order = {}
+            for i, dirname in enumerate(path):
+                self.order.setdefault(dirname, i)
+            self.path, self.files = path, files
+        return changed
+
+    def find(self, name, suffix='.lar'):
+        """file of the module name of a kind (a suffix, as from
+        MODULE_SUFFIXES, or PACKAGE) first found along the path at the
+        last update(), or None"""
+        if suffix == PACKAGE:
+            dirname = self.files.get(name)
+            if dirname is None or not any([
+                    os.path.isfile(os.path.join(dirname, name, init))
+                    for init in PACKAGE_INITS]):
+                return None
+            return os.path.join(dirname, name)
+        dirname = self.files.get(name + suffix)
+        if dirname is None:
+            return None
+        return os.path.join(dirname, name + suffix)
+
+    def find_python(self, name):
+        """directory of the python module or package name first found
+        along the path at the last update(), or None if there is none or
+        an entry before it could not be listed"""
+        first = None
+        for suffix in (PACKAGE,) + PYTHON_SUFFIXES:
+            fname = self.find(name, suffix)
+            if fname is not None:
+                dirname = os.path.dirname(fname)
+                if first is None or self.order[dirname] < self.order[first]:
+                    first = dirname
+        if first is None:
+            return None
+        for dirname in self.unlisted:
+            if self.order[dirname] < self.order[first]:
+                return None
+        return first
@@ -5,6 +5,8 @@ import sys
 import copy
 import time
 import json
+from itertools import islice, chain
+from collections import OrderedDict
 try:
     import numpy 
 except ImportError:
@@ -16,7 +18,88 @@ try:
     has_h5 = True
 except ImportError:
     has_h5 = False
-has_h5 = False
+
+def parse_rows(lines, ncols):
+    """parse a list of text lines of ncols numbers each
+    to a (nrows, ncols) float64 array, in one call to numpy"""
+    vals = numpy.fromstring(''.join(lines), sep=' ')
+    if vals.size != len(lines)*ncols:
+        raise ValueError('inconsistent number of columns in data')
+    vals.shape = (len(lines), ncols)
+    return vals
+
+class RowBuffer:
+    """growable (nrows, ncols) float64 array, filled by blocks of rows"""
+    def __init__(self, ncols, nrows=1024):
+        self.data  = numpy.empty((max(nrows, 1), ncols))
+        self.nrows = 0
+
+    def __len__(self):
+        return self.nrows
+
+    def append(self, rows):
+        "add rows at the end, growing the array if needed"
+        nrows = self.nrows + len(rows)
+        if nrows > len(self.data):
+            size = max(nrows, int(1.5*len(self.data)))
+            self.data.resize((size, self.data.shape[1]), refcheck=False)
+        self.data[self.nrows:nrows] = rows
+        self.nrows = nrows
+
+    def truncate(self, nrows):
+        "drop rows past nrows"
+        self.nrows = min(nrows, self.nrows)
+
+    def array(self):
+        "the rows filled so far, without spare rows"
+        self.data.resize((self.nrows, self.data.shape[1]), refcheck=False)
+        return self.data
+
+class H5Proxy:
+    """read-only view of an h5py dataset, loaded only as it is indexed.
+    Slices by an integer first index (one detector, one sum, one map
+    row) are kept in a small least-recently-used cache."""
+    def __init__(self, dset, cache_size=8):
+        self.dset  = dset
+        self.shape = dset.shape
+        self.dtype = dset.dtype
+        self.ndim  = len(dset.shape)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if not isinstance(key, (int, long, numpy.integer)):
+            return self.dset[key]
+        if key < 0:
+            key = key + self.shape[0]
+        if key in self.cache:
+            val = self.cache.pop(key)
+        else:
+            val = self.dset[key]
+            if len(self.cache) >= self.cache_size:
+                self.cache.popitem(last=False)
+        self.cache[key] = val
+        return val
+
+    def __iter__(self):
+        for i in range(self.shape[0]):
+            yield self[i]
+
+    def __array__(self, dtype=None):
+        val = self.dset[...]
+        if dtype is not None:
+            val = val.astype(dtype)
+        return val
+
+def h5chunks(shape, nfast=1):
+    """hdf5 chunk shape to read a dataset one slice of the
+    last nfast axes at a time"""
+    if nfast < 1 or len(shape) <= nfast or 0 in shape:
+        return None
+    return (1,)*(len(shape)-nfast) + tuple(shape[-nfast:])
 
 class escan_data:
     """ Epics Scan Data """
@@ -25,6 +108,17 @@ class escan_data:
                   '-----','=====',
                   'scan began at', 'scan ended at',
                   'column labels', 'scan regions','data')
+    # number of data lines parsed at once by read_ascii
+    chunk_rows = 4096
+    # full xrf spectra: lines parsed at once, array type, and
+    # .npy file name to memory-map them to (True for xrfname.npy)
+    xrf_chunk_rows = 64
+    xrf_dtype  = numpy.int32
+    xrf_memmap = None
+    # read_h5file leaves the large arrays in the file, as H5Proxy
+    h5_lazy = True
+    # read_data_file reads and writes a cache of the scan in fname.h5
+    h5_cache = False
     
     def __init__(self,file='',correct_deadtime=True,**args):
         self.filename    = file
@@ -51,6 +145,7 @@ class escan_data:
         self.xrf_data = []
         self.xrf_energies = []
         self.xrf_header = ''
+        self.h5file = None
         
         self.correct_deadtime = correct_deadtime
         self.progress    = None
@@ -59,6 +154,8 @@ class escan_data:
         for k in args.keys():
             if (k == 'progress'): self.progress = args[k]
             if (k == 'message'):  self.message  = args[k]
+            if (k == 'xrf_memmap'):  self.xrf_memmap  = args[k]
+            if (k == 'h5_cache'):  self.h5_cache  = args[k]
         
         self.x = numpy.array(0)
         self.y = numpy.array(0)
@@ -140,11 +237,13 @@ class escan_data:
         sys.stdout.flush()
         
     def read_data_file(self,fname=None):
-        """generic data file reader"""
+        """generic data file reader.  With h5_cache (and h5py), the scan
+        is read from fname.h5 if newer than fname, else written to it"""
         if fname is None: fname = self.filename
         h5name = "%s.h5" % fname
+        use_h5 = has_h5 and self.h5_cache
         read_ascii = True
-        if has_h5 and os.path.exists(h5name):
+        if use_h5 and os.path.exists(h5name):
             mtime_ascii = os.stat(fname)[8]
             mtime_h5    = os.stat(h5name)[8]
             if mtime_h5 > mtime_ascii:
@@ -161,7 +260,7 @@ class escan_data:
             else:
                 msg = "problem reading file %s" % fname
             self.ShowMessage(msg)
-            if has_h5 and retval is None:
+            if use_h5 and retval is None:
                 try:
                     self.write_h5file(h5name)
                 except:
@@ -202,7 +301,9 @@ class escan_data:
             g['iocr'] = 'False'
         
         for attr in attr_list:
-            g.create_dataset(attr, data= getattr(self,attr), compression=5)
+            dat = numpy.asarray(getattr(self,attr))
+            g.create_dataset(attr, data=dat, compression=5,
+                             chunks=h5chunks(dat.shape, dat.ndim-1))
 
         for attr in ('pos_names', 'det_names', 'pv_list',
                      'scan_regions', 'user_titles', 'info',
@@ -212,14 +313,20 @@ class escan_data:
         if self.has_fullxrf:
             g = fout.create_group('full_xrf')
             g['header'] = self.xrf_header
-            g.create_dataset('data', data= self.xrf_data, compression=5)
+            g.create_dataset('data', data= self.xrf_data, compression=5,
+                             chunks=h5chunks(self.xrf_data.shape, 2))
             g.create_dataset('energies', data= self.xrf_energies, compression=5)
             g['energies'].attrs['units'] = 'keV'
             
         fout.close()
         return None
         
-    def read_h5file(self,h5name):
+    def read_h5file(self,h5name,lazy=None):
+        """read scan from hdf5 file.  With lazy (default h5_lazy) det,
+        sums, det_corr, sums_corr and xrf_data are H5Proxy objects that
+        read from the file, which stays open until close()"""
+        if lazy is None: lazy = self.h5_lazy
+        self.close()
         f = h5py.File(h5name,'r')
 
         isValid = False
@@ -249,17 +356,23 @@ class escan_data:
             self.ypos = g['y'].attrs['name']
 
         self.correct_deadtime = g['correct_deadtime'].value == 'True'
-        if g['iocr'].value == 'False':
-            self.iocr = None
-            self.det_corr = []
-            self.sums_corr = []
+        has_iocr = g['iocr'].shape != ()
+        self.iocr = None
             
-        attr_list = ['det', 'pos', 'sums']
-        if self.iocr is not None:
-            attr_list.extend(['iocr', 'det_corr', 'sums_corr'])
-
-        for attr in attr_list:
-            setattr(self,attr,  g[attr].value)
+        lazy_attrs = ['det', 'sums']
+        if has_iocr:
+            lazy_attrs.extend(['det_corr', 'sums_corr'])
+            self.iocr = g['iocr'].value
+        self.pos = g['pos'].value
+
+        for attr in lazy_attrs:
+            if lazy:
+                setattr(self,attr,  H5Proxy(g[attr]))
+            else:
+                setattr(self,attr,  g[attr].value)
+        if not has_iocr:
+            self.det_corr  = self.det
+            self.sums_corr = self.sums
 
         for attr in ('pos_names', 'det_names', 'pv_list',
                      'scan_regions', 'user_titles', 'info',
@@ -271,9 +384,21 @@ class escan_data:
             g = f['full_xrf']
             self.xrf_header = g['header'].value
             self.xrf_energies = g['energies'].value
-            self.xrf_data = g['data'] .value
-        f.close()
+            if lazy:
+                self.xrf_data = H5Proxy(g['data'], cache_size=2)
+            else:
+                self.xrf_data = g['data'].value
+        if lazy:
+            self.h5file = f
+        else:
+            f.close()
         return None
+
+    def close(self):
+        "close hdf5 file left open by read_h5file"
+        if self.h5file is not None:
+            self.h5file.close()
+            self.h5file = None
         
     def _getarray(self,name=None,icr_correct=True):
         i = None
@@ -293,7 +418,8 @@ class escan_data:
         
                 
     def _open_ascii(self,fname=None):
-        """open ascii file, return lines after some checking"""
+        """open ascii file, return open file positioned after
+        the first line, after some checking"""
         if fname is None: fname = self.filename
         if fname is None: return None
 
@@ -301,22 +427,19 @@ class escan_data:
         self.ShowMessage("opening file %s  ... " % fname)
         try:
             f = open(fname,'r')
-            lines = f.readlines()
-            lines.reverse()
-            f.close()
+            line1 = f.readline()
         except:
             self.ShowMessage("ERROR: general error reading file %s " % fname)
             return None
 
-        line1    = lines.pop()
         if 'Epics Scan' not in line1:
             self.ShowMessage("Error: %s is not an Epics Scan file" % fname)
+            f.close()
             return None
-        return lines
+        return f
         
-    def _getline(self,lines):
-        "return mode keyword,"
-        inp = lines.pop()
+    def _getline(self,inp):
+        "return mode keyword, line"
         is_comment = True
         mode = None
         if len(inp) > 2:
@@ -337,8 +460,9 @@ class escan_data:
         
 
     def _make_arrays(self, tmp_dat, col_legend, col_details):
-        # convert tmp_dat to numpy 2d array
-        dat = numpy.array(tmp_dat).transpose()
+        # tmp_dat is a (npts, ncols) array:  the arrays made here
+        # are views into it where possible, not copies
+        dat = numpy.asarray(tmp_dat).transpose()
         print 'dat: ', dat.shape
         # make raw position and detector data, using column labels
         npos = len( [i for i in col_legend if i.lower().startswith('p')])
@@ -376,7 +500,7 @@ class escan_data:
                 sum_name = thisname
                 self.sums_names.append(sum_name)
                 isum  = isum + 1
-                self.sums.append( self.det[i][:] )
+                self.sums.append( self.det[i].copy() )
                 self.sums_list.append(i)
                 o = [i]
             else:
@@ -416,11 +540,14 @@ class escan_data:
             nx = len(self.x)
             self.y = []
 
-        # finally, icr/ocr corrected sums
-        self.det_corr  = copy.deepcopy(self.det)
-        self.sums_corr = copy.deepcopy(self.sums)
+        # finally, icr/ocr corrected sums, which are
+        # the same arrays as det and sums if not corrected
+        self.det_corr  = self.det
+        self.sums_corr = self.sums
 
         if self.info['icr/ocr']:
+            self.det_corr  = self.det.copy()
+            self.sums_corr = self.sums.copy()
             idet = -1
             for label,pvname in self.det_names:
                 idet = idet + 1
@@ -442,28 +569,60 @@ class escan_data:
         return
         
     def read_ascii(self,fname=None):
-        """read ascii data file"""
-        lines = self._open_ascii(fname=fname)
-        if lines is None: return -1
+        """read ascii data file.  The numeric data is parsed in chunks
+        of lines straight into one array, which is then used by the
+        pos, det and sums arrays."""
+        inpf = self._open_ascii(fname=fname)
+        if inpf is None: return -1
+        if fname is None: fname = self.filename
+        fsize = max(1, os.stat(fname)[6])
         
-        maxlines = len(lines)
-
+        t0 = time.time()
         iline = 1
-        ndata_points = None
-        tmp_dat = []
+        nbytes = 0
+        tmp_dat = None
+        chunk   = []
         tmp_y   = []
         col_details = []
         col_legend = None
         ntotal_at_2d = []
         mode = None
-        while lines:
-            key, raw = self._getline(lines)
+        for raw in inpf:
+            nbytes = nbytes + len(raw)
             iline= iline+1
+            # inside a data block, only comment lines change mode
+            if mode == 'data' and len(raw) > 2 and raw[0] not in (';','#'):
+                chunk.append(raw)
+                if len(chunk) >= self.chunk_rows:
+                    tmp_dat.append(parse_rows(chunk, tmp_dat.data.shape[1]))
+                    chunk = []
+                    self.ShowProgress(nbytes * 100.0 / fsize)
+                continue
+            key, raw = self._getline(raw)
             if key is not None and key != mode:
                 mode = key
 
             if (len(raw) < 3): continue
-            self.ShowProgress( iline* 100.0 /(maxlines+1))
+
+            if mode == 'data':             # real numeric column data
+                if tmp_dat is None:
+                    # guess number of rows from the file size
+                    tmp_dat = RowBuffer(len(raw.split()),
+                                        nrows=int(1.05*fsize/len(raw)))
+                chunk.append(raw)
+                if len(chunk) >= self.chunk_rows:
+                    tmp_dat.append(parse_rows(chunk, tmp_dat.data.shape[1]))
+                    chunk = []
+                    self.ShowProgress(nbytes * 100.0 / fsize)
+                continue
+
+            if chunk:
+                tmp_dat.append(parse_rows(chunk, tmp_dat.data.shape[1]))
+                chunk = []
+            self.ShowProgress(nbytes * 100.0 / fsize)
+            npts = 0
+            if tmp_dat is not None:
+                npts = len(tmp_dat)
 
             if mode == '2d':
                 self.dimension = 2
@@ -472,19 +631,18 @@ class escan_data:
                 tmp_y.append(yval)
                 ypos_name = sx[1]
                 mode = None
-                if len(tmp_dat)>0:
-                    ntotal_at_2d.append(len(tmp_dat))
+                if npts > 0:
+                    ntotal_at_2d.append(npts)
 
             elif mode == 'epics scan':             # real numeric column data
                 print 'Warning: file appears to have a second scan appended!'
                 break
                 
-            elif mode == 'data':             # real numeric column data
-                tmp_dat.append(numpy.array([float(i) for i in raw.split()]))
-                
             elif mode == '-----':
                 if col_legend is None:   
-                    col_legend = lines.pop()[1:].strip().split()
+                    legend = inpf.next()
+                    nbytes = nbytes + len(legend)
+                    col_legend = legend[1:].strip().split()
 
             elif mode == '=====':   
                 pass
@@ -517,12 +675,24 @@ class escan_data:
             else:
                 print 'UNKOWN MODE = ',mode, raw[:20]
 
+        if chunk:
+            tmp_dat.append(parse_rows(chunk, tmp_dat.data.shape[1]))
+            chunk = None
+        inpf.close()
+
         try:        
             col_details.pop(0)
             self.pv_list.pop(0)
         except IndexError:
             print 'Empty Scan File'
             return -2
+        if tmp_dat is None:
+            print 'Empty Scan File'
+            return -2
+
+        dt = time.time() - t0
+        self.ShowMessage("read %i rows in %.2f sec (%.0f rows/sec)" %
+                         (len(tmp_dat), dt, len(tmp_dat)/max(dt, 1.e-6)))
         
         if len(self.user_titles) > 1: self.user_titles.pop(0)
         if len(self.scan_regions) > 1: self.scan_regions.pop(0)
@@ -542,7 +712,8 @@ class escan_data:
                 if len(tmp_y) > nrows or len(tmp_dat)> npts_total:
                     print 'Warning: Some trailing data may be lost!'
                     tmp_y = tmp_y[:nrows]
-                    tmp_dat = tmp_dat[:npts_total+1]
+                    tmp_dat.truncate(npts_total)
+                    ntotal_at_2d = ntotal_at_2d[:nrows]
             #
         self.y = numpy.array(tmp_y)
         # done reading file
@@ -559,7 +730,7 @@ class escan_data:
                 return
             nlast = jcount
         
-        self._make_arrays(tmp_dat,col_legend,col_details)
+        self._make_arrays(tmp_dat.array(),col_legend,col_details)
         tmp_dat = None
         #
         self.has_fullxrf = False        
@@ -567,6 +738,11 @@ class escan_data:
             self.read_fullxrf("%s.fullxrf" %fname, len(self.x), len(self.y))
 
     def read_fullxrf(self,xrfname, n_xin, n_yin):
+        """read full XRF spectra into xrf_data, a (ny, nx, ndet, nchan)
+        integer array ((nx, ndet, nchan) for 1d scans), using the ix, iy
+        columns of each spectrum line as indices.  If xrf_memmap is set,
+        xrf_data is a numpy memmap in that .npy file ('%s.npy' % xrfname
+        for xrf_memmap=True), so maps larger than memory can be read."""
         inpf = open(xrfname,'r')
 
         atime = os.stat(xrfname)[8]
@@ -576,7 +752,7 @@ class escan_data:
 
         first_line = inpf.readline()
         if not first_line.startswith('; MCA Spectra'):
-            print 'Warning: %s is not a QuadXRF File' % xrffile
+            print 'Warning: %s is not a QuadXRF File' % xrfname
             inpf.close()
             return
         
@@ -586,10 +762,6 @@ class escan_data:
         header = {'CAL_OFFSET':None,'CAL_SLOPE':None,'CAL_QUAD':None}
         rois   = []
 
-        n_elems    = 4
-        n_energies = 2048
-
-
         while isHeader:
             line = inpf.readline()
             nheader = nheader + 1        
@@ -606,6 +778,21 @@ class escan_data:
         line = inpf.readline()
         ndet = len(header['CAL_OFFSET'])
         nheader = nheader + 1
+        for key in ('CAL_SLOPE', 'CAL_QUAD'):
+            if header[key] is None:
+                header[key] = [0.0]*ndet
+
+        # number of channels from the first spectrum line
+        first_spectrum = inpf.readline()
+        while first_spectrum and len(first_spectrum) <= 2:
+            first_spectrum = inpf.readline()
+        nwords = len(first_spectrum.split()) - 2
+        n_energies = nwords / ndet
+        if n_energies < 1 or nwords % ndet != 0:
+            inpf.close()
+            raise ValueError('%s has no spectra of %i detectors' %
+                             (xrfname, ndet))
+
         # print '==rois==' , len(rois), len(rois)/ndet, ndet
         allrois = []
         nrois =  len(rois)/ndet
@@ -646,60 +833,64 @@ TWO_THETA:   10.0000000 10.0000000 10.0000000 10.0000000"""
         
         self.xrf_header = obuff
         # print self.xrf_header
-        # dir = prefix
-        self.xrf_energies = []
-        x_en = numpy.arange(n_energies)
-        for i in range(ndet):
-            off   = header['CAL_OFFSET'][i]
-            slope = header['CAL_SLOPE'][i]
-            quad  = header['CAL_SLOPE'][i]            
-            self.xrf_energies.append(off + x_en * (slope + x_en * quad))
-
-        self.xrf_energies = numpy.array(self.xrf_energies)
-
-        self.xrf_dict = {}
-        processing = True
-        iyold = 1
-        ix    = 0
-        t0 = time.time()
 
-        lines = inpf.readlines()
-        n_print = 100
-        for il, line in enumerate(lines):
-            try:
-                dat = [int(i) for i in line[:-1].split()]
-                ix  = dat.pop(0)
-                iy  = dat.pop(0)
-                if iy != iyold:
-                    iyold = iy
-
-                self.xrf_dict['%i/%i' % (ix,iy)] =dat
-                show_progress = self.progress
-                self.progress = self.my_progress
-                if (il % n_print) == 0: self.PrintMessage('. ')
-                self.progress = show_progress
-            except KeyboardInterrupt:
-                return -3
+        # energies = offset + slope*chan + quad*chan**2, for all detectors
+        x_en  = numpy.arange(n_energies)
+        off   = numpy.array(header['CAL_OFFSET'])[:,numpy.newaxis]
+        slope = numpy.array(header['CAL_SLOPE'])[:,numpy.newaxis]
+        quad  = numpy.array(header['CAL_QUAD'])[:,numpy.newaxis]
+        self.xrf_energies = off + x_en * (slope + x_en * quad)
+
         xrf_shape =  (n_xin, ndet, n_energies)
         if self.dimension == 2:
             xrf_shape =  (n_yin, n_xin, ndet, n_energies)            
-            
-        self.xrf_data = numpy.zeros(xrf_shape)
-        if self.dimension == 2:
-            for iy in range(n_yin):
-                for ix in range(n_xin):
-                    key = '%i/%i' % (ix+1,iy+1)
-                    d = numpy.array(self.xrf_dict[key])
-                    d.shape = (ndet, n_energies)
-                    self.xrf_data[iy,ix,:,:] = d
+
+        if self.xrf_memmap:
+            mapname = self.xrf_memmap
+            if mapname is True:
+                mapname = "%s.npy" % xrfname
+            self.xrf_data = numpy.lib.format.open_memmap(mapname, mode='w+',
+                                                         dtype=self.xrf_dtype,
+                                                         shape=xrf_shape)
         else:
-            for ix in range(n_xin):
-                key = '%i/%i' % (ix+1,iy)
-                d = numpy.array(self.xrf_dict[key])
-                d.shape = (ndet, n_energies)
-                self.xrf_data[ix,:,:] = d
-            
-        self.xrf_dict = None
+            self.xrf_data = numpy.zeros(xrf_shape, dtype=self.xrf_dtype)
+
+        t0 = time.time()
+        nvals = 2 + ndet*n_energies
+        spectra_lines = chain([first_spectrum], inpf)
+        while True:
+            try:
+                # read to the end of the file:  a chunk of only blank
+                # lines is skipped, not taken for the end
+                lines = list(islice(spectra_lines, self.xrf_chunk_rows))
+                if not lines:
+                    break
+                lines = [l for l in lines if len(l) > 2]
+                if not lines:
+                    continue
+                dat = numpy.fromstring(''.join(lines), sep=' ',
+                                       dtype=self.xrf_dtype)
+                if dat.size != len(lines)*nvals:
+                    print 'Warning: inconsistent spectra in %s' % xrfname
+                    break
+                dat.shape = (len(lines), nvals)
+                spectra = dat[:,2:].reshape(len(lines), ndet, n_energies)
+                # ix, iy in the file count from 1
+                ix = dat[:,0] - 1
+                iy = dat[:,1] - 1
+                if self.dimension == 2:
+                    ok = (ix>=0) & (ix<n_xin) & (iy>=0) & (iy<n_yin)
+                    self.xrf_data[iy[ok], ix[ok]] = spectra[ok]
+                else:
+                    ok = (ix>=0) & (ix<n_xin)
+                    self.xrf_data[ix[ok]] = spectra[ok]
+                self.PrintMessage('. ')
+            except KeyboardInterrupt:
+                inpf.close()
+                return -3
+
+        if self.xrf_memmap:
+            self.xrf_data.flush()
         # print 'XRF DATA  ',  iy, self.xrf_data.shape
         # print self.xrf_data[0,0,:,:]
         inpf.close()
@@ -0,0 +1,800 @@
+'''Optimization passes over parsed Larch ASTs
+
+These are applied by Interpreter.optimize() to a copy of each parsed
+tree, and are switched on with Interpreter options.  Every pass must
+leave the result of running a tree unchanged: anything that cannot be
+shown to be safe when the tree is parsed is checked again when it runs,
+and falls back to the plain nodes if needed.
+
+vectorize_loops()   (Interpreter option vectorize=True)
+    replaces elementwise loops over array indices, such as
+        for i in range(len(x)):
+            y[i] = a*x[i] + b
+    with a VectorFor node that runs each assignment as one numpy
+    expression over slices of the arrays.
+
+fold_constants()    (Interpreter option fold_constants=True)
+    evaluates arithmetic, comparisons and calls of numpy ufuncs on
+    constants, including numbers from _math such as pi, and removes
+    if/while blocks whose test is a constant.
+
+fuse_expressions()  (Interpreter option fuse=True)
+    replaces elementwise expressions of two or more operations, such as
+        a*x**2 + b*x + c
+    with a Fused node that evaluates them over large arrays in blocks
+    of FUSE_BLOCK elements, into a single output array, so that the
+    intermediate results are only as large as a block.  Expressions
+    found to use scalars or small arrays are run as written, until
+    they give a large array.
+'''
+from __future__ import division, print_function
+import ast
+import numbers
+import threading
+try:
+    import numpy
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+from .compiler import OPERATORS
+from .util import DefinedVariable
+
+# operators allowed in elementwise expressions
+ELEMENTWISE_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv,
+                   ast.Mod, ast.Pow, ast.UAdd, ast.USub)
+
+# functions, other than numpy ufuncs, that work elementwise on arrays
+ELEMENTWISE_FUNCS = (abs,)
+
+class NotVectorizable(Exception):
+    "raised when a loop cannot be run as array operations"
+
+def dotted_name(node):
+    """return 'a.b.c' for a Name or Attribute chain of Names (in Load
+    context), or None for any other node"""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.insert(0, node.attr)
+        node = node.value
+    if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+        parts.insert(0, node.id)
+        return '.'.join(parts)
+    return None
+
+def is_simple(node):
+    """is node an expression without side effects, suitable for
+    evaluating twice:  numbers, names, arithmetic and len()"""
+    if (isinstance(node, (ast.Num, Folded)) or
+        dotted_name(node) is not None):
+        return True
+    if isinstance(node, ast.BinOp):
+        return is_simple(node.left) and is_simple(node.right)
+    if isinstance(node, ast.UnaryOp):
+        return is_simple(node.operand)
+    if isinstance(node, ast.Call):
+        return (isinstance(node.func, ast.Name) and node.func.id == 'len' and
+                len(node.args) == 1 and not node.keywords and
+                node.starargs is None and node.kwargs is None and
+                is_simple(node.args[0]))
+    return False
+
+class VectorFor(ast.stmt):
+    """for loop over range() with a body of elementwise assignments,
+    made by vectorize_loops().  The original For node is kept in .loop,
+    and is run instead when the checks in run() fail."""
+    _fields = ('loop',)
+
+    def __init__(self, loop, index, assigns, names):
+        ast.stmt.__init__(self)
+        self.loop    = loop
+        self.index   = index      # name of loop variable
+        self.assigns = assigns    # list of (op, target name, expr)
+        self.names   = names      # {dotted name: role}
+        ast.copy_location(self, loop)
+
+    def run(self, larch):
+        """run the loop as array operations.  Returns False, having
+        changed nothing, if the loop must be run by the interpreter."""
+        if larch.symtable.get_symbol('range', create=False) is not range:
+            return False
+        args = [larch.interp(arg) for arg in self.loop.iter.args]
+        if larch.error:
+            return True
+        for arg in args:
+            if not isinstance(arg, (int, long, numpy.integer)):
+                return False
+        args = [int(arg) for arg in args]
+        if len(args) == 1:
+            args.insert(0, 0)
+        start, stop, step = (args + [1])[:3]
+        if step <= 0:
+            return False
+        npts = len(xrange(start, stop, step))
+        if npts == 0:
+            return True
+        last = start + (npts-1)*step
+
+        values = {}
+        for name, role in self.names.items():
+            try:
+                val = larch.symtable.get_symbol(name, create=False)
+            except LookupError:
+                return False
+            if role == 'func':
+                if not (isinstance(val, numpy.ufunc) or
+                        any(val is func for func in ELEMENTWISE_FUNCS)):
+                    return False
+            elif role == 'scalar':
+                if not (numpy.isscalar(val) or
+                        (isinstance(val, numpy.ndarray) and val.ndim == 0)):
+                    return False
+            else:  # role is a list of index offsets
+                if not (isinstance(val, numpy.ndarray) and val.ndim == 1 and
+                        start + min(role) >= 0 and
+                        last + max(role) < len(val)):
+                    return False
+            values[name] = val
+
+        # an array that shares memory with an array written in the loop
+        # can only be read at the loop index, and only as the same view
+        written = [values[target] for op, target, expr in self.assigns]
+        for name, role in self.names.items():
+            if not isinstance(role, list):
+                continue
+            arr = values[name]
+            for warr in written:
+                if (numpy.may_share_memory(arr, warr) and
+                    (role != [0] or not same_view(arr, warr))):
+                    return False
+
+        index = numpy.arange(start, stop, step)
+        def slice_of(offset):
+            return slice(start+offset, last+offset+1, step)
+
+        def evaluate(node):
+            if isinstance(node, ast.Num):
+                return node.n
+            elif isinstance(node, Folded):
+                return larch.interp(node)
+            elif isinstance(node, ast.Name) and node.id == self.index:
+                return index
+            elif isinstance(node, ast.Subscript):
+                return values[dotted_name(node.value)][
+                    slice_of(index_offset(node.slice, self.index))]
+            elif isinstance(node, ast.BinOp):
+                return OPERATORS[node.op.__class__](evaluate(node.left),
+                                                   evaluate(node.right))
+            elif isinstance(node, ast.UnaryOp):
+                return OPERATORS[node.op.__class__](evaluate(node.operand))
+            elif isinstance(node, ast.Call):
+                return values[dotted_name(node.func)](
+                    *[evaluate(arg) for arg in node.args])
+            return values[dotted_name(node)]
+
+        # keep copies of what will be overwritten, so that the loop can
+        # still be run by the interpreter if any statement fails
+        target = slice_of(0)
+        saved = []
+        if len(self.assigns) > 1:
+            saved = [(arr, arr[target].copy()) for arr in written]
+        try:
+            for op, name, expr in self.assigns:
+                arr = values[name]
+                val = evaluate(expr)
+                if op is not None:
+                    val = OPERATORS[op.__class__](arr[target], val)
+                arr[target] = val
+        except Exception:
+            for arr, data in reversed(saved):
+                arr[target] = data
+            return False
+        larch.node_assign(self.loop.target, last)
+        return True
+
+def same_view(arr1, arr2):
+    "do two arrays have the same data, shape and strides"
+    return (arr1.__array_interface__['data'][0] ==
+            arr2.__array_interface__['data'][0] and
+            arr1.shape == arr2.shape and arr1.strides == arr2.strides)
+
+def index_offset(node, index):
+    """offset k of an index node for 'i', 'i+k', 'k+i' or 'i-k',
+    with i the loop variable and k a number.  Returns None for
+    anything else."""
+    if not isinstance(node, ast.Index):
+        return None
+    node = node.value
+    if isinstance(node, ast.Name) and node.id == index:
+        return 0
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Add, ast.Sub)):
+        left, right = node.left, node.right
+        if (isinstance(node.op, ast.Add) and isinstance(left, ast.Num) and
+            isinstance(right, ast.Name)):
+            left, right = right, left
+        if (isinstance(left, ast.Name) and left.id == index and
+            isinstance(right, ast.Num) and isinstance(right.n, (int, long))):
+            if isinstance(node.op, ast.Sub):
+                return -right.n
+            return right.n
+    return None
+
+def analyze_loop(loop):
+    """check that a for loop has the form
+        for i in range([start,] stop[, step]):
+            a[i] = expr      (or a[i] op= expr)
+            ...
+    where expr is built from numbers, names of scalars, i, b[i+k],
+    arithmetic and calls of elementwise functions.  Returns a VectorFor
+    node, or raises NotVectorizable with the reason."""
+    if not isinstance(loop.target, ast.Name):
+        raise NotVectorizable('loop variable is not a name')
+    index = loop.target.id
+    it = loop.iter
+    if not (isinstance(it, ast.Call) and isinstance(it.func, ast.Name) and
+            it.func.id == 'range' and 1 <= len(it.args) <= 3 and
+            not it.keywords and it.starargs is None and it.kwargs is None):
+        raise NotVectorizable('not a loop over range()')
+    for arg in it.args:
+        if not is_simple(arg):
+            raise NotVectorizable('arguments of range() are not simple')
+    if loop.orelse:
+        raise NotVectorizable('loop has an else clause')
+
+    names = {}
+    def add_name(node, role):
+        name = dotted_name(node)
+        if name is None or name.split('.')[0] == index:
+            raise NotVectorizable('unsupported name')
+        known = names.setdefault(name, role)
+        if isinstance(role, list) and isinstance(known, list):
+            if role[0] not in known:
+                known.append(role[0])
+        elif known != role:
+            raise NotVectorizable("'%s' used as both array and scalar" % name)
+
+    def check_expr(node):
+        if isinstance(node, (ast.Num, Folded)):
+            return
+        elif isinstance(node, ast.Name) and node.id == index:
+            return
+        elif isinstance(node, ast.Subscript):
+            offset = index_offset(node.slice, index)
+            if offset is None:
+                raise NotVectorizable('array index is not loop variable')
+            add_name(node.value, [offset])
+        elif isinstance(node, ast.BinOp) or isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, ELEMENTWISE_OPS):
+                raise NotVectorizable("unsupported operator '%s'" %
+                                      node.op.__class__.__name__)
+            if isinstance(node, ast.BinOp):
+                check_expr(node.left)
+                check_expr(node.right)
+            else:
+                check_expr(node.operand)
+        elif isinstance(node, ast.Call):
+            if (node.keywords or node.starargs is not None or
+                node.kwargs is not None):
+                raise NotVectorizable('keyword arguments in call')
+            add_name(node.func, 'func')
+            for arg in node.args:
+                check_expr(arg)
+        elif dotted_name(node) is not None:
+            add_name(node, 'scalar')
+        else:
+            raise NotVectorizable("unsupported expression '%s'" %
+                                  node.__class__.__name__)
+
+    assigns = []
+    for stmt in loop.body:
+        if isinstance(stmt, ast.Assign) and len(stmt.targets) == 1:
+            op, target = None, stmt.targets[0]
+        elif isinstance(stmt, ast.AugAssign):
+            op, target = stmt.op, stmt.target
+            if not isinstance(op, ELEMENTWISE_OPS):
+                raise NotVectorizable("unsupported operator '%s'" %
+                                      op.__class__.__name__)
+        else:
+            raise NotVectorizable("unsupported statement '%s'" %
+                                  stmt.__class__.__name__)
+        if not (isinstance(target, ast.Subscript) and
+                index_offset(target.slice, index) == 0):
+            raise NotVectorizable('assignment is not to array[%s]' % index)
+        check_expr(stmt.value)
+        add_name(target.value, [0])
+        assigns.append((op, dotted_name(target.value), stmt.value))
+
+    # written arrays can only be read at the loop index, as
+    # a[i] = a[i-1] + ... depends on the order of evaluation
+    for op, name, expr in assigns:
+        if names[name] != [0]:
+            raise NotVectorizable("'%s' is written and read at an offset" %
+                                  name)
+    return VectorFor(loop, index, assigns, names)
+
+def vectorize_loops(tree, fname=None, lineno=0, report=None):
+    """replace elementwise for loops in a tree with VectorFor nodes.
+    The tree is modified in place and returned.  If report is given, a
+    (fname, lineno, result) tuple is appended to it for every for loop,
+    with result 'vectorized' or the reason it was not."""
+    if not HAS_NUMPY:
+        return tree
+    for node in ast.walk(tree):
+        for field, value in ast.iter_fields(node):
+            if not isinstance(value, list):
+                continue
+            for i, stmt in enumerate(value):
+                if not isinstance(stmt, ast.For):
+                    continue
+                try:
+                    value[i] = analyze_loop(stmt)
+                    result = 'vectorized'
+                except NotVectorizable, exc:
+                    result = str(exc)
+                if report is not None:
+                    report.append((fname, lineno + stmt.lineno, result))
+    return tree
+
+class Folded(ast.expr):
+    """constant expression using names from _math, made by
+    fold_constants().  The value is only valid while the names still
+    resolve to the same objects, otherwise the original expression
+    (kept in .original) is run."""
+    _fields = ('original',)
+
+    def __init__(self, original, value, names):
+        ast.expr.__init__(self)
+        self.original = original
+        self.value = value
+        self.names = names     # list of (name, value)
+        ast.copy_location(self, original)
+
+    def check(self, symtable):
+        "are all names unchanged"
+        try:
+            for name, val in self.names:
+                if symtable.get_symbol(name) is not val:
+                    return False
+        except LookupError:
+            return False
+        return True
+
+# largest string or exponent made by folding
+MAX_FOLDED_LEN = 256
+
+def is_number(val):
+    return isinstance(val, numbers.Number) or (HAS_NUMPY and
+                                                isinstance(val, numpy.number))
+
+def is_jump(node):
+    "does a block contain break, continue or return"
+    for tnode in ast.walk(node):
+        if isinstance(tnode, (ast.Break, ast.Continue, ast.Return)):
+            return True
+    return False
+
+class ConstantFolder(ast.NodeTransformer):
+    """replace expressions of constants by their values (see
+    fold_constants()).  Constants are numbers, strings, numbers in
+    mathgroup and, when called, numpy ufuncs in mathgroup."""
+    def __init__(self, mathgroup):
+        self.mathgroup = mathgroup
+
+    def constant(self, node):
+        "(value, names) for a constant node, or None"
+        if isinstance(node, ast.Num):
+            return node.n, []
+        elif isinstance(node, ast.Str):
+            return node.s, []
+        elif isinstance(node, Folded):
+            return node.value, node.names
+        return None
+
+    def make(self, node, value, names):
+        "node for a folded value, or the original node if not possible"
+        if isinstance(value, basestring):
+            if len(value) > MAX_FOLDED_LEN:
+                return node
+            new = ast.Str(s=value)
+        elif is_number(value):
+            new = ast.Num(n=value)
+        else:
+            return node
+        if names:
+            new = Folded(node, value, names)
+        return ast.copy_location(new, node)
+
+    def fold(self, node, func, *args):
+        """fold node to func(*values) if all args are constants"""
+        consts = [self.constant(arg) for arg in args]
+        if None in consts:
+            return node
+        names = []
+        for val, tnames in consts:
+            for name in tnames:
+                if name not in names:
+                    names.append(name)
+        try:
+            with numpy.errstate(all='raise'):
+                value = func(*[val for val, tnames in consts])
+        except Exception:
+            return node
+        return self.make(node, value, names)
+
+    def visit_Name(self, node):
+        if (isinstance(node.ctx, ast.Load) and
+            hasattr(self.mathgroup, node.id)):
+            value = getattr(self.mathgroup, node.id)
+            if is_number(value) or isinstance(value, numpy.ufunc):
+                return Folded(node, value, [(node.id, value)])
+        return node
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, (ast.Pow, ast.LShift)):
+            exponent = self.constant(node.right)
+            if (exponent is None or not is_number(exponent[0]) or
+                abs(exponent[0]) > MAX_FOLDED_LEN):
+                return node
+        elif isinstance(node.op, ast.Mult):
+            # a repeated string is only made if short enough to keep
+            left, right = self.constant(node.left), self.constant(node.right)
+            if left is None or right is None:
+                return node
+            left, right = left[0], right[0]
+            if isinstance(right, basestring):
+                left, right = right, left
+            if (isinstance(left, basestring) and is_number(right) and
+                len(left) * abs(right) > MAX_FOLDED_LEN):
+                return node
+        return self.fold(node, OPERATORS[node.op.__class__],
+                         node.left, node.right)
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        return self.fold(node, OPERATORS[node.op.__class__], node.operand)
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        def compare(lval, *rvals):
+            out = True
+            for oper, rval in zip(node.ops, rvals):
+                out = out and OPERATORS[oper.__class__](lval, rval)
+                lval = rval
+                if not out:
+                    break
+            return out
+        return self.fold(node, compare, node.left, *node.comparators)
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        is_and = isinstance(node.op, ast.And)
+        def boolop(*vals):
+            val = vals[0]
+            for tval in vals[1:]:
+                if (is_and and not val) or (not is_and and val):
+                    break
+                val = tval
+            return val
+        return self.fold(node, boolop, *node.values)
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        func = self.constant(node.func)
+        if (func is None or not isinstance(func[0], numpy.ufunc) or
+            node.keywords or node.starargs is not None or
+            node.kwargs is not None):
+            return node
+        return self.fold(node, lambda func, *args: func(*args),
+                         node.func, *node.args)
+
+    def visit_IfExp(self, node):
+        self.generic_visit(node)
+        test = node.test
+        if isinstance(test, ast.Num):
+            return test.n and node.body or node.orelse
+        elif isinstance(test, ast.Str):
+            return test.s and node.body or node.orelse
+        return node
+
+    def branch(self, node, loop=False):
+        """statements to replace an if (or while) node with a constant
+        test, or the node itself.  Blocks with break, continue or return
+        are kept, as statements after these still run in an if block."""
+        test = node.test
+        if not isinstance(test, (ast.Num, ast.Str)):
+            return node
+        value = test.n if isinstance(test, ast.Num) else test.s
+        if value and loop:
+            return node
+        block = value and node.body or node.orelse
+        for tnode in block:
+            if is_jump(tnode):
+                return node
+        return block
+
+    def visit_If(self, node):
+        self.generic_visit(node)
+        return self.branch(node)
+
+    def visit_While(self, node):
+        self.generic_visit(node)
+        return self.branch(node, loop=True)
+
+    def generic_visit(self, node):
+        ast.NodeTransformer.generic_visit(self, node)
+        # a body may not become empty (it can for a Procedure)
+        if getattr(node, 'body', None) == []:
+            node.body = [ast.copy_location(ast.Pass(), node)]
+        return node
+
+class RestoreNames(ast.NodeTransformer):
+    "put back single names that were not folded into any expression"
+    def visit_Folded(self, node):
+        if isinstance(node.original, ast.Name):
+            return node.original
+        return node
+
+def fold_constants(tree, mathgroup):
+    """fold constant expressions and remove constant if/while blocks
+    in a tree, which is modified in place and returned."""
+    if not HAS_NUMPY:
+        return tree
+    tree = ConstantFolder(mathgroup).visit(tree)
+    return RestoreNames().visit(tree)
+
+# number of elements of each block evaluated by a Fused node, small
+# enough for the intermediate results to stay in the CPU caches
+FUSE_BLOCK = 8192
+
+# smallest number of elements for which a Fused node is run in blocks:
+# smaller arrays are evaluated by the interpreter
+FUSE_MIN_SIZE = 65536
+
+class NotFused(Exception):
+    "raised when a Fused node must be run by the interpreter"
+
+class Fused(ast.expr):
+    """elementwise expression of arrays and scalars, made by
+    fuse_expressions().  evaluate() runs it in blocks (see run()) while
+    its names hold large arrays.  Once a run is not in blocks, as for
+    scalars, the original expression (kept in .original) is run as
+    written, until it gives a large array again:  scalar expressions
+    cost no more than unfused ones."""
+    _fields = ('original',)
+
+    def __init__(self, original, names):
+        ast.expr.__init__(self)
+        self.original = original
+        self.names = names      # {dotted name: 'func' or 'value'}
+        self.folded = [node for node in ast.walk(original)
+                       if isinstance(node, Folded)]
+        self.blocks = True      # whether to try running it in blocks
+        self.code = None        # made by build() when first run
+        ast.copy_location(self, original)
+
+    def values(self, larch):
+        """values of the names, with DefinedVariables evaluated.  Raises
+        NotFused if a name is not found, or a folded constant has
+        changed."""
+        symtable = larch.symtable
+        for node in self.folded:
+            if not node.check(symtable):
+                raise NotFused
+        values = {}
+        for name in self.names:
+            try:
+                val = symtable.get_symbol(name, create=False)
+            except LookupError:
+                raise NotFused
+            if isinstance(val, DefinedVariable):
+                val = val.evaluate()
+            values[name] = val
+        return values
+
+    def plan(self, values):
+        """how to run the expression for values:  the shape of the
+        arrays to evaluate in blocks, None to evaluate at once (for
+        scalars, small arrays and arrays of different shapes), or False
+        if the interpreter must run it"""
+        shape = None
+        for name, role in self.names.items():
+            val = values[name]
+            if role == 'func':
+                if not (isinstance(val, numpy.ufunc) or
+                        any(val is func for func in ELEMENTWISE_FUNCS)):
+                    return False
+            elif isinstance(val, numpy.ndarray) and val.ndim > 0:
+                if val.dtype.kind not in 'biufc':
+                    return False
+                if (not val.flags.c_contiguous or
+                    (shape is not None and val.shape != shape)):
+                    shape = ()
+                elif shape is None:
+                    shape = val.shape
+            elif not (is_number(val) or
+                      (isinstance(val, numpy.ndarray) and
+                       val.dtype.kind in 'biufc')):
+                return False
+        if not shape or numpy.prod(shape) < FUSE_MIN_SIZE:
+            return None
+        return shape
+
+    def build(self, node):
+        """function of the values of the names giving the value of node,
+        made once (as by the compiler module) as it is run often"""
+        if isinstance(node, ast.Num):
+            num = node.n
+            return lambda values: num
+        elif isinstance(node, Folded):
+            value = node.value
+            return lambda values: value
+        elif isinstance(node, ast.BinOp):
+            op = OPERATORS[node.op.__class__]
+            left, right = self.build(node.left), self.build(node.right)
+            return lambda values: op(left(values), right(values))
+        elif isinstance(node, ast.UnaryOp):
+            op = OPERATORS[node.op.__class__]
+            operand = self.build(node.operand)
+            return lambda values: op(operand(values))
+        elif isinstance(node, ast.Call):
+            func = dotted_name(node.func)
+            args = [self.build(arg) for arg in node.args]
+            return lambda values: values[func](*[arg(values) for arg in args])
+        name = dotted_name(node)
+        return lambda values: values[name]
+
+    def run(self, larch, nthreads=1):
+        """the value of the expression, and whether it was evaluated in
+        blocks, with nthreads threads.  Raises NotFused if the
+        interpreter must run it instead."""
+        values = self.values(larch)
+        shape = self.plan(values)
+        if shape is False:
+            raise NotFused
+        if self.code is None:
+            self.code = self.build(self.original)
+        code = self.code
+        try:
+            if shape is None:
+                return code(values), False
+            arrays = [name for name, val in values.items()
+                      if isinstance(val, numpy.ndarray) and val.ndim > 0]
+            for name in arrays:
+                values[name] = values[name].reshape(-1)
+            def block_values(block):
+                out = dict(values)
+                for name in arrays:
+                    out[name] = values[name][block]
+                return out
+            size = int(numpy.prod(shape))
+            # the type of the result, from the first element
+            first = code(block_values(slice(0, 1)))
+            out = numpy.empty(size, dtype=numpy.asarray(first).dtype)
+            def run_blocks(start, stop):
+                for i in range(start, stop, FUSE_BLOCK):
+                    block = slice(i, min(i+FUSE_BLOCK, stop))
+                    out[block] = code(block_values(block))
+            nthreads = max(1, min(nthreads, size // FUSE_BLOCK))
+            if nthreads == 1:
+                run_blocks(0, size)
+            else:
+                run_threads(run_blocks, size, nthreads)
+        except Exception:
+            raise NotFused
+        return out.reshape(shape), True
+
+    def evaluate(self, larch, original, nthreads=1):
+        """the value of the expression, run in blocks or else by
+        original() (the expression as written).  The runs in blocks, and
+        the tries that were not (fallbacks), are counted in _sys.fuse."""
+        if not self.blocks:
+            out = original()
+            if isinstance(out, numpy.ndarray) and out.size >= FUSE_MIN_SIZE:
+                self.blocks = True
+            return out
+        stats = larch.symtable._sys.fuse
+        try:
+            out, blocks = self.run(larch, nthreads=nthreads)
+        except NotFused:
+            out, blocks = None, None
+        if blocks:
+            stats.runs += 1
+            return out
+        self.blocks = False
+        stats.fallbacks += 1
+        if blocks is None:
+            out = original()
+        return out
+
+    def __reduce__(self):
+        "pickled and copied without the function run"
+        return (self.__class__, (self.original, self.names))
+
+def run_threads(run_blocks, size, nthreads):
+    """call run_blocks(start, stop) for nthreads ranges of whole blocks
+    covering range(size), each in a thread of its own"""
+    nblocks = -(-size // FUSE_BLOCK)
+    bounds = [min(size, FUSE_BLOCK*(nblocks*i // nthreads))
+              for i in range(nthreads+1)]
+    errors = []
+    def target(start, stop):
+        try:
+            run_blocks(start, stop)
+        except Exception as exc:
+            errors.append(exc)
+    threads = [threading.Thread(target=target, args=(start, stop))
+               for start, stop in zip(bounds[:-1], bounds[1:])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+class ExpressionFuser(ast.NodeTransformer):
+    """replace the largest elementwise expressions of two or more
+    operations by Fused nodes (see fuse_expressions())"""
+    def __init__(self, mathgroup):
+        ast.NodeTransformer.__init__(self)
+        self.mathgroup = mathgroup
+
+    def is_ufunc(self, name):
+        "whether name is a ufunc of _math or an elementwise builtin"
+        func = getattr(self.mathgroup, name or '', None)
+        return (isinstance(func, numpy.ufunc) or
+                any(name == efunc.__name__ for efunc in ELEMENTWISE_FUNCS))
+
+    def elementwise(self, node, names):
+        """number of operations of node if it is an elementwise
+        expression, adding the names it uses to names, or None"""
+        if isinstance(node, (ast.Num, Folded)):
+            return 0
+        elif isinstance(node, ast.BinOp):
+            if not isinstance(node.op, ELEMENTWISE_OPS):
+                return None
+            left = self.elementwise(node.left, names)
+            right = self.elementwise(node.right, names)
+            if left is None or right is None:
+                return None
+            return left + right + 1
+        elif isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, ELEMENTWISE_OPS):
+                return None
+            operand = self.elementwise(node.operand, names)
+            return None if operand is None else operand + 1
+        elif isinstance(node, ast.Call):
+            func = dotted_name(node.func)
+            if (not self.is_ufunc(func) or node.keywords or node.starargs is not None or
+                node.kwargs is not None or not node.args or
+                names.setdefault(func, 'func') != 'func'):
+                return None
+            count = 1
+            for arg in node.args:
+                nops = self.elementwise(arg, names)
+                if nops is None:
+                    return None
+                count += nops
+            return count
+        name = dotted_name(node)
+        if name is None or names.setdefault(name, 'value') != 'value':
+            return None
+        return 0
+
+    def visit(self, node):
+        if isinstance(node, ast.expr) and not isinstance(node, Fused):
+            names = {}
+            nops = self.elementwise(node, names)
+            if nops is not None and nops >= 2:
+                return Fused(node, names)
+        return ast.NodeTransformer.visit(self, node)
+
+def fuse_expressions(tree, mathgroup):
+    """replace elementwise expressions in a tree with Fused nodes.  The
+    functions called must be ufuncs in mathgroup (the _math group) or
+    ELEMENTWISE_FUNCS when the tree is parsed, and are checked again
+    when run.  The tree is
+    modified in place and returned."""
+    if not HAS_NUMPY:
+        return tree
+    return ExpressionFuser(mathgroup).visit(tree)
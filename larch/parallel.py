@@ -0,0 +1,197 @@
+'''Parallel map of Larch procedures over a pool of processes
+
+A Larch Procedure runs on the Interpreter that defined it, so it cannot
+be handed to multiprocessing as it is.  pmap() sends each worker process
+what it needs to rebuild the procedure in an Interpreter of its own:
+
+  - the procedure itself, as its argument names, keyword defaults and
+    body AST (see procedure_spec())
+  - the symbols its body uses, looked up as they would be when it runs:
+    other procedures are sent the same way, Python modules by name (to
+    be imported again), and all other values are pickled.  Symbols from
+    the _builtin and _math groups are not sent, as every Interpreter
+    has its own.
+
+The items of the sequence are mapped in chunks, and the results are
+gathered in the order of the sequence.  An item for which the procedure
+fails gives None, and with errors='raise' (the default) its error is
+added to the errors of the calling Interpreter, with the index of the
+item and the message of the worker's LarchExceptionHolder.
+
+From Larch:
+
+    pmap(proc, sequence, nworkers=None, chunksize=None, errors='raise')
+
+nworkers defaults to the number of CPUs.  With nworkers=1 the procedure
+is mapped in the calling Interpreter, without a pool, as are Python
+functions and other callables that are not Larch procedures.
+'''
+from __future__ import division, print_function
+import ast
+import sys
+import types
+import pickle
+import multiprocessing
+
+from .symboltable import Group
+from .util import Procedure
+
+# number of chunks given to each worker, when chunksize is not set
+CHUNKS_PER_WORKER = 4
+
+def procedure_spec(proc):
+    "picklable description of a Procedure, for make_procedure()"
+    return dict(name=proc.name, doc=proc.__doc__, body=proc.body,
+                fname=proc.fname, lineno=proc.lineno, defline=proc.defline,
+                args=proc.argnames, kwargs=proc.kwargs,
+                vararg=proc.vararg, varkws=proc.varkws)
+
+def make_procedure(larch, spec):
+    "Procedure for an Interpreter from a procedure_spec()"
+    from .interpreter import yield_statements
+    return Procedure(spec['name'], larch=larch, doc=spec['doc'],
+                     body=spec['body'], fname=spec['fname'],
+                     lineno=spec['lineno'], defline=spec['defline'],
+                     args=spec['args'], kwargs=spec['kwargs'],
+                     vararg=spec['vararg'], varkws=spec['varkws'],
+                     yields=yield_statements(spec['body']))
+
+def used_names(proc):
+    "names loaded by the body of a Procedure, other than its arguments"
+    local = set(proc.argnames + [key for key, val in proc.kwargs] +
+                [proc.vararg, proc.varkws])
+    names = set()
+    for node in proc.body:
+        for tnode in ast.walk(node):
+            if (isinstance(tnode, ast.Name) and
+                not isinstance(tnode.ctx, (ast.Store, ast.Param))):
+                names.add(tnode.id)
+    return sorted(names - local)
+
+def collect_symbols(larch, proc):
+    """symbols used by a procedure, and by the procedures it uses, as a
+    dict of name -> ('proc', spec), ('module', name) or ('value', value)"""
+    stable = larch.symtable
+    skip = set(stable.core_groups + (stable.top_group,))
+    defaults = (stable._builtin, stable._math)
+    out = {}
+    todo = [proc]
+    while todo:
+        tproc = todo.pop()
+        stable.save_frame()
+        stable.set_frame((Group(), tproc.modgroup))
+        try:
+            for name in used_names(tproc):
+                if name in out or name in skip:
+                    continue
+                try:
+                    val = stable.get_symbol(name)
+                except LookupError:
+                    # set in the body, or not defined at all
+                    continue
+                if any([getattr(grp, name, None) is val for grp in defaults]):
+                    continue
+                if isinstance(val, Procedure):
+                    out[name] = ('proc', procedure_spec(val))
+                    todo.append(val)
+                elif isinstance(val, types.ModuleType):
+                    out[name] = ('module', val.__name__)
+                else:
+                    out[name] = ('value', val)
+        finally:
+            stable.restore_frame()
+    return out
+
+# state of a worker process: (Interpreter, Procedure)
+_worker = None
+
+def _init_worker(payload):
+    "make the Interpreter and Procedure of a worker process"
+    global _worker
+    from .interpreter import Interpreter
+    spec, symbols = pickle.loads(payload)
+    larch = Interpreter()
+    stable = larch.symtable
+    for name, (kind, val) in symbols.items():
+        if kind == 'proc':
+            val = make_procedure(larch, val)
+        elif kind == 'module':
+            __import__(val)
+            val = sys.modules[val]
+        setattr(stable, name, val)
+    _worker = (larch, make_procedure(larch, spec))
+
+def run_items(larch, proc, items):
+    """call proc for each (index, item), giving a list of (index, True,
+    result) or, where the call fails, (index, False, error message)"""
+    out = []
+    for index, item in items:
+        larch.error = []
+        val = proc(item)
+        if larch.error:
+            err = larch.error[0]
+            msg = err.msg
+            etype, evalue = err.py_exc
+            if etype is not None:
+                msg = '%s (%s: %s)' % (msg, etype.__name__, evalue)
+            out.append((index, False, msg))
+        else:
+            out.append((index, True, val))
+    larch.error = []
+    return out
+
+def _run_chunk(items):
+    "map the procedure of a worker over a chunk of (index, item)"
+    larch, proc = _worker
+    return run_items(larch, proc, items)
+
+def pmap(larch, proc, sequence, nworkers=None, chunksize=None,
+         errors='raise'):
+    """map a Procedure over a sequence with a pool of nworkers processes,
+    giving the list of results in order (see module doc)"""
+    if errors not in ('raise', 'ignore'):
+        raise ValueError("errors must be 'raise' or 'ignore'")
+    items = list(enumerate(sequence))
+    if nworkers is None:
+        nworkers = multiprocessing.cpu_count()
+    nworkers = max(1, min(nworkers, len(items)))
+
+    if not isinstance(proc, Procedure):
+        results = [(index, True, proc(item)) for index, item in items]
+    elif proc.yields:
+        raise TypeError("pmap cannot map generator procedure '%s'"
+                        % proc.name)
+    elif nworkers == 1:
+        error = larch.error
+        try:
+            results = run_items(larch, proc, items)
+        finally:
+            larch.error = error
+    else:
+        payload = pickle.dumps((procedure_spec(proc),
+                                collect_symbols(larch, proc)),
+                               pickle.HIGHEST_PROTOCOL)
+        if chunksize is None:
+            chunksize = -(-len(items) // (nworkers*CHUNKS_PER_WORKER))
+        chunks = [items[i:i+chunksize]
+                  for i in range(0, len(items), chunksize)]
+        pool = multiprocessing.Pool(nworkers, initializer=_init_worker,
+                                    initargs=(payload,))
+        try:
+            results = []
+            for chunk in pool.imap(_run_chunk, chunks):
+                results.extend(chunk)
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    out = []
+    for index, ok, val in results:
+        if not ok:
+            if errors == 'raise':
+                larch.raise_exception(None, msg='pmap item %i: %s'
+                                      % (index, val))
+            val = None
+        out.append(val)
+    return out
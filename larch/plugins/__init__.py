@@ -1,2 +1,33 @@
-import plotter
-import shellutils
+'''Larch plugins
+
+A plugin module has a registerPlugin() function returning (group name,
+whether the group is added to the search groups, {name: symbol}).  As
+importing a plugin can be slow (plotter and shellutils import wx, and
+need a display), the groups and names of the plugins are listed here,
+and SymbolTable.AddPlugins() imports a plugin module only when one of
+its symbols is first looked up.  The names listed must be those that
+registerPlugin() gives.
+'''
+import importlib
+
+class Plugin(object):
+    """metadata of a plugin module:  its (full) module name, the group it
+    fills, whether that group is added to the search groups, and the
+    names registerPlugin() gives"""
+    def __init__(self, module, group, insearchGroup, names):
+        self.module = module
+        self.group = group
+        self.insearchGroup = insearchGroup
+        self.names = tuple(names)
+
+    def __repr__(self):
+        return "<Plugin %s: %s>" % (self.module, self.group)
+
+    def __call__(self):
+        "import the plugin module and return registerPlugin()"
+        return importlib.import_module(self.module).registerPlugin()
+
+PLUGINS = (Plugin('larch.plugins.plotter', '_plotter', True,
+                  ('plot', 'oplot', 'plotexpr', 'oplotexpr', 'imshow')),
+           Plugin('larch.plugins.shellutils', '_shell', True,
+                  ('gcd', 'fileprompt')))
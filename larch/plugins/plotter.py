@@ -8,6 +8,9 @@ Exposed functions here are
    oplot: overplot a 2D line plot on an existing Plot Frame
    imshow: display a false-color map from array data on
            a configurable Image Display Frame.
+   plotexpr, oplotexpr: as plot and oplot, for expressions (strings)
+           giving x and y:  the trace is updated when a symbol read
+           by the expressions changes (see the reactive module).
 '''
 import wx
 import time
@@ -32,6 +35,8 @@ class PlotDisplay(PlotFrame):
         self.panel.cursor_callback = self.onCursor
         self.wid = int(wid)
         self.larch = larch
+        # ReactiveNodes of traces made by plotexpr() and oplotexpr()
+        self.traces = []
         self.symname = '%s.plot%i' % (MODNAME, self.wid)
         symtable = ensuremod(self.larch)
         if symtable is not None:
@@ -39,6 +44,7 @@ class PlotDisplay(PlotFrame):
         
     def onExit(self, o, **kw):
         try:
+            self.clear_traces()
             symtable = self.larch.symtable
             if symtable.has_group(MODNAME):
                 symtable.del_symbol(self.symname)
@@ -46,6 +52,37 @@ class PlotDisplay(PlotFrame):
             pass
         self.Destroy()
 
+    def clear_traces(self):
+        "stop updating the traces made by plotexpr() and oplotexpr()"
+        for node in self.traces:
+            self.larch.reactive.remove(node)
+        self.traces = []
+
+    def add_trace(self, xexpr, yexpr, new=False, **kws):
+        """plot a trace for expressions giving x and y, over-plotting
+        unless new is True, and update it with update_line() when they
+        change"""
+        graph = self.larch.reactive
+        if graph.schedule is None:
+            graph.schedule = wx.CallAfter
+        node = graph.add([xexpr, yexpr])
+        values = node.values()
+        if values is None:
+            graph.remove(node)
+            self.larch.error.extend(node.error)
+            return
+        if new:
+            self.clear_traces()
+            trace = 0
+            self.plot(values[0], values[1], **kws)
+        else:
+            trace = self.panel.conf.ntrace
+            self.oplot(values[0], values[1], **kws)
+        def update(x, y):
+            self.update_line(trace, x, y)
+        node.update = update
+        self.traces.append(node)
+
     def onCursor(self,x=None, y=None,**kw):
         symtable = ensuremod(self.larch)
         if symtable is None:
@@ -165,6 +202,7 @@ def _plot(x,y, win=1, larch=None, parent=None, **kws):
     # print '_plot: ', win, larch, parent, kws
     plotter = _getDisplay(parent=parent, win=win, larch=larch)
     if plotter is not None:
+        plotter.clear_traces()
         plotter.plot(x, y, **kws)    
     
 def _oplot(x,y, win=1, larch=None, parent=None, **kws):
@@ -181,6 +219,38 @@ def _oplot(x,y, win=1, larch=None, parent=None, **kws):
     if plotter is not None:
         plotter.oplot(x, y, **kws)
 
+def _plotexpr(xexpr, yexpr, win=1, larch=None, parent=None, **kws):
+    """plotexpr(xexpr, yexpr[, win=1], options])
+
+    Plot 2-D trace of the values of the expressions xexpr and yexpr
+    (strings, as 'energy' and 'mu/norm') in a Plot Frame, clearing any
+    plot currently in the Plot Frame.  When a symbol that the
+    expressions read changes, the trace is updated in place.
+
+    Options are as for plot.
+
+    See Also:
+    -----------
+    plot, oplotexpr
+    """
+    plotter = _getDisplay(parent=parent, win=win, larch=larch)
+    if plotter is not None:
+        plotter.add_trace(xexpr, yexpr, new=True, **kws)
+
+def _oplotexpr(xexpr, yexpr, win=1, larch=None, parent=None, **kws):
+    """oplotexpr(xexpr, yexpr[, win=1], options])
+
+    Over-plot a 2-D trace of the values of the expressions xexpr and
+    yexpr, updated in place when a symbol they read changes.
+
+    See Also:
+    -----------
+    plotexpr, oplot
+    """
+    plotter = _getDisplay(parent=parent, win=win, larch=larch)
+    if plotter is not None:
+        plotter.add_trace(xexpr, yexpr, **kws)
+
 def _imshow(map, win=1, larch=None, parent=None, **kws):
     """imshow(map[, options])
     
@@ -195,6 +265,8 @@ def _imshow(map, win=1, larch=None, parent=None, **kws):
 def registerPlugin():
     return (MODNAME, True, {'plot':_plot,
                             'oplot': _oplot,
+                            'plotexpr': _plotexpr,
+                            'oplotexpr': _oplotexpr,
                             'imshow':_imshow}
             )
 
@@ -0,0 +1,258 @@
+'''Profiler for Larch code
+
+cProfile only sees the Python functions of the interpreter, so the time
+spent in a Larch script shows up as Interpreter.interp() and on_xxx()
+recursion.  The Profiler here times Larch statements instead, by the
+file name and line number that the interpreter already carries, and
+Larch Procedures by name.  For each it counts calls, own time (tottime,
+not counting the statements or procedures run inside it), total time
+(cumtime) and the size of new numpy arrays made by its expressions.
+
+The profiler is switched on with Interpreter.profile_on(), which adds
+its methods as Interpreter hooks (see Interpreter.add_hook()), and
+switched off with profile_off(), which removes them.  When it is off
+nothing is timed.  From Larch, use the builtins
+
+    profile_on()
+    profile_off()
+    profile_report(sort='tottime', limit=20, procedures=False,
+                   output=None, format='text')
+
+The report can be sorted by 'ncalls', 'tottime', 'cumtime', 'bytes'
+or 'line', and written to a file in 'pstats' format (to be read with
+pstats.Stats()) or 'callgrind' format (for kcachegrind).
+
+With use_compiler=True, statements inside a compiled loop or if block
+do not run the hooks: their time is counted for the enclosing
+statement, and the arrays they make are not counted.
+'''
+from __future__ import division, print_function
+import ast
+import marshal
+from timeit import default_timer
+try:
+    import numpy
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+# expressions whose array results are new arrays (rather than
+# existing arrays, as for names, attributes and subscripts)
+ALLOC_NODES = (ast.BinOp, ast.UnaryOp, ast.Call, ast.Compare, ast.ListComp)
+
+SORT_KEYS = ('ncalls', 'tottime', 'cumtime', 'bytes', 'line')
+
+MODULE = '<module>'
+STDIN = '<StdInput>'
+
+class Stats(object):
+    "timing of one statement or procedure"
+    __slots__ = ('ncalls', 'tottime', 'cumtime', 'bytes', 'active',
+                 'func', 'callers')
+
+    def __init__(self, func=MODULE):
+        self.ncalls = 0
+        self.tottime = 0.0
+        self.cumtime = 0.0
+        self.bytes = 0
+        self.active = 0
+        self.func = func
+        self.callers = {}
+
+class Profiler(object):
+    """collect timings of Larch statements and procedures for one
+    Interpreter (see module doc)"""
+
+    def __init__(self, larch, timer=default_timer):
+        self.larch = larch
+        self.timer = timer
+        self.hooks = (('statement', self.statement),
+                      ('statement_done', self.statement_done),
+                      ('call', self.call), ('return', self.ret),
+                      ('value', self.value))
+        self.clear()
+
+    def clear(self):
+        "drop all timings"
+        # statements: (fname, lineno) -> Stats
+        # procedures: (fname, lineno, name) -> Stats
+        self.lines = {}
+        self.procs = {}
+        # running statements: [Stats, start time, child time, bytes]
+        self.stack = []
+        # running procedures: [key, start time, child time, start bytes]
+        self.proc_stack = []
+        self.total_bytes = 0
+
+    def start(self):
+        "add the hooks to the interpreter"
+        self.stop()
+        for event, hook in self.hooks:
+            self.larch.add_hook(event, hook)
+
+    def stop(self):
+        """remove the hooks from the interpreter, counting the running
+        statements and procedures as done"""
+        for event, hook in self.hooks:
+            self.larch.remove_hook(event, hook)
+        while self.stack:
+            self.statement_done(None, None, None, None)
+        while self.proc_stack:
+            self.ret(None, None, None, None)
+
+    def statement(self, node, fname, lineno, arg):
+        "start timing a statement"
+        key = (fname or STDIN, lineno)
+        try:
+            stats = self.lines[key]
+        except KeyError:
+            stats = self.lines[key] = Stats()
+            if self.proc_stack:
+                stats.func = self.proc_stack[-1][0][2]
+        stats.active += 1
+        self.stack.append([stats, self.timer(), 0.0, 0])
+
+    def statement_done(self, node, fname, lineno, arg):
+        "stop timing a statement"
+        if not self.stack:
+            return
+        stats, t0, child, nbytes = self.stack.pop()
+        dtime = self.timer() - t0
+        stats.active -= 1
+        stats.ncalls += 1
+        stats.tottime += dtime - child
+        stats.bytes += nbytes
+        if stats.active == 0:
+            stats.cumtime += dtime
+        if self.stack:
+            self.stack[-1][2] += dtime
+
+    def value(self, node, fname, lineno, arg):
+        "count new arrays"
+        if (HAS_NUMPY and isinstance(node, ALLOC_NODES) and
+            isinstance(arg, numpy.ndarray) and arg.base is None):
+            self.total_bytes += arg.nbytes
+            if self.stack:
+                self.stack[-1][3] += arg.nbytes
+
+    def call(self, proc, fname, lineno, arg):
+        "start timing a call of a Procedure"
+        key = (fname or STDIN, lineno, proc.name)
+        try:
+            stats = self.procs[key]
+        except KeyError:
+            stats = self.procs[key] = Stats(func=proc.name)
+        caller = MODULE
+        if self.proc_stack:
+            caller = self.proc_stack[-1][0]
+        stats.callers[caller] = stats.callers.get(caller, 0) + 1
+        stats.active += 1
+        self.proc_stack.append([key, self.timer(), 0.0, self.total_bytes])
+
+    def ret(self, proc, fname, lineno, arg):
+        "stop timing a call of a Procedure"
+        if not self.proc_stack:
+            return
+        key, t0, child, nbytes = self.proc_stack.pop()
+        dtime = self.timer() - t0
+        stats = self.procs[key]
+        stats.active -= 1
+        stats.ncalls += 1
+        stats.tottime += dtime - child
+        stats.bytes += self.total_bytes - nbytes
+        if stats.active == 0:
+            stats.cumtime += dtime
+        if self.proc_stack:
+            self.proc_stack[-1][2] += dtime
+
+    def sorted(self, sort='tottime', procedures=False):
+        "list of (key, Stats), sorted for a report"
+        if sort not in SORT_KEYS:
+            raise ValueError("sort must be one of %s" % ', '.join(SORT_KEYS))
+        table = procedures and self.procs or self.lines
+        items = list(table.items())
+        if sort == 'line':
+            items.sort(key=lambda item: item[0])
+        else:
+            items.sort(key=lambda item: getattr(item[1], sort), reverse=True)
+        return items
+
+    def report(self, sort='tottime', limit=20, procedures=False):
+        "text report of the slowest statements or procedures"
+        items = self.sorted(sort=sort, procedures=procedures)
+        if limit is not None:
+            items = items[:limit]
+        label = procedures and 'procedure' or 'line'
+        out = ['%9s %10s %10s %12s  %s' % ('ncalls', 'tottime', 'cumtime',
+                                           'bytes', label)]
+        for key, stats in items:
+            if procedures:
+                where = '%s (%s:%i)' % (key[2], key[0], key[1])
+            else:
+                where = '%s:%i (%s)' % (key[0], key[1], stats.func)
+            out.append('%9i %10.4f %10.4f %12i  %s' % (stats.ncalls,
+                                                       stats.tottime,
+                                                       stats.cumtime,
+                                                       stats.bytes, where))
+        return '\n'.join(out)
+
+    def pstats(self):
+        """timings in the form of pstats.Stats().stats: statements are
+        given as functions named 'line <n>' of their procedure"""
+        out = {}
+        for (fname, lineno), stats in self.lines.items():
+            func = (fname, lineno, 'line %i of %s' % (lineno, stats.func))
+            out[func] = (stats.ncalls, stats.ncalls, stats.tottime,
+                         stats.cumtime, {})
+        for key, stats in self.procs.items():
+            callers = {}
+            for caller, ncalls in stats.callers.items():
+                if caller == MODULE:
+                    caller = ('~', 0, MODULE)
+                callers[caller] = ncalls
+            func = key
+            out[func] = (stats.ncalls, stats.ncalls, stats.tottime,
+                         stats.cumtime, callers)
+        return out
+
+    def write_pstats(self, fname):
+        "write timings to a file that pstats.Stats(fname) can read"
+        with open(fname, 'wb') as fh:
+            marshal.dump(self.pstats(), fh)
+
+    def write_callgrind(self, fname):
+        """write timings to a callgrind file, with times in
+        microseconds and allocated bytes"""
+        funcs = {}
+        for (fn, lineno), stats in self.lines.items():
+            funcs.setdefault((fn, stats.func), []).append((lineno, stats))
+        out = ['# callgrind format', 'events: usec bytes', '']
+        for (fn, func), lines in sorted(funcs.items()):
+            out.append('fl=%s' % fn)
+            out.append('fn=%s' % func)
+            for lineno, stats in sorted(lines):
+                out.append('%i %i %i' % (lineno, int(1.e6*stats.tottime),
+                                         stats.bytes))
+            for key, stats in sorted(self.procs.items()):
+                ncalls = stats.callers.get(MODULE, 0)
+                if func != MODULE:
+                    ncalls = sum([n for caller, n in stats.callers.items()
+                                  if caller != MODULE and caller[2] == func])
+                if ncalls > 0:
+                    out.append('cfl=%s' % key[0])
+                    out.append('cfn=%s' % key[2])
+                    out.append('calls=%i %i' % (ncalls, key[1]))
+                    out.append('%i %i %i' % (key[1], int(1.e6*stats.cumtime),
+                                             stats.bytes))
+            out.append('')
+        with open(fname, 'w') as fh:
+            fh.write('\n'.join(out))
+
+    def write(self, fname, format='pstats'):
+        "write timings to a file in 'pstats' or 'callgrind' format"
+        if format == 'pstats':
+            self.write_pstats(fname)
+        elif format == 'callgrind':
+            self.write_callgrind(fname)
+        else:
+            raise ValueError("format must be 'pstats' or 'callgrind'")
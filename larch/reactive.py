@@ -0,0 +1,180 @@
+'''Reactive recomputation of values that depend on symbols
+
+A ReactiveGraph holds nodes, each a list of Larch expressions and an
+update function.  A node watches the symbols its expressions read (see
+symbol_dependencies() in util), and when one of them is set or deleted
+in a Group, the node is marked dirty.  Dirty nodes are evaluated again
+together, and their values passed to update(*values), when the graph
+is flushed:
+
+  - by the function given as schedule, which is called with flush()
+    when the first node is marked, and should arrange for it to be
+    called later (as wx.CallAfter() does, at the next turn of the event
+    loop), so that many changes give a single update
+  - otherwise, by Interpreter.eval() or push() once the statement
+    being run is done.
+
+The defined variables that the expressions of a node use get nodes of
+their own, which provide their names.  A flush evaluates the nodes in
+order, with each node after the nodes providing names that it reads,
+so that a defined variable is evaluated once (and kept, see
+DefinedVariable) before the nodes reading it.  The plotter plugin uses
+nodes for the traces made by plotexpr() and oplotexpr().
+
+Nodes are evaluated in the top frame.  An error leaves the node with
+its last values:  the errors are kept as node.error, and are not added
+to those of the Interpreter.
+'''
+import threading
+
+from .symboltable import watch_names, unwatch_names
+from .util import DefinedVariable, read_names, symbol_dependencies
+
+class ReactiveNode(object):
+    """expressions evaluated again when a symbol they read changes,
+    giving their values to update(*values).  provides is the name of
+    the symbol the node keeps up to date, if any."""
+    def __init__(self, graph, exprs, update=None, provides=None):
+        self.graph = graph
+        self.exprs = list(exprs)
+        self.update = update
+        self.provides = provides
+        larch = graph.larch
+        self.asts = [larch.compile(expr) for expr in self.exprs]
+        self.names = read_names([tree for tree in self.asts
+                                 if tree is not None])
+        self.depends = set()
+        self.error = []
+        self.updates = 0
+
+    def __repr__(self):
+        return "<ReactiveNode: %s>" % ', '.join(self.exprs)
+
+    def changed(self, name):
+        "a symbol the node depends on was set or deleted"
+        self.graph.mark(self)
+
+    def watch(self):
+        "watch the symbols the expressions depend on now"
+        depends = symbol_dependencies(self.graph.larch.symtable, self.names)
+        unwatch_names(self, self.depends - depends)
+        watch_names(self, depends)
+        self.depends = depends
+
+    def values(self):
+        """evaluate the expressions in the top frame, giving the list of
+        values, or None on errors (kept as self.error)"""
+        larch = self.graph.larch
+        stable = larch.symtable
+        stable.save_frame()
+        stable.set_frame((stable, stable))
+        nerrors = len(larch.error)
+        try:
+            self.watch()
+            out = [larch.interp(tree, expr=expr)
+                   for tree, expr in zip(self.asts, self.exprs)]
+        finally:
+            stable.restore_frame()
+        self.error = larch.error[nerrors:]
+        if self.error:
+            del larch.error[nerrors:]
+            return None
+        return out
+
+    def recompute(self):
+        "evaluate the expressions, and pass their values to update()"
+        values = self.values()
+        if values is None:
+            return False
+        self.updates += 1
+        if self.update is not None:
+            self.update(*values)
+        return True
+
+class ReactiveGraph(object):
+    """nodes recomputed when the symbols they read change (see module
+    doc).  flushes counts the flushes that recomputed nodes."""
+    def __init__(self, larch, schedule=None):
+        self.larch = larch
+        self.schedule = schedule
+        self.nodes = []
+        self.dirty = set()
+        self.pending = False
+        self.flushes = 0
+        self._lock = threading.Lock()
+
+    def add(self, exprs, update=None, provides=None):
+        """add a node for a list of expressions, giving its values to
+        update(*values) when they change.  The node is not evaluated
+        until it is marked or flushed (use node.values() to evaluate it
+        now)."""
+        node = ReactiveNode(self, exprs, update=update, provides=provides)
+        with self._lock:
+            self.nodes.append(node)
+        node.watch()
+        self.add_providers(node)
+        return node
+
+    def remove(self, node):
+        "remove a node"
+        unwatch_names(node, node.depends)
+        with self._lock:
+            if node in self.nodes:
+                self.nodes.remove(node)
+            self.dirty.discard(node)
+
+    def add_providers(self, node):
+        "add nodes for the defined variables a node uses"
+        stable = self.larch.symtable
+        provided = set([tnode.provides for tnode in self.nodes])
+        for name in sorted(node.depends - provided):
+            try:
+                val = stable.get_symbol(name)
+            except (LookupError, ValueError):
+                continue
+            if isinstance(val, DefinedVariable):
+                self.add([name], provides=name)
+
+    def mark(self, node):
+        "mark a node as needing to be recomputed"
+        with self._lock:
+            self.dirty.add(node)
+            if self.pending or self.schedule is None:
+                return
+            self.pending = True
+        self.schedule(self.flush)
+
+    def order(self, nodes):
+        """nodes in the order they are to be recomputed:  each after the
+        nodes providing names that it depends on, and otherwise in the
+        order they were added"""
+        rank = dict((id(node), i) for i, node in enumerate(self.nodes))
+        nodes = sorted(nodes, key=lambda node: rank.get(id(node), -1))
+        providers = dict((node.provides, node) for node in nodes
+                         if node.provides is not None)
+        out, done = [], set()
+        def visit(node, path):
+            if id(node) in done or id(node) in path:
+                return
+            path.add(id(node))
+            for name in sorted(node.depends):
+                if name in providers and providers[name] is not node:
+                    visit(providers[name], path)
+            done.add(id(node))
+            out.append(node)
+        for node in nodes:
+            visit(node, set())
+        return out
+
+    def flush(self):
+        "recompute the dirty nodes, giving the number recomputed"
+        with self._lock:
+            dirty, self.dirty = self.dirty, set()
+            self.pending = False
+            nodes = [node for node in self.order(dirty)
+                     if node in self.nodes]
+        for node in nodes:
+            node.recompute()
+        if nodes:
+            self.flushes += 1
+        return len(nodes)
@@ -0,0 +1,255 @@
+'''Saving and restoring the symbol table of a session
+
+save_session(dirname, larch) writes the groups of the symbol table, and
+the larch modules in _sys.modules, to a directory:
+
+    dirname/session.pkl      the groups and their members, pickled
+    dirname/arrays/N.npy     arrays of at least MIN_ARRAY_BYTES
+
+The arrays are saved uncompressed with numpy.save, so that
+load_session() can map them into memory (copy-on-write) instead of
+reading them:  the data of an array is only read from disk as it is
+used, and a session holding gigabytes of arrays is restored in about
+the time it takes to unpickle the rest.  Arrays written to after a
+restore keep their changes in memory, and the files are not changed.
+
+Some members cannot be saved as they are, and are made again on
+restore:
+
+  - Procedures, from their parsed body and arguments, in their module
+  - DefinedVariables, from their expression
+  - Python modules, by importing them again
+  - the Interpreter (as bound to builtins and plugins) and its symbol
+    table, which become those restoring the session.
+
+The core groups (_sys, _builtin, _math) and the groups of plugins
+(LazyGroups) belong to the Interpreter, and are not saved.  Members
+that cannot be pickled (as open files) are left out, and their names
+returned by save_session().  An existing directory is only replaced if
+it holds a saved session.
+'''
+from __future__ import print_function
+import io
+import os
+import types
+import shutil
+import tempfile
+import importlib
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    import numpy
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+from .symboltable import Group, LazyGroup
+from .util import Procedure, DefinedVariable
+from .parallel import procedure_spec, make_procedure
+
+SESSION_VERSION = 1
+MAGIC = 'LARCHSESSION%i' % SESSION_VERSION
+SESSION_FILE = 'session.pkl'
+ARRAY_DIR = 'arrays'
+
+# smaller arrays are pickled with the groups holding them
+MIN_ARRAY_BYTES = 65536
+
+# pickling protocol 2 would give these back uninitialized
+UNSAVED_TYPES = (io.IOBase,)
+try:
+    UNSAVED_TYPES = UNSAVED_TYPES + (file,)
+except NameError:
+    pass
+
+class NullFile(object):
+    "file-like sink for trial pickling"
+    def write(self, data):
+        pass
+
+class SessionWriter(object):
+    """writes the groups of a symbol table (see module doc).  The groups
+    are copied, leaving out members that cannot be pickled, and the
+    copies pickled, with large arrays, procedures, defined variables and
+    modules given as persistent ids."""
+    def __init__(self, larch, dirname, min_bytes=MIN_ARRAY_BYTES):
+        self.larch = larch
+        self.dirname = dirname
+        self.min_bytes = min_bytes
+        self.copies = {}        # id(group) -> (group, copy)
+        self.arrays = {}        # id(array) -> (array, file name)
+        self.skipped = []
+
+    def persistent_id(self, obj):
+        if obj is self.larch:
+            return ('larch',)
+        elif obj is self.larch.symtable:
+            return ('symtable',)
+        elif isinstance(obj, UNSAVED_TYPES):
+            raise pickle.PicklingError("cannot save %r" % (obj,))
+        elif isinstance(obj, types.ModuleType):
+            return ('module', obj.__name__)
+        elif isinstance(obj, Procedure):
+            modgroup = obj.modgroup
+            if modgroup is not self.larch.symtable:
+                modgroup = self.copy(modgroup, modgroup.__name__)
+            return ('procedure', procedure_spec(obj), modgroup)
+        elif isinstance(obj, DefinedVariable):
+            return ('definedvar', obj.expr, obj.cache)
+        elif (HAS_NUMPY and type(obj) in (numpy.ndarray, numpy.memmap) and
+              not obj.dtype.hasobject and obj.nbytes >= self.min_bytes):
+            return ('array', self.save_array(obj))
+        return None
+
+    def save_array(self, arr):
+        "save an array once, returning its file name"
+        if id(arr) not in self.arrays:
+            fname = '%i.npy' % len(self.arrays)
+            numpy.save(os.path.join(self.dirname, ARRAY_DIR, fname), arr)
+            self.arrays[id(arr)] = (arr, fname)
+        return self.arrays[id(arr)][1]
+
+    def pickler(self, outf):
+        pickler = pickle.Pickler(outf, pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = self.persistent_id
+        return pickler
+
+    def picklable(self, obj):
+        "whether obj can be pickled"
+        try:
+            self.pickler(NullFile()).dump(obj)
+        except Exception:
+            return False
+        return True
+
+    def copy(self, group, path):
+        """copy of a group with the members that can be pickled, and
+        copies of its subgroups.  Groups are copied once, so that groups
+        found in several places stay shared."""
+        if group is None:
+            return None
+        if id(group) in self.copies:
+            return self.copies[id(group)][1]
+        out = Group(name=group.__name__)
+        self.copies[id(group)] = (group, out)
+        for name, val in group._publicmembers().items():
+            fullname = '%s.%s' % (path, name)
+            if isinstance(val, LazyGroup):
+                continue
+            elif type(val) is Group:
+                val = self.copy(val, fullname)
+            elif not self.picklable(val):
+                self.skipped.append(fullname)
+                continue
+            out.__dict__[name] = val
+        return out
+
+    def write(self):
+        "write the session, returning the names of members left out"
+        symtable = self.larch.symtable
+        top = Group(name=symtable.top_group)
+        for name, val in symtable._publicmembers().items():
+            if (name in symtable.core_groups or name == symtable.top_group
+                or isinstance(val, LazyGroup)):
+                continue
+            if type(val) is Group:
+                val = self.copy(val, name)
+            elif not self.picklable(val):
+                self.skipped.append(name)
+                continue
+            top.__dict__[name] = val
+        modules = {}
+        for name, mod in symtable._sys.modules.items():
+            if type(mod) is Group and name not in symtable.core_groups:
+                modules[name] = self.copy(mod, name)
+        with open(os.path.join(self.dirname, SESSION_FILE), 'wb') as outf:
+            pickle.dump(MAGIC, outf, pickle.HIGHEST_PROTOCOL)
+            self.pickler(outf).dump({'main': top, 'modules': modules})
+        return self.skipped
+
+def is_session(dirname):
+    "whether dirname is a directory holding a saved session"
+    try:
+        with open(os.path.join(dirname, SESSION_FILE), 'rb') as inf:
+            return pickle.load(inf) == MAGIC
+    except Exception:
+        return False
+
+def default_mode():
+    "mode of a new directory, as given by the umask"
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o777 & ~umask
+
+def save_session(dirname, larch, min_bytes=MIN_ARRAY_BYTES):
+    """save the groups of the symbol table of larch to a directory (see
+    module doc), replacing any session saved there.  Raises ValueError
+    if dirname exists and is not a session.  Returns the list of the
+    names of the members that could not be saved."""
+    dirname = os.path.abspath(dirname)
+    if os.path.exists(dirname) and not is_session(dirname):
+        raise ValueError("'%s' exists and is not a larch session" % dirname)
+    parent = os.path.dirname(dirname)
+    tmpdir = tempfile.mkdtemp(prefix='.larchsession', dir=parent)
+    try:
+        os.mkdir(os.path.join(tmpdir, ARRAY_DIR))
+        skipped = SessionWriter(larch, tmpdir, min_bytes=min_bytes).write()
+        # arrays of a session restored from dirname are mapped from its
+        # files:  these are removed, but stay in use until unmapped
+        if os.path.exists(dirname):
+            shutil.rmtree(dirname)
+        os.rename(tmpdir, dirname)
+    except:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+    # mkdtemp() makes directories only their owner can read
+    os.chmod(dirname, default_mode())
+    return skipped
+
+def load_session(dirname, larch):
+    """restore the groups saved by save_session() into the symbol table
+    of larch, replacing members of the same names.  Arrays are mapped
+    from their files (see module doc)."""
+    dirname = os.path.abspath(dirname)
+    arrays = {}
+    def persistent_load(pid):
+        kind = pid[0]
+        if kind == 'larch':
+            return larch
+        elif kind == 'symtable':
+            return larch.symtable
+        elif kind == 'module':
+            return importlib.import_module(pid[1])
+        elif kind == 'procedure':
+            proc = make_procedure(larch, pid[1])
+            proc.modgroup = pid[2]
+            return proc
+        elif kind == 'definedvar':
+            return DefinedVariable(expr=pid[1], larch=larch, cache=pid[2])
+        elif kind == 'array':
+            if pid[1] not in arrays:
+                arrays[pid[1]] = numpy.load(os.path.join(dirname, ARRAY_DIR,
+                                                         pid[1]),
+                                            mmap_mode='c')
+            return arrays[pid[1]]
+        raise pickle.UnpicklingError("unknown object in session: %r" %
+                                     (pid,))
+
+    with open(os.path.join(dirname, SESSION_FILE), 'rb') as inf:
+        if pickle.load(inf) != MAGIC:
+            raise ValueError("'%s' is not a larch session" % dirname)
+        unpickler = pickle.Unpickler(inf)
+        unpickler.persistent_load = persistent_load
+        data = unpickler.load()
+
+    symtable = larch.symtable
+    top = data['main']
+    with symtable.write_lock():
+        for name, val in top.__dict__.items():
+            if name != '__name__':
+                setattr(symtable, name, val)
+        symtable._sys.modules.update(data['modules'])
+    symtable.clear_lookup_cache()
+    return sorted([name for name in top.__dict__ if name != '__name__'])
@@ -5,8 +5,12 @@ from __future__ import print_function
 import os
 import sys
 import types
+import threading
+import weakref
 from contextlib import contextmanager
-from .closure import Closure
+from .closure import bind_call
+from .plugins import Plugin
+from .context import ContextState, ContextAttr
 from . import site_config
 try:
     import numpy
@@ -14,6 +18,43 @@ try:
 except ImportError:
     HAS_NUMPY = False
 
+# objects watching symbol names:  name -> WeakSet of objects with a
+# changed(name) method, called when a member of that name of any Group
+# is set or deleted.  The local frames of procedures are not watched.
+_watchers = {}
+
+def watch_names(watcher, names):
+    "call watcher.changed(name) when a Group member of one of names changes"
+    for name in names:
+        if name not in _watchers:
+            _watchers.setdefault(name, weakref.WeakSet())
+        _watchers[name].add(watcher)
+
+def unwatch_names(watcher, names):
+    "stop watching names with watcher"
+    for name in names:
+        watchers = _watchers.get(name)
+        if watchers is not None:
+            watchers.discard(watcher)
+
+def notify_change(name):
+    "tell the watchers of name that it was set or deleted"
+    watchers = _watchers.get(name)
+    if watchers:
+        for watcher in list(watchers):
+            watcher.changed(name)
+
+# symbol tables caching the group each name was found in (see
+# SymbolTable._lookup):  name -> WeakSet of symbol tables.  Setting or
+# deleting a member of that name in another group may hide or reveal
+# it, so drops the cached entry.
+_lookup_caches = {}
+
+def forget_lookup(group, name):
+    "drop cached lookups of name that a change to group may affect"
+    for symtable in list(_lookup_caches.get(name, ())):
+        symtable._forget_lookup(name, group)
+
 def isgroup(grp):
     "tests if input is a Group"
     return isinstance(grp, Group)
@@ -48,6 +89,18 @@ class Group(object):
     def __setattr__(self, attr, val):
         """set group attributes."""
         self.__dict__[attr] = val
+        if attr in _lookup_caches:
+            forget_lookup(self, attr)
+        if attr in _watchers:
+            notify_change(attr)
+
+    def __delattr__(self, attr):
+        """delete group attributes."""
+        object.__delattr__(self, attr)
+        if attr in _lookup_caches:
+            forget_lookup(self, attr)
+        if attr in _watchers:
+            notify_change(attr)
 
     def __dir__(self):
         "return sorted list of names of member"
@@ -94,6 +147,10 @@ class GroupAlias(Group):
     def __setattr__(self, attr, val):
         """set group attributes."""
         setattr(self.obj, attr, val)
+        if attr in _lookup_caches:
+            forget_lookup(self, attr)
+        if attr in _watchers:
+            notify_change(attr)
 
     def __getattr__(self, attr, default=None):
         '''get group attributes by punting to underlying object.'''
@@ -135,6 +192,220 @@ class GroupAlias(Group):
                 r[key] = self.obj.__dict__[key]
         return r
 
+# held while deferred members of LazyGroups are made or replaced.  It is
+# shared by all LazyGroups, as a load() may look up members of others.
+_load_lock = threading.RLock()
+
+class LazyGroup(Group):
+    """LazyGroup: a Group whose members can be made when first looked up.
+
+    _defer(names, load) adds members that are made by load(name) the first
+    time they are looked up (as with getattr or hasattr), so that groups
+    with many members, such as _math and _builtin, are quick to create.
+    Deferred members are listed by dir() like others, and are all made
+    by _members() and _publicmembers().
+    """
+    def __init__(self, name=None, **kws):
+        self.__dict__['_LazyGroup__deferred'] = {}
+        Group.__init__(self, name=name, **kws)
+
+    def _defer(self, names, load):
+        "make the members names with load(name) when they are looked up"
+        self.__deferred.update(dict.fromkeys(names, load))
+
+    def _load_all(self):
+        "make all deferred members"
+        for name in list(self.__deferred):
+            getattr(self, name, None)
+
+    def _resolve(self, values):
+        """set the members in a dictionary of values that are still
+        deferred, as for a load() that makes several members at once"""
+        with _load_lock:
+            for name, val in values.items():
+                if name in self.__deferred:
+                    self.__dict__[name] = val
+                    del self.__deferred[name]
+
+    def __getattr__(self, attr):
+        with _load_lock:
+            deferred = self.__dict__.get('_LazyGroup__deferred')
+            load = deferred.get(attr) if deferred else None
+            if load is None:
+                if attr in self.__dict__:    # made by another thread
+                    return self.__dict__[attr]
+                raise AttributeError("group has no member '%s'" % attr)
+            # the member stays deferred until it is made, so that other
+            # threads looking it up wait for it
+            val = load(attr)
+            if deferred.get(attr) is load:
+                self.__dict__[attr] = val
+                del deferred[attr]
+            return self.__dict__.get(attr, val)
+
+    def __setattr__(self, attr, val):
+        """set group attributes."""
+        with _load_lock:
+            self.__deferred.pop(attr, None)
+            Group.__setattr__(self, attr, val)
+
+    def __delattr__(self, attr):
+        """delete group attributes."""
+        with _load_lock:
+            if self.__deferred.pop(attr, None) is None:
+                Group.__delattr__(self, attr)
+                return
+            self.__dict__.pop(attr, None)
+        if attr in _lookup_caches:
+            forget_lookup(self, attr)
+        if attr in _watchers:
+            notify_change(attr)
+
+    def __dir__(self):
+        "return sorted list of names of member"
+        return sorted([key for key in Group.__dir__(self)
+                       if key != '_LazyGroup__deferred'] +
+                      list(self.__deferred))
+
+    def _subgroups(self):
+        "return sorted list of names of members that are sub groups"
+        self._load_all()
+        return Group._subgroups(self)
+
+    def _members(self):
+        "sorted member list"
+        self._load_all()
+        return [key for key in Group._members(self)
+                if key != '_LazyGroup__deferred']
+
+    def _publicmembers(self):
+        "sorted member list"
+        self._load_all()
+        out = Group._publicmembers(self)
+        out.pop('_LazyGroup__deferred', None)
+        return out
+
+class LocalFrame(Group):
+    """LocalFrame: local group for a call of a Procedure.
+
+    Subclasses made by frame_class() have __slots__ for the argument
+    names of a procedure, so that a call does not need to create and
+    fill an instance dict.  Other names set while the procedure runs
+    go into the instance dict, as for a Group.
+    """
+    __slots__ = ('__name__',)
+    __setattr__ = object.__setattr__
+    _argnames = ()
+
+    def __init__(self, name=None):
+        self.__name__ = name
+
+    def _vars(self):
+        "dictionary of all members, including slots"
+        out = dict(self.__dict__)
+        for key in self._argnames:
+            if hasattr(self, key):
+                out[key] = getattr(self, key)
+        return out
+
+    def __dir__(self):
+        "return sorted list of names of member"
+        return sorted([key for key in self._vars()
+                       if (not key.startswith('_Group__') and
+                           not key.startswith('_SymbolTable__') and
+                           not key == '_main' and
+                           not key == '__name__')])
+
+    def _subgroups(self):
+        "return sorted list of names of members that are sub groups"
+        return sorted([k for k, v in self._vars().items() if isgroup(v)])
+
+    def _members(self):
+        "sorted member list"
+        return sorted(self._vars())
+
+    def _publicmembers(self):
+        "sorted member list"
+        return dict([(key, val) for key, val in self._vars().items()
+                     if not (key.startswith('_Group__') or
+                             key.startswith('_SymbolTable__') or
+                             key == '_main' or key == '__name__')])
+
+_frame_classes = {}
+
+def frame_class(names):
+    """return a LocalFrame subclass with slots for a list of names,
+    shared by all procedures with the same argument names"""
+    slots = []
+    for name in names:
+        if (name is not None and not name.startswith('__') and
+            name not in slots):
+            slots.append(name)
+    slots = tuple(slots)
+    if slots not in _frame_classes:
+        _frame_classes[slots] = type('LocalFrame', (LocalFrame,),
+                                     {'__slots__': slots,
+                                      '_argnames': slots})
+    return _frame_classes[slots]
+
+def plugin_loader(group, plugin, kws):
+    """load(name) for the deferred members of the group of a Plugin:  it
+    imports the plugin module, sets all of its symbols in group (bound
+    to kws), and returns the one named"""
+    def load(name):
+        values = {}
+        for key, val in plugin()[2].items():
+            if callable(val):
+                val = bind_call(val, **kws)
+            values[key] = val
+        if name not in values:
+            raise AttributeError("plugin %s has no member '%s'" %
+                                 (plugin.module, name))
+        group._resolve(values)
+        return values[name]
+    return load
+
+class SysGroup(Group):
+    """the _sys group of a SymbolTable.  Its members localGroup,
+    moduleGroup, frames and groupCache describe the frame being run,
+    and are kept separately for each thread (see the context module):
+    a new thread starts at the top of the symbol table."""
+    context_names = ('localGroup', 'moduleGroup', 'frames', 'groupCache')
+
+    localGroup  = ContextAttr('localGroup')
+    moduleGroup = ContextAttr('moduleGroup')
+    frames      = ContextAttr('frames')
+    groupCache  = ContextAttr('groupCache')
+
+    def __init__(self, top, name='_sys'):
+        Group.__init__(self, name=name)
+        def defaults():
+            return dict(localGroup=top, moduleGroup=top, frames=[],
+                        groupCache={'localGroup':None, 'moduleGroup':None,
+                                    'searchNames':None, 'searchGroups':None})
+        self.__dict__['_context'] = ContextState(defaults)
+
+    def __setattr__(self, attr, val):
+        if attr in self.context_names:
+            setattr(self._context, attr, val)
+        else:
+            self.__dict__[attr] = val
+            if attr in _lookup_caches:
+                forget_lookup(self, attr)
+
+    def __dir__(self):
+        "return sorted list of names of member"
+        return sorted([key for key in Group.__dir__(self)
+                       if key != '_context'] + list(self.context_names))
+
+    def _members(self):
+        "sorted member list"
+        return self.__dir__()
+
+    def _publicmembers(self):
+        "sorted member list"
+        return dict([(key, getattr(self, key)) for key in self.__dir__()])
+
 class InvalidName:
     """ used to create a value that will NEVER be a useful symbol.
     symboltable._lookup() uses this to check for invalid names"""
@@ -142,28 +413,44 @@ class InvalidName:
     
 class SymbolTable(Group):
     """Main Symbol Table for Larch.    
+
+    The frame being run (_sys.localGroup, _sys.moduleGroup and the
+    saved frames) is kept per thread (see SysGroup), so that several
+    threads can evaluate code with the same symbol table.  Symbols
+    set outside of a procedure's local frame, and groups added to the
+    search path, change groups that all threads share:  set_symbol(),
+    del_symbol() and AddPlugins() make these changes while holding
+    write_lock(), and lookups do not take it.  Python code making a
+    sequence of changes that must not be interleaved with other threads
+    (such as n = n + 1 on a shared n) can hold write_lock() itself,
+    setting attributes of groups directly.
     """
     top_group   = '_main'
     core_groups = ('_sys', '_builtin', '_math')
     __invalid_name = InvalidName()
+    # cache the group in which each name was found (see _lookup)
+    use_lookup_cache = True
 
     def __init__(self, larch=None):
         Group.__init__(self, name=self.top_group)
         # self.__writer = writer  or sys.stdout.write
         self.__interpreter = larch
+        self.__lookup_cache = {}
+        self.__generation = 0
+        self.__forgets = 0
+        self.__lock = threading.Lock()
         self._sys = None
         setattr(self, self.top_group, self)
         
+        # _builtin and _math are filled by the Interpreter, with members
+        # made as they are first used (see LazyGroup)
         for gname in self.core_groups:
-            setattr(self, gname, Group(name=gname))
+            setattr(self, gname, LazyGroup(name=gname))
 
-        self._sys.frames = []
+        self._sys = SysGroup(self)
+        self.__context = self._sys._context
         self._sys.searchNames  = []
         self._sys.searchGroups = []
-        self._sys.localGroup   = self
-        self._sys.moduleGroup  = self
-        self._sys.groupCache  = {'localGroup':None, 'moduleGroup':None,
-                                 'searchNames':None, 'searchGroups': None}
 
         # FIXME this is only for testing until we get an rcfile parser
         # 29 July 2010 Damon Wang
@@ -181,22 +468,22 @@ class SymbolTable(Group):
     
     def save_frame(self):
         " save current local/module group"
-        self._sys.frames.append((self._sys.localGroup,
-                                 self._sys.moduleGroup))
+        ctx = self.__context
+        ctx.frames.append((ctx.localGroup, ctx.moduleGroup))
 
     def restore_frame(self):
         "restore last saved local/module group"        
+        ctx = self.__context
         try:
-            lgrp, mgrp = self._sys.frames.pop()
-            self._sys.localGroup = lgrp
-            self._sys.moduleGroup  = mgrp
+            ctx.localGroup, ctx.moduleGroup = ctx.frames.pop()
             self._fix_searchGroups()
         except:
             pass
 
     def set_frame(self, groups):
         "set current frame (localGroup, moduleGroup)"
-        self._sys.localGroup, self._sys.moduleGroup  = groups
+        ctx = self.__context
+        ctx.localGroup, ctx.moduleGroup = groups
         self._fix_searchGroups()
         
     def _fix_searchGroups(self):
@@ -216,28 +503,38 @@ class SymbolTable(Group):
         """
         ##
         # check (and cache) whether searchGroups needs to be changed.
+        # The frame and cache are those of this thread (see SysGroup).
         sys = self._sys
-        cache = self._sys.groupCache
+        ctx = self.__context
+        cache = ctx.groupCache
 
-        #  print('FIX SG1 ', sys.localGroup   == cache['localGroup'],
-        #         sys.moduleGroup  == cache['moduleGroup'],
+        #  print('FIX SG1 ', ctx.localGroup   == cache['localGroup'],
+        #         ctx.moduleGroup  == cache['moduleGroup'],
         #         sys.searchGroups == cache['searchNames'])
 
-        if (sys.localGroup   != cache['localGroup'] or
-            sys.moduleGroup  != cache['moduleGroup'] or
+        if (ctx.moduleGroup is cache['moduleGroup'] and
+            sys.searchGroups == cache['searchNames']):
+            # only the local group changed (as for Procedure calls),
+            # which does not affect the search groups
+            if ctx.localGroup is not None:
+                cache['localGroup'] = ctx.localGroup
+                return cache
+
+        if (ctx.localGroup   != cache['localGroup'] or
+            ctx.moduleGroup  != cache['moduleGroup'] or
             sys.searchGroups != cache['searchNames']):
 
-            # print('FIX SG2 ', sys.localGroup,
-            # sys.moduleGroup,
+            # print('FIX SG2 ', ctx.localGroup,
+            # ctx.moduleGroup,
             #       sys.searchGroups, cache['searchNames'])
             
-            if sys.moduleGroup is None:
-                sys.moduleGroup = self.top_group
-            if sys.localGroup is None:
-                sys.localGroup = self.moduleGroup
+            if ctx.moduleGroup is None:
+                ctx.moduleGroup = self.top_group
+            if ctx.localGroup is None:
+                ctx.localGroup = self.moduleGroup
 
-            cache['localGroup']  = sys.localGroup 
-            cache['moduleGroup'] = sys.moduleGroup
+            cache['localGroup']  = ctx.localGroup 
+            cache['moduleGroup'] = ctx.moduleGroup
 
             if cache['searchNames'] is None:
                 cache['searchNames'] = []
@@ -269,9 +566,53 @@ class SymbolTable(Group):
                 if grp is not None and grp not in sgroups:
                     sgroups.append(grp)
                         
+            if sgroups != cache['searchGroups']:
+                self.clear_lookup_cache()
             cache['searchGroups'] = sgroups[:]
         return cache
 
+    def clear_lookup_cache(self):
+        """invalidate all cached name resolutions, as when the search
+        path changes.  Members set or deleted in groups drop the cached
+        resolutions of their names themselves (see _forget_lookup)."""
+        with self.__lock:
+            self.__generation += 1
+            self.__lookup_cache = {}
+
+    def _forget_lookup(self, name, group):
+        """drop the cached resolution of name, unless it was found in
+        group:  a member of that name set in (or deleted from) another
+        group may change which group it resolves to"""
+        self.__forgets += 1
+        entry = self.__lookup_cache.get(name)
+        if entry is not None and entry[2] is not group:
+            self.__lookup_cache.pop(name, None)
+
+    def watch_lookup(self, name):
+        "have changes to members named name call _forget_lookup()"
+        if name not in _lookup_caches:
+            _lookup_caches.setdefault(name, weakref.WeakSet())
+        _lookup_caches[name].add(self)
+
+    def cache_lookup(self, name, modgroup, group, forgets):
+        """cache that name was found in group from modgroup, unless a
+        cached resolution was dropped since forgets was read"""
+        if forgets == self.__forgets:
+            self.__lookup_cache[name] = (self.__generation, modgroup, group)
+
+    def lookup_generation(self):
+        """number of times the cached name resolutions were invalidated,
+        as when the search path changes"""
+        return self.__generation
+
+    def write_lock(self):
+        """the lock held while changing shared groups, a threading.Lock.
+        Hold it with 'with symtable.write_lock():' around direct changes
+        to shared groups that other threads must see all at once.  It is
+        not reentrant:  set_symbol() and del_symbol() take it themselves,
+        so must not be called while holding it."""
+        return self.__lock
+
     def list_groups(self, group=None):
         "list groups"
         if group in (self.top_group, None):
@@ -300,37 +641,62 @@ class SymbolTable(Group):
     def _lookup(self, name=None, create=False):
         """looks up symbol in search path
         returns symbol given symbol name,
-        creating symbol if needed (and create=True)"""
+        creating symbol if needed (and create=True)
+
+        The first part of the name is looked for in the local group,
+        then in the module group and the rest of the search path.  As
+        looking through the search path is slow, the group that holds
+        each name is cached per module group, with a generation number
+        that is bumped whenever the search path changes.  Setting or
+        deleting a member of a cached name in any other group drops its
+        entry (see _forget_lookup).  The local group is always checked
+        first, so that symbols set there never need to invalidate the
+        cache."""
 
         cache = self._fix_searchGroups()
-
-        searchGroups = [cache['localGroup'], cache['moduleGroup']]
-        searchGroups.extend(cache['searchGroups'])
-
-        if self not in searchGroups:
-            searchGroups.append(self)
-
-        parts = name.split('.')
-        if len(parts) == 1:
-            for grp in searchGroups:
-                if hasattr(grp, name):
-                    return getattr(grp, name)
-
-        # more complex case: not immediately found in Local or Module Group
-
-        parts.reverse()
-        top   = parts.pop()
+        parts = None
+        top   = name
+        if '.' in name:
+            parts = name.split('.')
+            top   = parts[0]
+        local = cache['localGroup']
         out   = self.__invalid_name
         if top == self.top_group:
             out = self
+        elif hasattr(local, top):
+            out = getattr(local, top)
         else:
-            for grp in searchGroups:
-                if hasattr(grp, top):
-                    out = getattr(grp, top)
+            entry = None
+            if self.use_lookup_cache:
+                entry = self.__lookup_cache.get(top)
+            if (entry is not None and entry[0] == self.__generation and
+                entry[1] is cache['moduleGroup']):
+                out = getattr(entry[2], top, self.__invalid_name)
+            if out is self.__invalid_name:
+                # an entry is only kept if no cached name was set or
+                # deleted while searching, as it may then be stale
+                if self.use_lookup_cache:
+                    self.watch_lookup(top)
+                forgets = self.__forgets
+                searchGroups = [cache['moduleGroup']]
+                searchGroups.extend(cache['searchGroups'])
+                if self not in searchGroups:
+                    searchGroups.append(self)
+                for grp in searchGroups:
+                    if hasattr(grp, top):
+                        out = getattr(grp, top)
+                        if self.use_lookup_cache:
+                            self.cache_lookup(top, cache['moduleGroup'],
+                                              grp, forgets)
+                        break
 
         if out is self.__invalid_name:
             raise LookupError("cannot locate symbol '%s'" % name)
+        if parts is None:
+            return out
 
+        parts.reverse()
+        parts.pop()
         while parts:
             prt = parts.pop()
             if hasattr(out, prt):
@@ -423,15 +789,20 @@ class SymbolTable(Group):
             try: value=numpy.array(value)
             except: pass
 
-        def setter(grp, name, *args):
-            if args:
-                if not hasattr(grp, name):    
+        # a loop, not a recursive closure:  a closure calling itself is
+        # a reference cycle, keeping each value set until gc runs
+        def setter(grp, *names):
+            for name in names[:-1]:
+                if not hasattr(grp, name):
                     setattr(grp, name, Group(name=name))
-                return setter(getattr(grp, name), *args)
-            else:
-                setattr(grp, name, value)
-                return getattr(grp, name)
-        return setter(grp, *name.split('.')) 
+                grp = getattr(grp, name)
+            setattr(grp, names[-1], value)
+            return getattr(grp, names[-1])
+        # the local frame of a procedure call belongs to one thread
+        if isinstance(grp, LocalFrame) and '.' not in name:
+            return setter(grp, name)
+        with self.__lock:
+            return setter(grp, *name.split('.')) 
    
     def del_symbol(self, name):
         "delete a symbol"
@@ -440,8 +811,9 @@ class SymbolTable(Group):
         if isgroup(sym): 
             raise LookupError("symbol '%s' is a group" % (name))
         parent, child = self.get_parent(name)
-        if child is not None:
-            delattr(parent, child)
+        with self.__lock:
+            if child is not None:
+                delattr(parent, child)
 
     def get_parent(self, name):
         """return parent group, child name for an absolute symbol name
@@ -458,26 +830,44 @@ class SymbolTable(Group):
         return sym, child
 
     def AddPlugins(self, plugins, **kw):
-        """Add a list of plugins"""
+        """Add a list of plugins:  registerPlugin functions, which are
+        called now, or Plugin entries (see the plugins package), whose
+        modules are imported when one of their symbols is first looked
+        up.  Functions are bound to those keywords of kw that they take."""
         for plugin in plugins:
-            groupname, insearchGroup, syms = plugin()
+            lazy = isinstance(plugin, Plugin)
+            if lazy:
+                groupname = plugin.group
+                insearchGroup = plugin.insearchGroup
+            else:
+                groupname, insearchGroup, syms = plugin()
             sym = None
             try:
                 sym = self._lookup(groupname, create=False)
             except LookupError:
                 pass
-            if sym is None:
+            if sym is None and lazy:
+                sym = LazyGroup(name=groupname)
+                self.set_symbol(groupname, sym)
+            elif sym is None:
                 self.new_group(groupname)
 
             # print("Add Plugin! ", groupname, insearchGroup, syms)
             if insearchGroup:
-                self._sys.searchGroups.append(groupname)
+                with self.__lock:
+                    self._sys.searchGroups.append(groupname)
                 self._fix_searchGroups()
 
+            if lazy and isinstance(sym, LazyGroup):
+                sym._defer(plugin.names, plugin_loader(sym, plugin, kw))
+                continue
+            elif lazy:
+                syms = plugin()[2]
             for key, val in syms.items():
                 if callable(val):
-                    val = Closure(func=val, **kw)
+                    val = bind_call(val, **kw)
                 self.set_symbol("%s.%s" % (groupname, key), val)
+        self.clear_lookup_cache()
         
     @contextmanager
     def in_frame(self, localGroup, globalGroup):
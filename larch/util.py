@@ -5,8 +5,11 @@ from __future__ import print_function
 import re
 import sys
 import os
+import ast
+from itertools import izip
 
-from .symboltable import Group
+from .symboltable import (Group, LocalFrame, frame_class, watch_names,
+                          unwatch_names)
 
 def PrintExceptErr(err_str, print_trace=True):
     " print error on exceptions"
@@ -70,18 +73,88 @@ def isLiteralStr(inp):
     return ((inp.startswith("'") and inp.endswith("'")) or
             (inp.startswith('"') and inp.endswith('"')))
 
+def lazy_range(*args):
+    "xrange(), or range() for arguments that xrange() does not take"
+    try:
+        return xrange(*args)
+    except (TypeError, OverflowError):
+        return range(*args)
+
+# builtins that return lists, and the iterators used in their place where
+# the list is only iterated over (as in for loops and comprehensions):
+#    name -> (builtin, iterator, positions of arguments that are
+#             themselves only iterated over, or None for all)
+LAZY_ITERATORS = {'range':     (range, lazy_range, ()),
+                  'zip':       (zip, izip, None),
+                  'enumerate': (enumerate, enumerate, (0,))}
+
+def read_names(nodes):
+    """names that a list of AST nodes may read:  those of Name nodes, and
+    the member names of Attribute nodes"""
+    names = set()
+    for node in nodes:
+        for tnode in ast.walk(node):
+            if isinstance(tnode, ast.Name):
+                names.add(tnode.id)
+            elif isinstance(tnode, ast.Attribute):
+                names.add(tnode.attr)
+    return names
+
+def symbol_dependencies(symtable, names, seen=None):
+    """names of the symbols that reading names depends on:  the names
+    themselves, and those read by the procedures and defined variables
+    they are found to be (from the current frame).  seen holds the ids
+    of procedures and defined variables already expanded."""
+    if seen is None:
+        seen = set()
+    todo, out = list(names), set()
+    while todo:
+        name = todo.pop()
+        if name in out:
+            continue
+        out.add(name)
+        try:
+            val = symtable.get_symbol(name)
+        except (LookupError, ValueError):
+            continue
+        if id(val) in seen:
+            continue
+        if isinstance(val, DefinedVariable):
+            out.update(val.dependencies(seen=seen))
+        elif isinstance(val, Procedure):
+            seen.add(id(val))
+            todo.extend(read_names(val.body))
+    return out
+
 ##
 class DefinedVariable(object):
     """defined variable: re-evaluate on access
 
     Note that the localGroup/moduleGroup are cached
     at compile time, and restored for evaluation.
+
+    The last value is kept, and is evaluated again only after a symbol
+    that the expression reads (directly, or through the procedures and
+    defined variables it uses) is set or deleted in a Group, or when it
+    is read from another frame or search path.  Values read inside a
+    procedure are not kept.  Changes made in place (as x[0] = 1) are not
+    seen:  use cache=False for expressions that depend on these, or that
+    call functions giving a new value each time (as random()).  The
+    counts of cache hits and misses are kept as hits and misses, and
+    for all defined variables in _sys.definedvars.
     """
-    def __init__(self, expr=None, larch=None):
+    def __init__(self, expr=None, larch=None, cache=True):
         self.expr = expr
         self.larch = larch
         self.ast = None
         self._groups = None, None
+        self.cache = cache
+        self.names = set()
+        self.depends = set()
+        self.hits = self.misses = 0
+        self._changes = 0
+        self._value = None
+        self._key = None
         self.compile()
 
     def __repr__(self):
@@ -91,6 +164,25 @@ class DefinedVariable(object):
         """compile to ast"""
         if self.larch is not None and self.expr is not None:
             self.ast = self.larch.compile(self.expr)
+            self.names = read_names([self.ast])
+            self.invalidate()
+
+    def changed(self, name):
+        "a symbol the expression depends on was set or deleted"
+        self.invalidate()
+
+    def invalidate(self):
+        "forget the kept value"
+        self._changes += 1
+        self._key = None
+
+    def dependencies(self, seen=None):
+        """names of the symbols the value depends on (see
+        symbol_dependencies())"""
+        if seen is None:
+            seen = set()
+        seen.add(id(self))
+        return symbol_dependencies(self.larch.symtable, self.names, seen)
 
     def evaluate(self):
         "actually evaluate ast to a value"
@@ -101,10 +193,33 @@ class DefinedVariable(object):
             raise Warning(msg)
             
         if hasattr(self.larch, 'interp'):
+            stable = self.larch.symtable
+            stats = stable._sys.definedvars
+            cache = stable._fix_searchGroups()
+            key = (cache['localGroup'], cache['moduleGroup'],
+                   stable.lookup_generation())
+            if self._key is not None and self._key == key:
+                self.hits += 1
+                stats.hits += 1
+                return self._value
+            self.misses += 1
+            stats.misses += 1
+            keep = self.cache and not isinstance(key[0], LocalFrame)
+            if keep:
+                # watch before evaluating, so no change can be missed
+                depends = self.dependencies()
+                unwatch_names(self, self.depends - depends)
+                watch_names(self, depends)
+                self.depends = depends
+            changes = self._changes
+            nerrors = len(self.larch.error)
             # save current localGroup/moduleGroup 
-            self.larch.symtable.save_frame()
+            stable.save_frame()
             rval = self.larch.interp(self.ast, expr=self.expr)
-            self.larch.symtable.restore_frame()
+            stable.restore_frame()
+            if (keep and changes == self._changes and
+                len(self.larch.error) == nerrors):
+                self._value, self._key = rval, key
             return rval
         else:
             msg = "Cannot evaluate '%s'"  % (self.expr)
@@ -115,7 +230,7 @@ class Procedure(object):
     def __init__(self, name, larch=None, doc=None,
                  fname='<StdInput>', lineno=0,
                  body=None, args=None, kwargs=None,
-                 vararg=None, varkws=None):
+                 vararg=None, varkws=None, defline=None, yields=None):
         self.name     = name
         self.larch    = larch
         self.modgroup = larch.symtable._sys.moduleGroup
@@ -127,6 +242,15 @@ class Procedure(object):
         self.__doc__  = doc
         self.lineno   = lineno
         self.fname    = fname
+        # line of the def statement, as lineno is that of its block
+        self.defline  = defline
+        if defline is None:
+            self.defline = lineno
+        # statements of the body containing a yield:  a procedure with
+        # any is a generator, and calling it returns a Python generator
+        self.yields   = yields or set()
+        names = list(args) + [key for key, val in kwargs]
+        self.frame_class = frame_class(names + [vararg, varkws])
         
     def __repr__(self):
         sig = ""
@@ -147,89 +271,120 @@ class Procedure(object):
             sig = "%s\n  %s" % (sig, self.__doc__)
         return sig
 
-    def __call__(self, *args, **kwargs):
-        # msg = 'Cannot run Procedure %s' % self.name
-        # self.larch.on_except(None, msg=msg, expr='<>',
-        #                     fname=self.fname, lineno=self.lineno,
-        #                     py_exc=sys.exc_info())
+    def raise_exc(self, msg):
+        "report an error for a call of this procedure"
+        self.larch.raise_exception(None, msg=msg, expr='<>',
+                                   fname=self.fname, lineno=self.lineno,
+                                   py_exc=sys.exc_info())
 
+    def __call__(self, *args, **kwargs):
         stable  = self.larch.symtable
-        lgroup  = Group()
-        args   = list(args)
+        lgroup  = self.frame_class(name=self.name)
         n_args = len(args)
         n_expected = len(self.argnames)
 
-        if n_args != n_expected:
-            msg = None
-            if n_args < n_expected:            
-                msg = 'not enough arguments for Procedure %s' % self.name
-                msg = '%s (expected %i, got %i)'% (msg,
-                                                   n_expected,
-                                                   n_args)
-                self.larch.on_except(None, msg=msg, expr='<>',
-                                     fname=self.fname, lineno=self.lineno,
-                                     py_exc=sys.exc_info())
-                
-            msg = "too many arguments for Procedure %s" % self.name
-
-        for argname in self.argnames:
-            setattr(lgroup, argname, args.pop(0))
-
-        if len(args) > 0 and self.kwargs is not None:
-            msg = "got multiple values for keyword argument '%s' Procedure %s"
-            for t_a, t_kw in zip(args, self.kwargs):
-                if t_kw[0] in kwargs:
-                    msg = msg % (t_kw[0], self.name)
-                    self.larch.on_except(None, msg=msg, expr='<>',
-                                         fname=self.fname,
-                                         lineno=self.lineno,
-                                         py_exc=sys.exc_info())
-                else:
-                    kwargs[t_a] = t_kw[1]
+        if n_args < n_expected:
+            msg = 'not enough arguments for Procedure %s' % self.name
+            msg = '%s (expected %i, got %i)'% (msg, n_expected, n_args)
+            return self.raise_exc(msg)
 
-        try:
-            if self.vararg is not None:
-                setattr(lgroup, self.vararg, tuple(args))
+        for argname, val in zip(self.argnames, args):
+            setattr(lgroup, argname, val)
+        args = args[n_expected:]
 
-            for key, val in self.kwargs:
+        # extra positional arguments fill keyword arguments in order
+        for key, val in self.kwargs:
+            if len(args) > 0:
                 if key in kwargs:
-                    val = kwargs.pop(key)
-                setattr(lgroup, key, val)
-
-            if self.varkws is not None:
-                setattr(lgroup, self.varkws, kwargs)
-            elif len(kwargs) > 0:
-                msg = 'extra keyword arguments for Procedure %s (%s)'
-                msg = msg % (self.name, ','.join(list(kwargs.keys())))
-                self.larch.on_except(None, msg=msg, expr='<>',
-                                     fname=self.fname, lineno=self.lineno,
-                                     py_exc=sys.exc_info())
-                
-        except (ValueError, LookupError, TypeError, 
-                NameError, AttributeError):
-            msg = 'incorrect arguments for Procedure %s' % self.name
-            self.larch.on_except(None, msg=msg, expr='<>',
-                                 fname=self.fname,   lineno=self.lineno,
-                                 py_exc=sys.exc_info())            
-            
+                    msg = "got multiple values for keyword argument '%s' Procedure %s"
+                    return self.raise_exc(msg % (key, self.name))
+                val, args = args[0], args[1:]
+            elif key in kwargs:
+                val = kwargs.pop(key)
+            setattr(lgroup, key, val)
+
+        if self.vararg is not None:
+            setattr(lgroup, self.vararg, tuple(args))
+        elif len(args) > 0:
+            msg = 'too many arguments for Procedure %s' % self.name
+            msg = '%s (expected %i, got %i)'% (msg,
+                                               n_expected + len(self.kwargs),
+                                               n_args)
+            return self.raise_exc(msg)
+
+        if self.varkws is not None:
+            setattr(lgroup, self.varkws, kwargs)
+        elif len(kwargs) > 0:
+            msg = 'extra keyword arguments for Procedure %s (%s)'
+            msg = msg % (self.name, ','.join(list(kwargs.keys())))
+            return self.raise_exc(msg)
+
+        if self.yields:
+            return self.generate(lgroup)
+
+        larch = self.larch
+        ctx = larch._context
+        fname, lineno = ctx.fname, ctx.lineno
+        tracing = larch.tracing
+        if tracing:
+            larch.run_hooks('call', self, self.fname, self.defline)
         stable.save_frame()
         stable.set_frame((lgroup, self.modgroup))
         retval = None
-        self.larch.retval = None
+        ctx.retval = None
 
         for node in self.body:
-            self.larch.interp(node, expr='<>',
-                              fname=self.fname, lineno=self.lineno)            
-            if len(self.larch.error) > 0:
+            larch.interp(node, expr='<>',
+                         fname=self.fname, lineno=self.lineno)            
+            if len(ctx.error) > 0:
                 break
-            if self.larch.retval is not None:
-                retval = self.larch.retval
+            if ctx.retval is not None:
+                retval = ctx.retval
                 break
         stable.restore_frame()
-        self.larch.retval = None
+        if tracing:
+            larch.run_hooks('return', self, self.fname, self.defline,
+                            retval)
+        ctx.fname, ctx.lineno = fname, lineno
+        ctx.retval = None
         del lgroup
         return retval
-    
+
+    def generate(self, lgroup):
+        """run the body of a generator procedure in the frame lgroup,
+        yielding the values of its yield statements.  Each step runs
+        as a call of the procedure, from the state of the caller at
+        the time."""
+        larch, stable = self.larch, self.larch.symtable
+        ctx = larch._context
+        steps = larch.generate(self.body, self.yields,
+                               fname=self.fname, lineno=self.lineno)
+        while True:
+            fname, lineno = ctx.fname, ctx.lineno
+            interrupt, ctx._interrupt = ctx._interrupt, None
+            tracing = larch.tracing
+            if tracing:
+                larch.run_hooks('call', self, self.fname, self.defline)
+            stable.save_frame()
+            stable.set_frame((lgroup, self.modgroup))
+            ctx.retval = None
+            try:
+                val, done = next(steps), False
+            except StopIteration:
+                val, done = None, True
+            finally:
+                stable.restore_frame()
+                ctx.fname, ctx.lineno = fname, lineno
+                ctx.retval = None
+                if not ctx.error:
+                    ctx._interrupt = interrupt
+            if tracing:
+                larch.run_hooks('return', self, self.fname, self.defline,
+                                val)
+            if done or len(ctx.error) > 0:
+                return
+            yield val
+
 class LarchExceptionHolder:
     "basic exception handler"
     def __init__(self, node, msg='', fname='<StdInput>',
@@ -266,7 +421,7 @@ class LarchExceptionHolder:
                 ftmp = open(self.fname, 'r')
                 expr = ftmp.readlines()[lineno-1][:-1]
                 ftmp.close()
-            except IOError:
+            except (IOError, TypeError):
                 pass
 
         out = []
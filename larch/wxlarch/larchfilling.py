@@ -20,7 +20,7 @@ import inspect
 
 from wx.py import introspect
 from larch.symboltable import SymbolTable, Group
-from larch.closure import Closure
+from larch.closure import Closure, BoundCall
 
 VERSION = '0.9.5(Larch)'
 
@@ -210,7 +210,7 @@ class FillingTree(wx.TreeCtrl):
         if not item:
             return
         obj = self.GetPyData(item)
-        if isinstance(obj, Closure):
+        if isinstance(obj, (Closure, BoundCall)):
             obj = obj.func
             
         if self.IsExpanded(item):
@@ -14,5 +14,6 @@ setup(
     packages = ['larch','larch.plugins','larch.modules',
                 'larch.wxlarch', 'larch.wxlarch.mplot'],
     package_data = {'larch.modules':['startup.lar']},
-    data_files  = [('bin',['bin/larch', 'bin/wxlarch'])],)
+    data_files  = [('bin',['bin/larch', 'bin/larch_submit',
+                          'bin/wxlarch'])],)
 
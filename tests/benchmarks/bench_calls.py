@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+'''measure calls per second from Larch code to a Procedure, to Python
+functions taking the larch keyword (as a Closure, and bound with
+bind_call() as builtins and plugins are), to a Python builtin and to a
+numpy ufunc, through the interpreter and through compiled closures.
+The 'none' line runs the same loop without a call.
+
+usage:  python bench_calls.py [ncalls]
+'''
+from __future__ import print_function
+import sys
+import time
+import larch
+from larch.closure import Closure, bind_call
+
+LOOP = '''
+def proc(x):
+    return x
+#enddef
+acc = 0
+for i in range(%(n)i):
+    acc = %(call)s
+'''
+
+CALLS = (('none',      'i'),
+         ('procedure', 'proc(i)'),
+         ('closure',   'closure(i)'),
+         ('bound',     'bound(i)'),
+         ('builtin',   'abs(i)'),
+         ('ufunc',     'sqrt(i)'))
+
+def pyfunc(x, larch=None):
+    "a Python function taking the larch keyword"
+    return x
+
+def run(call, ncalls, use_compiler):
+    li = larch.Interpreter(use_compiler=use_compiler)
+    li.symtable.closure = Closure(func=pyfunc, larch=li)
+    li.symtable.bound = bind_call(pyfunc, larch=li)
+    text = LOOP % dict(n=ncalls, call=call)
+    t0 = time.time()
+    li.eval(text)
+    dt = time.time() - t0
+    if li.error:
+        print(li.error[0].get_error())
+    return dt
+
+if __name__ == '__main__':
+    ncalls = 100000
+    if len(sys.argv) > 1:
+        ncalls = int(sys.argv[1])
+    for use_compiler in (False, True):
+        mode = use_compiler and 'compiled' or 'interp'
+        for label, call in CALLS:
+            dt = run(call, ncalls, use_compiler)
+            print('%-10s %-8s n=%i  %.3fs  %9.0f calls/sec' %
+                  (label, mode, ncalls, dt, ncalls/dt))
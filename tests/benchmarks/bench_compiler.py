@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+'''compare run time of loop-heavy larch code through the node-dispatching
+interpreter and through compiled closures (Interpreter.use_compiler)
+
+usage:  python bench_compiler.py [nloops]
+'''
+from __future__ import print_function
+import sys
+import time
+import larch
+
+LOOP = '''
+total = 0.0
+for i in range(%(n)i):
+    x = i * 0.5 + 1
+    if x > 10:
+        total = total + x / 2.0
+    else:
+        total = total - x
+'''
+
+PROC = '''
+def scale(val, factor=2.0):
+    return val * factor + 1
+#enddef
+acc = 0
+k = 0
+while k < %(n)i:
+    acc = acc + scale(k)
+    k = k + 1
+'''
+
+def run(code, use_compiler, nloops):
+    li = larch.Interpreter(use_compiler=use_compiler)
+    text = code % dict(n=nloops)
+    t0 = time.time()
+    li.eval(text)
+    dt = time.time() - t0
+    if li.error:
+        print(li.error[0].get_error())
+    return dt
+
+if __name__ == '__main__':
+    nloops = 20000
+    if len(sys.argv) > 1:
+        nloops = int(sys.argv[1])
+    for label, code in (('for loop', LOOP), ('procedure calls', PROC)):
+        t_interp = run(code, False, nloops)
+        t_comp   = run(code, True, nloops)
+        print('%-16s n=%i  interp: %.3fs  compiled: %.3fs  speedup: %.2fx' %
+              (label, nloops, t_interp, t_comp, t_interp/t_comp))
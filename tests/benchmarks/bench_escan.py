@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+'''measure rows per second read by escan_data.read_ascii, for a
+synthetic 2-d EPICS scan file of nrows x npts points with 4 MCA
+detectors, with ICR/OCR columns, and optionally full XRF spectra of
+nchan channels for each detector and point
+
+usage:  python bench_escan.py [nrows [npts [nchan]]]
+'''
+from __future__ import print_function
+import os
+import sys
+import imp
+import time
+import tempfile
+import numpy
+
+# load escan_data by path: the dataviewer package needs wx
+escan_data = imp.load_source('escan_data',
+                             os.path.join(os.path.dirname(__file__), '..', '..',
+                                          'larch', 'modules', 'dataviewer',
+                                          'escan_data.py'))
+
+HEADER = '''; Epics Scan 2 dimensional scan
+; current scan dimension = 2
+; scan dimension = 2
+; scan prefix = FastMap
+; ====================================
+; column labels:
+; P1 = {Sample X} --> 13XRM:m1.VAL
+%(dets)s; scan regions:
+; start = 0.0, stop = 1.0
+; User Titles:
+; synthetic map for benchmarks
+; PV list:
+; 13XRM:m2.VAL = 0.0
+; scan began at time: 01-Jan-2010 00:00:00
+; ----------------------------------
+'''
+
+def make_file(fname, nrows, npts, nmca=4):
+    dets = ['{mca%i:Fe Ka} --> 13SDD1:mca%i.R0' % (i+1, i+1) for i in range(nmca)]
+    dets.append('{I0} --> 13IDC:scaler1.S2')
+    dets.extend(['{mca%i:ICR} --> 13SDD1:dxp%i.ICR' % (i+1, i+1) for i in range(nmca)])
+    dets.extend(['{mca%i:OCR} --> 13SDD1:dxp%i.OCR' % (i+1, i+1) for i in range(nmca)])
+    labels = ['P1'] + ['D%i' % (i+1) for i in range(len(dets))]
+    out = open(fname, 'w')
+    out.write(HEADER % dict(dets=''.join(['; D%i = %s\n' % (i+1, d)
+                                          for i, d in enumerate(dets)])))
+    out.write('; %s\n' % ' '.join(labels))
+    x = numpy.linspace(0, 1, npts)
+    for irow in range(nrows):
+        out.write(';2D 13XRM:m2.VAL %.4f\n' % (irow*0.01))
+        dat = numpy.random.uniform(1, 1000, size=(npts, len(labels)))
+        dat[:, 0] = x
+        dat[:, -2*nmca:] = 50000 + 1000*numpy.random.uniform(size=(npts, 2*nmca))
+        numpy.savetxt(out, dat, fmt='%.6g')
+    out.close()
+
+XRF_HEADER = '''; MCA Spectra
+; CAL_OFFSET: -0.010 -0.012 -0.011 -0.009
+; CAL_SLOPE: 0.0100 0.0101 0.0099 0.0100
+; CAL_QUAD: 1.e-7 1.e-7 1.e-7 1.e-7
+; ROI0: Fe Ka : 620 : 660
+; ROI0: Fe Ka : 620 : 660
+; ROI0: Fe Ka : 620 : 660
+; ROI0: Fe Ka : 620 : 660
+;----------------------------------
+; ix iy spectra
+'''
+
+def make_xrf_file(fname, nrows, npts, nchan, nmca=4):
+    out = open(fname, 'w')
+    out.write(XRF_HEADER)
+    ix = numpy.arange(1, npts+1)
+    for irow in range(nrows):
+        dat = numpy.random.poisson(20, size=(npts, 2 + nmca*nchan))
+        dat[:, 0] = ix
+        dat[:, 1] = irow + 1
+        numpy.savetxt(out, dat, fmt='%i')
+    out.close()
+
+if __name__ == '__main__':
+    nrows, npts, nchan = 100, 500, 0
+    if len(sys.argv) > 1:
+        nrows = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        npts = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        nchan = int(sys.argv[3])
+    fname = tempfile.mktemp(suffix='.dat')
+    make_file(fname, nrows, npts)
+    if nchan > 0:
+        make_xrf_file('%s.fullxrf' % fname, nrows, npts, nchan)
+    try:
+        t0 = time.time()
+        dat = escan_data.escan_data()
+        dat.read_ascii(fname)
+        dt = time.time() - t0
+    finally:
+        os.unlink(fname)
+        if nchan > 0:
+            os.unlink('%s.fullxrf' % fname)
+    print()
+    print('escan read_ascii  %i x %i  %.3fs  %8.0f rows/sec  det_corr shape %s'
+          % (nrows, npts, dt, nrows*npts/dt, dat.det_corr.shape))
+    if dat.has_fullxrf:
+        print('   full xrf spectra %s %s' % (dat.xrf_data.dtype,
+                                             dat.xrf_data.shape))
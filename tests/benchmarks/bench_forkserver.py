@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+'''compare running a short script njobs times with 'larch -e', each in a
+new process, and as jobs of a fork server (larch --server) submitted by
+larch_submit and by submit() in this process
+
+usage:  python bench_forkserver.py [njobs]
+'''
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import tempfile
+import subprocess
+from larch.forkserver import submit
+
+BINDIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      '..', '..', 'bin')
+SCRIPT = '''x = linspace(0, 1, 101)
+y = sum(sin(x))
+'''
+
+def run(args, njobs):
+    "seconds per job of running args njobs times"
+    with open(os.devnull, 'w') as devnull:
+        t0 = time.time()
+        for i in range(njobs):
+            subprocess.call([sys.executable] + args, stdout=devnull,
+                            stderr=devnull)
+    return (time.time() - t0) / njobs
+
+if __name__ == '__main__':
+    njobs = 50
+    if len(sys.argv) > 1:
+        njobs = int(sys.argv[1])
+    tmpdir = tempfile.mkdtemp(prefix='larch')
+    script = os.path.join(tmpdir, 'job.lar')
+    address = os.path.join(tmpdir, 'server.sock')
+    with open(script, 'w') as outf:
+        outf.write(SCRIPT)
+    server = subprocess.Popen([sys.executable, os.path.join(BINDIR, 'larch'),
+                               '--server', address])
+    try:
+        while not os.path.exists(address):
+            time.sleep(0.05)
+        t_larch = run([os.path.join(BINDIR, 'larch'), '-q', '-e', script],
+                      njobs)
+        t_client = run([os.path.join(BINDIR, 'larch_submit'), address,
+                        script], njobs)
+        t0 = time.time()
+        for i in range(njobs):
+            submit(address, [script])
+        t_submit = (time.time() - t0) / njobs
+        print('per job:  larch -e %.4fs  larch_submit %.4fs  submit() %.4fs'
+              % (t_larch, t_client, t_submit))
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(tmpdir)
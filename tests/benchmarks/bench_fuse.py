@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+'''measure the time and peak memory of evaluating a polynomial of a large
+array, a*x**2 + b*x + c, as written (making a whole-array temporary for
+each operation) and fused (in blocks, see the optimize module), with 1
+and with nthreads threads.  Each mode runs in a process of its own, so
+that the growth of its peak resident size is that of the evaluation.
+Then the time of a loop of nloops scalar expressions, which fusing
+should not slow down.
+
+usage:  python bench_fuse.py [npts [nevals [nthreads [nloops]]]]
+'''
+from __future__ import print_function
+import sys
+import time
+import resource
+import subprocess
+
+MODES = (('plain',   dict()),
+         ('fused',   dict(fuse=True)),
+         ('threads', dict(fuse=True, fuse_threads=None)))
+
+def run(npts, nevals, options):
+    "evaluate the polynomial nevals times, giving the time and peak growth"
+    import larch
+    li = larch.Interpreter(**options)
+    li('x = linspace(0, 1, %i)' % npts)
+    li('a, b, c = 2.0, -3.0, 0.5')
+    rss0 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0 = time.time()
+    for i in range(nevals):
+        li('y = a*x**2 + b*x + c')
+    dt = time.time() - t0
+    rss1 = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if li.error:
+        print(li.error[0].get_error())
+    return dt, (rss1 - rss0)/1024.0
+
+def run_scalar(nloops, options):
+    "best time of 3 runs of a loop of scalar expressions"
+    import larch
+    times = []
+    for i in range(3):
+        li = larch.Interpreter(**options)
+        li('t = 0.0')
+        t0 = time.time()
+        li('for i in range(%i):\n    t = t + i*2.0 + 1.0\n#endfor' % nloops)
+        times.append(time.time() - t0)
+    return min(times)
+
+if __name__ == '__main__':
+    npts, nevals, nthreads, nloops = 10000000, 10, 4, 20000
+    if len(sys.argv) > 1:
+        npts = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        nevals = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        nthreads = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        nloops = int(sys.argv[4])
+
+    if len(sys.argv) > 5:
+        # run one mode, in a process started below
+        options = dict(MODES)[sys.argv[5]]
+        if 'fuse_threads' in options:
+            options['fuse_threads'] = nthreads
+        print('%.6f %.1f' % run(npts, nevals, options))
+        sys.exit()
+
+    for label, options in MODES:
+        out = subprocess.check_output([sys.executable, __file__, str(npts),
+                                       str(nevals), str(nthreads),
+                                       str(nloops), label])
+        dt, peak = [float(word) for word in out.split()[-2:]]
+        print('%-8s n=%i  %.3fs  %8.1f evals/sec  peak +%.1f MB' %
+              (label, npts, dt, nevals/dt, peak))
+
+    for label, options in MODES[:2]:
+        dt = run_scalar(nloops, options)
+        print('%-8s scalar loop n=%i  %.3fs' % (label, nloops, dt))
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+'''compare cold (convert and parse) and warm (.larc cache) imports
+of a large larch module
+
+usage:  python bench_import.py [nblocks]
+'''
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import tempfile
+import larch
+
+BLOCK = '''
+def proc%(i)i(x, scale=%(i)i):
+    return x * scale + %(i)i
+#enddef
+val%(i)i = proc%(i)i(%(i)i)
+total = 0
+for i in arange(3):
+    total = total + val%(i)i
+#endfor
+'''
+
+def time_import(modname, tmpdir):
+    li = larch.Interpreter()
+    li.symtable._sys.path.insert(0, tmpdir)
+    t0 = time.time()
+    li('import %s' % modname)
+    dt = time.time() - t0
+    if li.error:
+        print(li.error[0].get_error())
+    return dt
+
+if __name__ == '__main__':
+    nblocks = 500
+    if len(sys.argv) > 1:
+        nblocks = int(sys.argv[1])
+    tmpdir = tempfile.mkdtemp(prefix='larch')
+    modname = 'benchmod'
+    fname = os.path.join(tmpdir, '%s.lar' % modname)
+    with open(fname, 'w') as outf:
+        for i in range(nblocks):
+            outf.write(BLOCK % dict(i=i))
+    try:
+        t_cold = time_import(modname, tmpdir)
+        t_warm = time_import(modname, tmpdir)
+        print('import of %i blocks:  cold: %.3fs  warm: %.3fs  speedup: %.2fx' %
+              (nblocks, t_cold, t_warm, t_cold/t_warm))
+    finally:
+        shutil.rmtree(tmpdir)
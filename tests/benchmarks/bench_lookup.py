@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+'''compare run time of loop-heavy larch code with and without the
+name-resolution cache of the symbol table (SymbolTable.use_lookup_cache)
+
+Most names in these loops (range, sin, sqrt, abs, ...) live in _builtin
+or _math, so without the cache each of them walks the search path.
+
+usage:  python bench_lookup.py [nloops]
+'''
+from __future__ import print_function
+import sys
+import time
+import larch
+from larch.symboltable import SymbolTable
+
+MATH = '''
+total = 0.0
+for i in range(%(n)i):
+    total = total + sqrt(abs(sin(i*pi/180.0))) + cos(i) * exp(-i/1.e4)
+'''
+
+PROC = '''
+def hypot2(a, b):
+    return sqrt(a*a + b*b) + log(1 + abs(a))
+#enddef
+acc = 0
+for k in range(%(n)i):
+    acc = acc + hypot2(k, sin(k))
+'''
+
+def run(code, use_cache, nloops, use_compiler=False):
+    SymbolTable.use_lookup_cache = use_cache
+    li = larch.Interpreter(use_compiler=use_compiler)
+    text = code % dict(n=nloops)
+    t0 = time.time()
+    li.eval(text)
+    dt = time.time() - t0
+    if li.error:
+        print(li.error[0].get_error())
+    return dt
+
+if __name__ == '__main__':
+    nloops = 10000
+    if len(sys.argv) > 1:
+        nloops = int(sys.argv[1])
+    for label, code in (('math loop', MATH), ('procedure calls', PROC)):
+        for use_compiler in (False, True):
+            t_off = run(code, False, nloops, use_compiler=use_compiler)
+            t_on  = run(code, True, nloops, use_compiler=use_compiler)
+            mode = use_compiler and 'compiled' or 'interp'
+            print('%-16s %-8s n=%i  no cache: %.3fs  cache: %.3fs  '
+                  'speedup: %.2fx' % (label, mode, nloops, t_off, t_on,
+                                      t_off/t_on))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+'''measure imports of larch modules:  the first import of nmods modules
+found in the last of ndirs directories (each holding nfiles other files)
+added to _sys.path, and then the same modules imported again inside a
+procedure called ncalls times, as scripts that import in procedures do.
+Then the first import of nmods python modules from the same directory.
+
+usage:  python bench_modulepath.py [nmods [ndirs [nfiles [ncalls]]]]
+'''
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import larch
+
+PROC = '''
+def use_modules():
+    %s
+    return 1
+#enddef
+'''
+
+def make_dirs(tmpdir, nmods, ndirs, nfiles):
+    "directories for _sys.path, the last holding the modules"
+    dirs = []
+    for i in range(ndirs):
+        dirname = os.path.join(tmpdir, 'dir%i' % i)
+        os.mkdir(dirname)
+        for j in range(nfiles):
+            open(os.path.join(dirname, 'other%i.py' % j), 'w').close()
+        dirs.append(dirname)
+    for i in range(nmods):
+        with open(os.path.join(dirs[-1], 'bmod%i.lar' % i), 'w') as outf:
+            outf.write('value = %i\n' % i)
+        with open(os.path.join(dirs[-1], 'pmod%i.py' % i), 'w') as outf:
+            outf.write('value = %i\n' % i)
+    return dirs
+
+if __name__ == '__main__':
+    nmods, ndirs, nfiles, ncalls = 50, 10, 200, 2000
+    args = [int(arg) for arg in sys.argv[1:5]]
+    nmods, ndirs, nfiles, ncalls = args + [nmods, ndirs, nfiles, ncalls][len(args):]
+
+    tmpdir = tempfile.mkdtemp(prefix='larch')
+    try:
+        dirs = make_dirs(tmpdir, nmods, ndirs, nfiles)
+        li = larch.Interpreter()
+        li.symtable._sys.path.extend(dirs)
+        names = ['bmod%i' % i for i in range(nmods)]
+
+        t0 = time.time()
+        for name in names:
+            li('import %s' % name)
+        dt = time.time() - t0
+        print('first import   n=%i  %.4fs  %9.1f imports/sec' %
+              (nmods, dt, nmods/dt))
+
+        li(PROC % '\n    '.join(['import %s' % name for name in names[:5]]))
+        t0 = time.time()
+        li('for i in range(%i): use_modules()' % ncalls)
+        dt = time.time() - t0
+        print('import in proc n=%i  %.4fs  %9.1f imports/sec' %
+              (5*ncalls, dt, 5*ncalls/dt))
+
+        t0 = time.time()
+        for i in range(nmods):
+            li('import pmod%i' % i)
+        dt = time.time() - t0
+        print('python import  n=%i  %.4fs  %9.1f imports/sec' %
+              (nmods, dt, nmods/dt))
+        if li.error:
+            print(li.error[0].get_error())
+    finally:
+        shutil.rmtree(tmpdir)
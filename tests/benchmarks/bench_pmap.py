@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+'''measure the speed-up of pmap() over a plain Larch loop, for a
+reduction of nspec synthetic spectra of nchan channels each, with 1, 2,
+4, ... worker processes, up to the number of CPUs (or maxworkers)
+
+usage:  python bench_pmap.py [nspec [nchan [maxworkers]]]
+'''
+from __future__ import print_function
+import sys
+import time
+import multiprocessing
+import numpy
+
+import larch
+
+CODE = '''
+def reduce_spectrum(spec):
+    "background-subtracted areas of 8 windows of a spectrum"
+    out = zeros(8)
+    width = len(spec) // 8
+    for i in range(8):
+        win = spec[i*width:(i+1)*width]
+        bkg = (win[:4].mean() + win[-4:].mean()) / 2.0
+        out[i] = (win - bkg).sum()
+    return out
+#enddef
+'''
+
+if __name__ == '__main__':
+    nspec, nchan = 10000, 2048
+    maxworkers = multiprocessing.cpu_count()
+    if len(sys.argv) > 1:
+        nspec = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        nchan = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        maxworkers = int(sys.argv[3])
+
+    li = larch.Interpreter()
+    li(CODE)
+    li.symtable.spectra = list(numpy.random.poisson(50, size=(nspec, nchan)))
+
+    t0 = time.time()
+    li('serial = [reduce_spectrum(s) for s in spectra]')
+    tserial = time.time() - t0
+    print('%i spectra x %i channels, %i CPUs' % (nspec, nchan,
+                                                multiprocessing.cpu_count()))
+    print('  larch loop      %8.3fs' % tserial)
+
+    nworkers = 1
+    while nworkers <= maxworkers:
+        t0 = time.time()
+        li('result = pmap(reduce_spectrum, spectra, nworkers=%i)' % nworkers)
+        dt = time.time() - t0
+        same = numpy.allclose(li.symtable.result, li.symtable.serial)
+        print('  pmap %3i workers %8.3fs  speed-up %5.2f  %s' %
+              (nworkers, dt, tserial/dt, same and 'ok' or 'DIFFERENT'))
+        nworkers *= 2
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+'''measure calls per second of small larch procedures, called in a loop
+and recursively, through the interpreter and through compiled closures
+
+usage:  python bench_procedures.py [ncalls]
+'''
+from __future__ import print_function
+import sys
+import time
+import larch
+
+LOOP = '''
+def add(a, b=1):
+    return a + b
+#enddef
+acc = 0
+for i in range(%(n)i):
+    acc = add(acc, b=i)
+'''
+
+RECURSIVE = '''
+def count(n):
+    return n > 0 and 1 + count(n-1) or 0
+#enddef
+total = 0
+for i in range(%(nouter)i):
+    total = total + count(%(depth)i)
+'''
+
+def run(code, ncalls, use_compiler):
+    li = larch.Interpreter(use_compiler=use_compiler)
+    depth = 50
+    text = code % dict(n=ncalls, depth=depth, nouter=ncalls//(depth+1))
+    t0 = time.time()
+    li.eval(text)
+    dt = time.time() - t0
+    if li.error:
+        print(li.error[0].get_error())
+    return dt
+
+if __name__ == '__main__':
+    ncalls = 20000
+    if len(sys.argv) > 1:
+        ncalls = int(sys.argv[1])
+    for label, code in (('loop', LOOP), ('recursive', RECURSIVE)):
+        for use_compiler in (False, True):
+            dt = run(code, ncalls, use_compiler)
+            mode = use_compiler and 'compiled' or 'interp'
+            print('%-10s %-8s n=%i  %.3fs  %8.0f calls/sec' %
+                  (label, mode, ncalls, dt, ncalls/dt))
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+'''time save_session() and load_session() of a session holding narrays
+arrays of size MB each, and the first use of the restored arrays (which
+reads them from disk), compared with reading all the arrays with
+numpy.load.
+
+usage:  python bench_session.py [narrays [size]]
+'''
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy
+import larch
+from larch.session import save_session, load_session, ARRAY_DIR
+
+def timed(func, *args):
+    t0 = time.time()
+    out = func(*args)
+    return time.time() - t0, out
+
+if __name__ == '__main__':
+    narrays, size = 8, 128
+    if len(sys.argv) > 1:
+        narrays = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        size = int(sys.argv[2])
+    npts = size * 2**20 // 8
+    li = larch.Interpreter()
+    li('data = group()')
+    for i in range(narrays):
+        setattr(li.symtable.data, 'arr%i' % i, numpy.random.random(npts))
+    tmpdir = tempfile.mkdtemp(prefix='larch')
+    dirname = os.path.join(tmpdir, 'session')
+    try:
+        t_save, skipped = timed(save_session, dirname, li)
+        li2 = larch.Interpreter()
+        t_load, names = timed(load_session, dirname, li2)
+        data = li2.symtable.data
+        t_use, total = timed(lambda: sum([getattr(data, 'arr%i' % i).sum()
+                                          for i in range(narrays)]))
+        arrdir = os.path.join(dirname, ARRAY_DIR)
+        t_read, arrays = timed(lambda: [numpy.load(os.path.join(arrdir, f))
+                                        for f in os.listdir(arrdir)])
+        print('%i arrays, %i MB:  save %.3fs  load %.4fs  first use %.3fs'
+              '  (numpy.load %.3fs)' % (narrays, narrays*size, t_save,
+                                        t_load, t_use, t_read))
+    finally:
+        shutil.rmtree(tmpdir)
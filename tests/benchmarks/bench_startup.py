@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+'''measure cold-start time:  python with nothing imported, importing numpy,
+importing larch, and making an Interpreter and running one statement, each
+in nruns new processes.  The best and median times are shown, followed by
+the startup phases of one Interpreter (see larch --startup-profile).
+
+usage:  python bench_startup.py [nruns]
+'''
+from __future__ import print_function
+import os
+import sys
+import time
+import subprocess
+
+STEPS = (('python',      'pass'),
+         ('numpy',       'import numpy'),
+         ('larch',       'import larch'),
+         ('interpreter', 'import larch; larch.Interpreter()("x = sin(1)")'))
+
+PHASES = '''
+import larch
+li = larch.Interpreter()
+for name, dt in li.symtable._sys.startup:
+    print('  %-14s %8.4fs' % (name, dt))
+'''
+
+def run(code):
+    "time taken by a new python process running code"
+    t0 = time.time()
+    subprocess.check_call([sys.executable, '-c', code])
+    return time.time() - t0
+
+if __name__ == '__main__':
+    nruns = 20
+    if len(sys.argv) > 1:
+        nruns = int(sys.argv[1])
+
+    for label, code in STEPS:
+        times = sorted([run(code) for i in range(nruns)])
+        print('%-12s n=%i  best %.4fs  median %.4fs' %
+              (label, nruns, times[0], times[nruns//2]))
+    print('interpreter phases:')
+    sys.stdout.flush()
+    subprocess.check_call([sys.executable, '-c', PHASES])
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+'''measure evaluations of a numpy-heavy Larch expression per second, from
+1, 2, 4, ... threads sharing one Interpreter, up to maxthreads.  numpy
+releases the GIL for large arrays, so the rate can grow with the number
+of threads on a machine with several CPUs.
+
+usage:  python bench_threads.py [nevals [npts [maxthreads]]]
+'''
+from __future__ import print_function
+import sys
+import time
+import threading
+
+import larch
+
+CODE = '''
+def smooth_area(x, width):
+    "area under a gaussian-smoothed copy of x"
+    kern = exp(-linspace(-3, 3, width)**2)
+    return convolve(x, kern/kern.sum(), 'same').sum()
+#enddef
+'''
+
+def run(larch_, nevals, nthreads):
+    "evaluate smooth_area() nevals times over nthreads threads"
+    proc = larch_.symtable.smooth_area
+    data = larch_.symtable.data
+    def work(count):
+        for i in range(count):
+            proc(data, 51)
+    threads = [threading.Thread(target=work, args=(nevals//nthreads,))
+               for i in range(nthreads)]
+    t0 = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.time() - t0
+
+if __name__ == '__main__':
+    nevals, npts, maxthreads = 400, 200000, 8
+    if len(sys.argv) > 1:
+        nevals = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        npts = int(sys.argv[2])
+    if len(sys.argv) > 3:
+        maxthreads = int(sys.argv[3])
+
+    li = larch.Interpreter()
+    li(CODE)
+    li('data = sin(linspace(0, 200, %i))' % npts)
+    nthreads = 1
+    while nthreads <= maxthreads:
+        dt = run(li, nevals, nthreads)
+        print('threads=%-3i n=%i  %.3fs  %9.1f evals/sec' %
+              (nthreads, nevals, dt, nevals/dt))
+        nthreads *= 2
+    if li.error:
+        print(li.error[0].get_error())
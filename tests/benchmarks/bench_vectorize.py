@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+'''compare run time of elementwise loops over array indices with and
+without the loop vectorizer (Interpreter option vectorize=True)
+
+usage:  python bench_vectorize.py [npts]
+'''
+from __future__ import print_function
+import sys
+import time
+import larch
+
+CODE = '''
+x = linspace(0, 10, %(n)i)
+y = zeros(%(n)i)
+a, b = 2.5, 1.0
+for i in range(len(x)):
+    y[i] = a*x[i] + b
+for i in range(1, len(x)-1):
+    y[i] += 0.5*(x[i+1] - x[i-1]) * exp(-x[i])
+'''
+
+def run(vectorize, npts):
+    li = larch.Interpreter(vectorize=vectorize)
+    t0 = time.time()
+    li.eval(CODE % dict(n=npts))
+    dt = time.time() - t0
+    if li.error:
+        print(li.error[0].get_error())
+    return dt, li.symtable._sys.vectorize.loops
+
+if __name__ == '__main__':
+    npts = 20000
+    if len(sys.argv) > 1:
+        npts = int(sys.argv[1])
+    t_plain, loops = run(False, npts)
+    t_vec, loops = run(True, npts)
+    print('elementwise loops  n=%i  interp: %.3fs  vectorized: %.4fs  '
+          'speedup: %.0fx' % (npts, t_plain, t_vec, t_plain/t_vec))
+    for fname, lineno, result in loops:
+        print('   line %i: %s' % (lineno, result))
@@ -3,9 +3,13 @@
 import unittest
 import larch
 import code
+import gc
+import time
+import weakref
+import threading
 import numpy
 from unittest_util import *
-from larch.symboltable import isgroup, Group
+from larch.symboltable import isgroup, Group, LazyGroup, frame_class
 
 class TestSymbolTable(TestCase):
 
@@ -75,6 +79,64 @@ class TestSymbolTable(TestCase):
         self.assert_(isinstance(self.s._main.foo, numpy.ndarray))
         self.assertListEqual(self.s._main.foo, range(10))
 
+    def test_set_symbol_releases_value(self):
+        '''values replaced by set_symbol are freed without gc'''
+
+        gc.disable()
+        try:
+            self.s.set_symbol('_main.foo', numpy.arange(10))
+            ref = weakref.ref(self.s._main.foo)
+            self.s.set_symbol('_main.foo', 1)
+            self.assert_(ref() is None)
+        finally:
+            gc.enable()
+
+    def test_lazy_group(self):
+        '''deferred members are made when first looked up'''
+
+        loads = []
+        def load(name):
+            loads.append(name)
+            return name.upper()
+        grp = LazyGroup(name='lazy', x=1)
+        grp._defer(['a', 'b', 'c'], load)
+        self.assert_(dir(grp) == ['a', 'b', 'c', 'x'] and len(grp) == 3)
+        self.assert_(grp.a == 'A' and hasattr(grp, 'b'))
+        self.assert_(not hasattr(grp, 'd'))
+        self.assert_(grp.a == 'A' and loads == ['a', 'b'])
+        grp.c = 3
+        del grp.b
+        self.assert_(loads == ['a', 'b'] and dir(grp) == ['a', 'c', 'x'])
+        grp._defer(['d'], load)
+        del grp.d
+        self.assert_(not hasattr(grp, 'd'))
+        grp._defer(['e'], load)
+        self.assert_(grp._members() == ['__name__', 'a', 'c', 'e', 'x'])
+        self.assert_(grp._publicmembers()['e'] == 'E')
+
+    def test_lazy_group_threads(self):
+        '''threads looking up a member being made wait for it'''
+
+        loads = []
+        def load(name):
+            loads.append(name)
+            time.sleep(0.1)
+            return name.upper()
+        grp = LazyGroup(name='lazy')
+        grp._defer(['a'], load)
+        found, errors = [], []
+        def lookup():
+            try:
+                found.append(grp.a)
+            except AttributeError as exc:
+                errors.append(exc)
+        threads = [threading.Thread(target=lookup) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assert_(not errors and found == ['A'] * 8 and loads == ['a'])
+
     def test_set_symbol_in_group(self):
         '''set symbol into group'''
 
@@ -83,6 +145,87 @@ class TestSymbolTable(TestCase):
         self.assert_(hasattr(self.s.get_symbol('g'), 'foo'))
         self.assert_(self.s.get_symbol('g').foo == 1)
 
+    def test_lookup_cache_frames(self):
+        '''cached lookups follow local and module groups'''
+
+        self.s._math.val = 'math'
+        self.assert_(self.s.get_symbol('val') == 'math')
+        local = Group(name='local', val='local')
+        module = Group(name='module', val='module')
+        with self.s.in_frame(local, self.s):
+            self.assert_(self.s.get_symbol('val') == 'local')
+        with self.s.in_frame(Group(name='empty'), module):
+            self.assert_(self.s.get_symbol('val') == 'module')
+        self.assert_(self.s.get_symbol('val') == 'math')
+        self.s.set_symbol('val', 'main')
+        self.assert_(self.s.get_symbol('val') == 'main')
+        self.s.del_symbol('val')
+        self.assert_(self.s.get_symbol('val') == 'math')
+
+    def test_lookup_cache_invalidate(self):
+        '''cached lookups see changes to the search path'''
+
+        self.s._math.val = 'math'
+        self.s._builtin.val = 'builtin'
+        self.assert_(self.s.get_symbol('val') == 'builtin')
+        self.s.set_symbol('val', 'sys', group='_sys')
+        self.assert_(self.s.get_symbol('val') == 'sys')
+        self.s.del_symbol('_sys.val')
+        self.assert_(self.s.get_symbol('val') == 'builtin')
+        del self.s._builtin.val
+        self.assert_(self.s.get_symbol('val') == 'math')
+        del self.s._math.val
+        self.assertRaises(LookupError, self.s.get_symbol, 'val')
+        self.s.set_symbol('val', 'g0', group='g0')
+        self.assertRaises(LookupError, self.s.get_symbol, 'val')
+        self.s._sys.searchGroups.append('g0')
+        self.assert_(self.s.get_symbol('val') == 'g0')
+
+    def test_lookup_cache_hidden(self):
+        '''a cached name is hidden by one set later earlier in the path'''
+
+        self.li('''
+def f():
+    return e
+#enddef
+def g():
+    a = pi
+    _main.pi = 3
+    return (a, pi)
+#enddef
+''')
+        self.assert_(abs(self.li('f()') - 2.718281828) < 1.e-8)
+        self.li('e = 5')
+        self.assert_(self.li('f()') == 5)
+        a, pi = self.li('g()')
+        self.assert_(abs(a - 3.141592653) < 1.e-8 and pi == 3)
+        del self.li.symtable.e
+        self.assert_(abs(self.li('f()') - 2.718281828) < 1.e-8)
+
+    def test_lookup_dotted_local_first(self):
+        '''dotted names are resolved from the local group first'''
+
+        local = Group(name='local', g0=Group(name='local_g0', x=10))
+        with self.s.in_frame(local, self.s):
+            self.assert_(self.s.get_symbol('g0.x') == 10)
+        self.assert_(self.s.get_symbol('g0.x') == 1)
+
+    def test_local_frame(self):
+        '''procedure frames keep arguments in slots'''
+
+        frame = frame_class(['a', 'b', None])(name='f')
+        self.assert_(frame_class(['a', 'b']) is type(frame))
+        frame.a = 1
+        with self.s.in_frame(frame, self.s):
+            self.s.set_symbol('c', 3)
+            self.assert_(self.s.get_symbol('a') == 1)
+            self.assert_(self.s.get_symbol('c') == 3)
+            self.assertRaises(LookupError, self.s.get_symbol, 'b')
+        self.assert_(frame.__dict__ == {'c': 3})
+        self.assert_(dir(frame) == ['a', 'c'])
+        self.assert_(frame._publicmembers() == {'a': 1, 'c': 3})
+        self.assertRaises(LookupError, self.s.get_symbol, 'a')
+
         
 
 if __name__ == '__main__': # pragma: no cover
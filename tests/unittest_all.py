@@ -19,8 +19,25 @@ if '' not in sys.path:
 import larch
 from larch.interpreter import search_dirs
 from larch.symboltable import GroupAlias
-from unittest_larchEval import TestLarchEval, TestParse, TestBuiltins
+from unittest_larchEval import TestLarchEval, TestParse, TestBuiltins, \
+     TestParseCache, TestIteration, TestAugAssign, TestDefinedVariable
 from unittest_SymbolTable import TestSymbolTable
+from unittest_compiler import TestCompiler, TestCompiledEval
+from unittest_codecache import TestCodeCache
+from unittest_optimize import TestVectorize, TestFoldConstants, \
+     TestFoldedEval, TestFuse, TestFusedEval
+from unittest_profiler import TestProfiler
+from unittest_hooks import TestHooks, TestCoverage
+from unittest_parallel import TestParallel
+from unittest_context import TestContext
+from unittest_reactive import TestReactive
+from unittest_closure import TestClosure
+from unittest_startup import TestStartup
+from unittest_modulepath import TestModuleIndex
+from unittest_plugins import TestPlugins
+from unittest_session import TestSession
+from unittest_forkserver import TestForkServer
+from unittest_escan import TestEscanData, TestH5Proxy
 from unittest_util import *
 
 #------------------------------------------------------------------------------
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import unittest
+
+import larch
+from larch.closure import Closure, BoundCall, bind_call, keyword_names
+from unittest_util import *
+
+def takes_larch(x, y=2, larch=None):
+    "a function taking the larch keyword"
+    return (x, y, larch)
+
+def takes_any(x, **kws):
+    return (x, kws)
+
+def takes_none(x):
+    return x
+
+class TestClosure(TestCase):
+    '''closures and bound calls for builtins and plugins'''
+
+    def test_closure(self):
+        '''keywords of closures are merged with those of calls'''
+
+        func = Closure(func=takes_larch, larch='L')
+        self.assert_(func(1) == (1, 2, 'L'))
+        self.assert_(func(1, y=3) == (1, 3, 'L'))
+        self.assert_(func(1, larch='M') == (1, 2, 'M'))
+        self.assert_(func.kwds == {'larch': 'L'})
+        self.assert_(Closure(func=takes_none)(4) == 4)
+
+    def test_bind_call(self):
+        '''only keywords a function takes are bound'''
+
+        self.assert_(keyword_names(takes_larch) == set(['x', 'y', 'larch']))
+        self.assert_(keyword_names(takes_any) is None)
+        self.assert_(keyword_names(abs) is None)
+        self.assert_(bind_call(takes_none, larch='L') is takes_none)
+        func = bind_call(takes_larch, larch='L', parent='P')
+        self.assert_(isinstance(func, BoundCall))
+        self.assert_(func.keywords == {'larch': 'L'})
+        self.assert_(func(1, y=3) == (1, 3, 'L'))
+        self.assert_(func.__doc__ == takes_larch.__doc__)
+        self.assert_(repr(func) == '<function takes_larch>')
+        self.assert_(bind_call(takes_any, larch='L')(1) == (1, {'larch': 'L'}))
+
+    def test_builtins(self):
+        '''builtins are bound to their interpreter'''
+
+        group = self.s._builtin.group
+        self.assert_(isinstance(group, BoundCall))
+        self.assert_(group.keywords['larch'] is self.li)
+        self.li('g = group(a=1)')
+        self.true('g.a == 1')
+        self.li('x = max(1, 2)')
+        self.true('x == 2')
+
+if __name__ == '__main__': # pragma: no cover
+    for case in (TestClosure,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import larch
+from larch import codecache
+from unittest_util import *
+
+class TestCodeCache(TestCase):
+    '''.larc cache for imported larch modules'''
+
+    source = '''x = 1
+y = 0
+for i in arange(10):
+    y += i
+#endfor
+'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.tmpdir = tempfile.mkdtemp(prefix='larch')
+        self.s._sys.path.insert(0, self.tmpdir)
+        self.modfile = os.path.join(self.tmpdir, 'cachetest.lar')
+        with open(self.modfile, 'w') as outf:
+            outf.write(self.source)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def import_mod(self):
+        li = larch.Interpreter(writer=self.stdout)
+        li.symtable._sys.path.insert(0, self.tmpdir)
+        li('import cachetest')
+        self.assert_(li.error == [])
+        return li.symtable.cachetest
+
+    def test_write_cache(self):
+        '''importing writes a .larc file next to the source'''
+
+        self.import_mod()
+        self.assert_(os.path.isfile(self.modfile + 'c'))
+
+    def test_warm_import(self):
+        '''warm imports skip conversion'''
+
+        self.import_mod()
+        log = []
+        with fake_call(codecache.convert, call_logger(log)):
+            mod = self.import_mod()
+        self.assert_(log == [])
+        self.assert_(mod.x == 1 and mod.y == 45)
+
+    def test_stale_cache(self):
+        '''changed sources are converted again'''
+
+        self.import_mod()
+        with open(self.modfile, 'w') as outf:
+            outf.write(self.source.replace('x = 1', 'x = 2'))
+        self.assert_(codecache.load(self.modfile) is None)
+        self.assert_(self.import_mod().x == 2)
+
+    def test_other_version(self):
+        '''caches written by other versions of larch or Python are not
+        used'''
+
+        from larch import interpreter
+        self.import_mod()
+        self.assert_(codecache.load(self.modfile) is not None)
+        with temp_set((interpreter, '__version__'), '0.0.0'):
+            self.assert_(codecache.load(self.modfile) is None)
+        with temp_set((sys, 'version_info'), (1, 5, 2)):
+            self.assert_(codecache.load(self.modfile) is None)
+        self.assert_(codecache.load(self.modfile) is not None)
+
+    def test_no_cache(self):
+        '''the cache can be turned off'''
+
+        self.li.use_codecache = False
+        self.li.symtable._sys.path.insert(0, self.tmpdir)
+        self.li('import cachetest')
+        self.assert_(self.s.cachetest.y == 45)
+        self.assert_(not os.path.exists(self.modfile + 'c'))
+
+if __name__ == '__main__':  # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestCodeCache)
+    unittest.TextTestRunner(verbosity=2).run(suite)
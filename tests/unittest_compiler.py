@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import unittest
+import ast
+import numpy
+
+import larch
+from unittest_util import *
+from unittest_larchEval import TestLarchEval
+
+class TestCompiledEval(TestLarchEval):
+    '''rerun evaluation tests with compiled closures'''
+
+    def setUp(self):
+        TestLarchEval.setUp(self)
+        self.li.use_compiler = True
+
+class TestCompiler(TestCase):
+    '''compiled closures give the same results as the interpreter'''
+
+    code = '''
+n = 0
+x = arange(20)*1.0
+y = zeros(20)
+for i in range(20):
+    if i == 15:
+        break
+    if i % 2:
+        continue
+    y[i] = 2*x[i] + 1
+    n += i
+k = 0
+while k < 10:
+    k += 1
+def f(a, b=2):
+    "doc"
+    return a*b + k
+z = [f(i) for i in range(4) if i > 0]
+g = group(a=1)
+g.b = f(3, b=3)
+u, v = (1, 2)
+w = 1 < 2 < 3
+q = not (1 > 2) or False
+'''
+
+    def run_code(self, use_compiler):
+        li = larch.Interpreter(writer=self.stdout, use_compiler=use_compiler)
+        li.eval(self.code)
+        self.assert_(li.error == [])
+        return li.symtable
+
+    def test_same_results(self):
+        '''compiled and interpreted code agree'''
+
+        ref, comp = self.run_code(False), self.run_code(True)
+        for name in ('n', 'k', 'u', 'v', 'w', 'q'):
+            self.assert_(getattr(ref, name) == getattr(comp, name))
+        self.assertListEqual(list(ref.y), list(comp.y))
+        self.assertListEqual(list(ref.z), list(comp.z))
+        self.assert_(ref.g.b == comp.g.b == 19)
+
+    def test_code_cached(self):
+        '''nodes are compiled once'''
+
+        node = ast.parse('a = 1 + 2')
+        compiler = self.li.compiler
+        self.assert_(compiler.compile(node) is compiler.compile(node))
+
+    def test_runtime_error(self):
+        '''errors inside compiled loops are reported'''
+
+        self.li.use_compiler = True
+        self.li.eval('''
+x = 0
+for i in range(4):
+    x = x + undefined_name
+''')
+        self.assert_(len(self.li.error) > 0)
+        self.assert_(isinstance(self.li.error[0].py_exc[1], LookupError))
+
+    def test_fallback(self):
+        '''nodes without compiled form use the interpreter handlers'''
+
+        self.li.use_compiler = True
+        self.li.eval('''
+try:
+    a = 1/0
+except ZeroDivisionError:
+    a = 2
+''')
+        self.assert_(self.s.a == 2)
+
+if __name__ == '__main__':  # pragma: no cover
+    for suite in (TestCompiler, TestCompiledEval):
+        suite = unittest.TestLoader().loadTestsFromTestCase(suite)
+        unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import unittest
+import threading
+
+import larch
+from larch.symboltable import Group
+from unittest_util import *
+
+def in_thread(func, *args):
+    "run func(*args) in a new thread, giving its result"
+    out = []
+    thread = threading.Thread(target=lambda: out.append(func(*args)))
+    thread.start()
+    thread.join()
+    return out[0]
+
+class TestContext(TestCase):
+    '''execution state kept for each thread'''
+
+    code = '''
+def f(x):
+    y = x*2
+    return y + 1
+#enddef
+'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.li(self.code)
+
+    def test_errors(self):
+        '''errors and return values of each thread'''
+
+        def run(text):
+            val = self.li(text)
+            return val, len(self.li.error)
+        self.li('x = 1/0')
+        nerrors = len(self.li.error)
+        self.assert_(nerrors > 0)
+        self.assert_(in_thread(run, 'f(3)') == (7, 0))
+        val, terrors = in_thread(run, 'f()')
+        self.assert_(val is None and terrors > 0)
+        self.assert_(len(self.li.error) == nerrors)
+        self.assert_(self.li.error[0].py_exc[0] is ZeroDivisionError)
+
+    def test_frames(self):
+        '''frames of each thread'''
+
+        local = Group(name='local')
+        self.s.set_frame((local, self.s))
+        self.assert_(self.s._sys.localGroup is local)
+        def frame():
+            return (self.s._sys.localGroup, len(self.s._sys.frames))
+        self.assert_(in_thread(frame) == (self.s, 0))
+        self.assert_(self.s._sys.localGroup is local)
+        self.assert_('localGroup' in dir(self.s._sys))
+        self.assert_('_context' not in dir(self.s._sys))
+
+    def test_concurrent(self):
+        '''procedure calls from several threads at once'''
+
+        results, nthreads = {}, 4
+        start = threading.Event()
+        def run(n):
+            start.wait()
+            for i in range(200):
+                val = self.s.f(n*1000 + i)
+                if val != 2*(n*1000 + i) + 1 or self.li.error:
+                    results[n] = False
+                    return
+            results[n] = len(self.s._sys.frames) == 0
+        threads = [threading.Thread(target=run, args=(n,))
+                   for n in range(nthreads)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+        self.assert_(results == dict((n, True) for n in range(nthreads)))
+        self.assert_(not hasattr(self.s, 'y'))
+
+    def test_write_lock(self):
+        '''changes of shared groups'''
+
+        lock = self.s.write_lock()
+        self.li('n = 0')
+        def incr():
+            for i in range(500):
+                with lock:
+                    self.s.n = self.s.n + 1
+        threads = [threading.Thread(target=incr) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.true('n == 2000')
+        self.assert_(lock.acquire(False))
+        lock.release()
+
+if __name__ == '__main__': # pragma: no cover
+    for case in (TestContext,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(verbosity=2).run(suite)
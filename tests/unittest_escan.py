@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import imp
+import shutil
+import unittest
+import tempfile
+
+import numpy
+from unittest_util import *
+
+# load escan_data by path: the dataviewer package needs wx
+escan_data = imp.load_source('escan_data',
+                             os.path.join(os.path.dirname(__file__), '..',
+                                          'larch', 'modules', 'dataviewer',
+                                          'escan_data.py'))
+
+HEADER = '''; Epics Scan 2 dimensional scan
+; current scan dimension = 2
+; scan dimension = 2
+; scan prefix = FastMap
+; ====================================
+; column labels:
+; P1 = {Sample X} --> 13XRM:m1.VAL
+%(dets)s; scan regions:
+; start = 0.0, stop = 1.0
+; User Titles:
+; synthetic map for tests
+; PV list:
+; 13XRM:m2.VAL = 0.0
+; scan began at time: 01-Jan-2010 00:00:00
+; ----------------------------------
+'''
+
+def write_scan(fname, nrows, npts, nmca=2, iocr=True):
+    """write a 2-d escan file of nrows x npts points with nmca 'Fe Ka'
+    detectors, an I0 detector and (with iocr) ICR and OCR columns for
+    each mca, returning the data as a (nrows*npts, ncols) array"""
+    dets = ['{mca%i:Fe Ka} --> 13SDD1:mca%i.R0' % (i+1, i+1)
+            for i in range(nmca)]
+    dets.append('{I0} --> 13IDC:scaler1.S2')
+    if iocr:
+        dets.extend(['{mca%i:ICR} --> 13SDD1:dxp%i.ICR' % (i+1, i+1)
+                     for i in range(nmca)])
+        dets.extend(['{mca%i:OCR} --> 13SDD1:dxp%i.OCR' % (i+1, i+1)
+                     for i in range(nmca)])
+    labels = ['P1'] + ['D%i' % (i+1) for i in range(len(dets))]
+    ncols = len(labels)
+    data = numpy.arange(nrows*npts*ncols, dtype=float).reshape(-1, ncols)
+    data[:, 0] = numpy.tile(numpy.arange(npts), nrows)
+    if iocr:
+        data[:, -2*nmca:-nmca] += 2000     # ICR
+        data[:, -nmca:] += 1000            # OCR
+    with open(fname, 'w') as out:
+        out.write(HEADER % dict(dets=''.join(['; D%i = %s\n' % (i+1, d)
+                                              for i, d in enumerate(dets)])))
+        out.write('; %s\n' % ' '.join(labels))
+        for irow in range(nrows):
+            out.write(';2D 13XRM:m2.VAL %.4f\n' % (irow*0.01))
+            numpy.savetxt(out, data[irow*npts:(irow+1)*npts], fmt='%.1f')
+    return data
+
+XRF_HEADER = '''; MCA Spectra
+; CAL_OFFSET: -0.010 -0.012 -0.011 -0.009
+; CAL_SLOPE: 0.0100 0.0101 0.0099 0.0100
+%(quad)s; ROI0: Fe Ka : 2 : 4
+; ROI0: Fe Ka : 2 : 4
+; ROI0: Fe Ka : 2 : 4
+; ROI0: Fe Ka : 2 : 4
+;----------------------------------
+; ix iy spectra
+'''
+QUAD = '; CAL_QUAD: 1.e-7 2.e-7 3.e-7 4.e-7\n'
+
+def write_xrf(fname, nrows, npts, nchan, quad=True, blank_after=None,
+              nblank=0, nlead=0):
+    """write full XRF spectra of 4 detectors for a 2-d scan, with
+    nblank blank lines after the spectrum line blank_after and nlead
+    before the first, returning the spectra as a (nrows, npts, 4, nchan)
+    array"""
+    spectra = numpy.arange(nrows*npts*4*nchan).reshape(nrows, npts,
+                                                        4, nchan)
+    with open(fname, 'w') as out:
+        out.write(XRF_HEADER % dict(quad=QUAD if quad else ''))
+        out.write('\n' * nlead)
+        iline = 0
+        for iy in range(nrows):
+            for ix in range(npts):
+                vals = [ix+1, iy+1] + list(spectra[iy, ix].ravel())
+                out.write('%s\n' % ' '.join(['%i' % v for v in vals]))
+                if iline == blank_after:
+                    out.write('\n' * nblank)
+                iline += 1
+    return spectra
+
+class CountingDataset(object):
+    "stand-in for an h5py dataset:  a numpy array counting its reads"
+    def __init__(self, data):
+        self.data = data
+        self.shape = data.shape
+        self.dtype = data.dtype
+        self.reads = []
+
+    def __getitem__(self, key):
+        self.reads.append(key)
+        return self.data[key].copy()
+
+class TestH5Proxy(unittest.TestCase):
+    '''lazy, cached reads of hdf5 datasets'''
+
+    def setUp(self):
+        self.data = numpy.arange(5*3*4).reshape(5, 3, 4)
+        self.dset = CountingDataset(self.data)
+        self.proxy = escan_data.H5Proxy(self.dset, cache_size=2)
+
+    def test_attributes(self):
+        '''the proxy has the shape of the dataset, and reads nothing'''
+
+        proxy = self.proxy
+        self.assert_(proxy.shape == (5, 3, 4) and proxy.ndim == 3)
+        self.assert_(proxy.dtype == self.data.dtype and len(proxy) == 5)
+        self.assert_(self.dset.reads == [])
+
+    def test_cached_slices(self):
+        '''slices by an integer index are read once, and kept in a small
+        least-recently-used cache'''
+
+        proxy, reads = self.proxy, self.dset.reads
+        self.assert_(numpy.all(proxy[1] == self.data[1]))
+        self.assert_(numpy.all(proxy[1] == self.data[1]))
+        self.assert_(numpy.all(proxy[-1] == self.data[4]))
+        self.assert_(reads == [1, 4])
+        proxy[1]
+        proxy[2]                # drops 4, the least recently used
+        proxy[1]
+        self.assert_(reads == [1, 4, 2])
+        proxy[4]
+        self.assert_(reads == [1, 4, 2, 4])
+        self.assert_(numpy.all(proxy[numpy.int64(1)] == self.data[1]))
+        self.assert_(len(reads) == 4)
+
+    def test_other_keys(self):
+        '''other keys are read from the dataset each time'''
+
+        proxy, reads = self.proxy, self.dset.reads
+        self.assert_(numpy.all(proxy[1:3, 0] == self.data[1:3, 0]))
+        self.assert_(numpy.all(proxy[1:3, 0] == self.data[1:3, 0]))
+        self.assert_(len(reads) == 2)
+
+    def test_arrays(self):
+        '''the proxy can be iterated over and used as an array'''
+
+        self.assert_(numpy.all(numpy.asarray(self.proxy) == self.data))
+        self.assert_(numpy.asarray(self.proxy, dtype=float).dtype == float)
+        self.assert_(numpy.all(numpy.array(list(self.proxy)) == self.data))
+        self.assert_(numpy.all(self.proxy[3]*2 == self.data[3]*2))
+
+    def test_h5chunks(self):
+        '''chunks read a dataset one slice of its last axes at a time'''
+
+        self.assert_(escan_data.h5chunks((5, 3, 4), 1) == (1, 1, 4))
+        self.assert_(escan_data.h5chunks((5, 3, 4), 2) == (1, 3, 4))
+        self.assert_(escan_data.h5chunks((5,), 1) is None)
+        self.assert_(escan_data.h5chunks((0, 3), 1) is None)
+
+class TestEscanData(TestCase):
+    '''reading EPICS scan files'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.tmpdir = tempfile.mkdtemp(prefix='larch')
+        self.fname = os.path.join(self.tmpdir, 'scan.dat')
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def read(self, **kws):
+        dat = escan_data.escan_data(message=lambda state, val: None)
+        for key, val in kws.items():
+            setattr(dat, key, val)
+        self.assert_(dat.read_ascii(self.fname) is None)
+        return dat
+
+    def column(self, data, icol, nrows, npts):
+        return data[:, icol].reshape(nrows, npts)
+
+    def test_columns(self):
+        '''positions and detectors are read in chunks into 2-d maps'''
+
+        data = write_scan(self.fname, 3, 5, iocr=False)
+        dat = self.read(chunk_rows=4)
+        self.assert_(dat.dimension == 2 and len(dat.y) == 3)
+        self.assert_(numpy.all(dat.x == numpy.arange(5)))
+        self.assert_(dat.pos.shape == (1, 3, 5) and dat.det.shape == (3, 3, 5))
+        for i in range(3):
+            self.assert_(numpy.all(dat.det[i] ==
+                                   self.column(data, i+1, 3, 5)))
+        self.assert_(dat.sums_names == ['Fe Ka', 'I0'])
+        self.assert_(dat.sums_list == [[0, 1], 2])
+        self.assert_(numpy.all(dat.sums[0] == dat.det[0] + dat.det[1]))
+        self.assert_(dat.det_corr is dat.det)
+
+    def test_sums_leave_detectors(self):
+        '''summing detectors leaves the first detector of a sum, and the
+        ICR used for dead time corrections, unchanged'''
+
+        data = write_scan(self.fname, 3, 5)
+        dat = self.read()
+        fe1, fe2, i0 = [self.column(data, i, 3, 5) for i in (1, 2, 3)]
+        icr = [self.column(data, i, 3, 5) for i in (4, 5)]
+        ocr = [self.column(data, i, 3, 5) for i in (6, 7)]
+        self.assert_(dat.det.shape == (3, 3, 5))
+        self.assert_(numpy.all(dat.det[0] == fe1))
+        self.assert_(numpy.allclose(dat.iocr[0], icr[0]/ocr[0]))
+        self.assert_(numpy.allclose(dat.iocr[1], icr[1]/ocr[1]))
+        self.assert_(numpy.allclose(dat.det_corr[0], fe1*icr[0]/ocr[0]))
+        self.assert_(numpy.allclose(dat.det_corr[1], fe2*icr[1]/ocr[1]))
+        self.assert_(numpy.all(dat.det_corr[2] == i0))
+        self.assert_(numpy.all(dat.det[1] == fe2))
+
+    def read_xrf(self, nrows, npts, **kws):
+        "escan_data for a 2-d scan, with full XRF spectra read"
+        dat = escan_data.escan_data(message=lambda state, val: None)
+        dat.PrintMessage = lambda text: None
+        dat.dimension = 2
+        for key, val in kws.items():
+            setattr(dat, key, val)
+        dat.read_fullxrf(self.fname + '.fullxrf', npts, nrows)
+        return dat
+
+    def test_fullxrf(self):
+        '''full XRF spectra are read into an integer map, with energies
+        from the calibration of each detector'''
+
+        spectra = write_xrf(self.fname + '.fullxrf', 3, 5, 8)
+        dat = self.read_xrf(3, 5, xrf_chunk_rows=4)
+        self.assert_(dat.has_fullxrf)
+        self.assert_(dat.xrf_data.dtype == numpy.int32)
+        self.assert_(dat.xrf_data.shape == (3, 5, 4, 8))
+        self.assert_(numpy.all(dat.xrf_data == spectra))
+        chan = numpy.arange(8)
+        for idet, quad in enumerate((1.e-7, 2.e-7, 3.e-7, 4.e-7)):
+            offset = (-0.010, -0.012, -0.011, -0.009)[idet]
+            slope = (0.0100, 0.0101, 0.0099, 0.0100)[idet]
+            self.assert_(numpy.allclose(dat.xrf_energies[idet],
+                                        offset + slope*chan + quad*chan**2,
+                                        rtol=0, atol=1.e-12))
+        self.assert_('4.00000000e-07' in dat.xrf_header.split('CAL_QUAD:')[1])
+
+    def test_fullxrf_no_quad(self):
+        '''energies are linear without a CAL_QUAD line'''
+
+        write_xrf(self.fname + '.fullxrf', 2, 3, 8, quad=False)
+        dat = self.read_xrf(2, 3)
+        self.assert_(numpy.allclose(dat.xrf_energies[0],
+                                    -0.010 + 0.0100*numpy.arange(8)))
+
+    def test_fullxrf_blank_lines(self):
+        '''a run of blank lines as long as a chunk does not end the
+        spectra'''
+
+        spectra = write_xrf(self.fname + '.fullxrf', 3, 5, 8,
+                            blank_after=3, nblank=6)
+        dat = self.read_xrf(3, 5, xrf_chunk_rows=3)
+        self.assert_(numpy.all(dat.xrf_data == spectra))
+
+    def test_fullxrf_leading_blank_lines(self):
+        '''blank lines before the first spectrum are skipped'''
+
+        spectra = write_xrf(self.fname + '.fullxrf', 3, 5, 8, nlead=2)
+        dat = self.read_xrf(3, 5)
+        self.assert_(dat.xrf_data.shape == (3, 5, 4, 8))
+        self.assert_(numpy.all(dat.xrf_data == spectra))
+
+    def test_fullxrf_no_spectra(self):
+        '''a file without spectra, or with spectra not split evenly
+        between the detectors, is an error'''
+
+        xrfname = self.fname + '.fullxrf'
+        write_xrf(xrfname, 0, 5, 8, nlead=2)
+        self.assertRaises(ValueError, self.read_xrf, 3, 5)
+        write_xrf(xrfname, 0, 5, 8)
+        with open(xrfname, 'a') as out:
+            out.write('1 1 %s\n' % ' '.join(['7'] * 9))
+        self.assertRaises(ValueError, self.read_xrf, 3, 5)
+
+    def test_fullxrf_memmap(self):
+        '''spectra can be written to a memory-mapped .npy file'''
+
+        spectra = write_xrf(self.fname + '.fullxrf', 3, 5, 8)
+        dat = self.read_xrf(3, 5, xrf_memmap=True)
+        mapname = self.fname + '.fullxrf.npy'
+        self.assert_(isinstance(dat.xrf_data, numpy.memmap))
+        self.assert_(os.path.exists(mapname))
+        saved = numpy.load(mapname)
+        self.assert_(saved.dtype == numpy.int32 and
+                     numpy.all(saved == spectra))
+        del dat, saved
+
+    def test_fullxrf_with_scan(self):
+        '''read_ascii reads the spectra of the scan from scan.dat.fullxrf'''
+
+        write_scan(self.fname, 3, 5, iocr=False)
+        spectra = write_xrf(self.fname + '.fullxrf', 3, 5, 8)
+        dat = escan_data.escan_data(message=lambda state, val: None)
+        dat.PrintMessage = lambda text: None
+        self.assert_(dat.read_ascii(self.fname) is None)
+        self.assert_(dat.has_fullxrf and numpy.all(dat.xrf_data == spectra))
+
+    def test_no_h5_cache(self):
+        '''read_data_file writes no hdf5 cache unless asked'''
+
+        write_scan(self.fname, 3, 5)
+        dat = escan_data.escan_data(message=lambda state, val: None)
+        self.assert_(dat.read_data_file(self.fname) is None)
+        self.assert_(os.listdir(self.tmpdir) == ['scan.dat'])
+
+    @unittest.skipUnless(escan_data.has_h5, 'needs h5py')
+    def test_h5file(self):
+        '''a scan written with write_h5file is read back by read_h5file,
+        at once or lazily'''
+
+        write_scan(self.fname, 3, 5)
+        write_xrf(self.fname + '.fullxrf', 3, 5, 8)
+        dat = self.read()
+        h5name = self.fname + '.h5'
+        dat.write_h5file(h5name)
+        for lazy in (False, True):
+            h5dat = escan_data.escan_data(message=lambda state, val: None)
+            self.assert_(h5dat.read_h5file(h5name, lazy=lazy) is None)
+            for attr in ('det', 'sums', 'det_corr', 'xrf_data'):
+                self.assert_(numpy.all(numpy.asarray(getattr(h5dat, attr)) ==
+                                       numpy.asarray(getattr(dat, attr))))
+            h5dat.close()
+
+    @unittest.skipUnless(escan_data.has_h5, 'needs h5py')
+    def test_h5_cache(self):
+        '''with h5_cache, read_data_file writes fname.h5 and reads it
+        while it is newer than fname'''
+
+        write_scan(self.fname, 3, 5)
+        dat = escan_data.escan_data(message=lambda state, val: None,
+                                    h5_cache=True)
+        self.assert_(dat.read_data_file(self.fname) is None)
+        h5name = self.fname + '.h5'
+        self.assert_(os.path.exists(h5name))
+        mtime = os.stat(self.fname).st_mtime
+        os.utime(h5name, (mtime + 10, mtime + 10))
+        h5dat = escan_data.escan_data(message=lambda state, val: None,
+                                      h5_cache=True)
+        self.assert_(h5dat.read_data_file(self.fname) is None)
+        self.assert_(h5dat.h5file is not None)
+        self.assert_(numpy.all(numpy.asarray(h5dat.det) == dat.det))
+        h5dat.close()
+
+if __name__ == '__main__': # pragma: no cover
+    for case in (TestEscanData, TestH5Proxy):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(verbosity=2).run(suite)
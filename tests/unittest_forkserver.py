@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import time
+import shutil
+import unittest
+import tempfile
+import multiprocessing
+from StringIO import StringIO
+
+from larch.forkserver import serve, submit, ForkServer
+from unittest_util import *
+
+class TestForkServer(TestCase):
+    '''running scripts as jobs of a fork server'''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.mkdtemp(prefix='larch')
+        cls.address = os.path.join(cls.tmpdir, 'server.sock')
+        cls.server = multiprocessing.Process(target=serve,
+                                             args=(cls.address,),
+                                             kwargs=dict(preload=['os']))
+        cls.server.start()
+        for i in range(200):
+            if os.path.exists(cls.address):
+                break
+            time.sleep(0.05)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.terminate()
+        cls.server.join()
+        shutil.rmtree(cls.tmpdir)
+
+    def write(self, fname, text):
+        with open(os.path.join(self.tmpdir, fname), 'w') as outf:
+            outf.write(text)
+
+    def submit(self, *scripts):
+        "(status, stdout, stderr) of a job"
+        stdout, stderr = StringIO(), StringIO()
+        status = submit(self.address, scripts, cwd=self.tmpdir,
+                        stdout=stdout, stderr=stderr)
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def test_output(self):
+        '''stdout and stderr of a job are forwarded, and its status'''
+
+        self.write('out.lar', '''
+x = 3 * 7
+print(x)
+import sys
+sys.stderr.write('to stderr\\n')
+''')
+        status, out, err = self.submit('out.lar')
+        self.assert_(status == 0)
+        self.assert_(out.strip() == '21' and err == 'to stderr\n')
+
+    def test_error(self):
+        '''a script failing with a larch error gives status 1, and the
+        following scripts are run'''
+
+        self.write('bad.lar', 'x = 1 / 0\n')
+        self.write('good.lar', 'print("done")\n')
+        status, out, err = self.submit('bad.lar', 'good.lar')
+        self.assert_(status == 1)
+        self.assert_('ZeroDivisionError' in out or 'division' in out)
+        self.assert_(out.strip().endswith('done'))
+
+    def test_exit_status(self):
+        '''the status given to sys.exit() is the status of the job'''
+
+        self.write('exit.lar', 'import sys\nsys.exit(7)\n')
+        self.assert_(self.submit('exit.lar')[0] == 7)
+
+    def test_jobs_isolated(self):
+        '''each job starts from the state of the server, with the
+        modules preloaded'''
+
+        self.write('set.lar', 'y = 5\n')
+        self.write('get.lar', 'print(hasattr(_main, "y"), hasattr(_main, "os"))\n')
+        self.assert_(self.submit('set.lar')[0] == 0)
+        status, out, err = self.submit('get.lar')
+        self.assert_(status == 0 and out.strip() == '(False, True)')
+
+    def test_concurrent(self):
+        '''jobs run at the same time'''
+
+        self.write('slow.lar', 'import time\ntime.sleep(0.5)\nprint("slow")\n')
+        pool = multiprocessing.Pool(4)
+        try:
+            t0 = time.time()
+            results = [pool.apply_async(submit_quiet,
+                                        (self.address, self.tmpdir,
+                                         'slow.lar'))
+                       for i in range(4)]
+            self.assert_([r.get(timeout=30) for r in results] == [0] * 4)
+            self.assert_(time.time() - t0 < 1.9)
+        finally:
+            pool.close()
+            pool.join()
+
+    def test_address_in_use(self):
+        '''a second server cannot take the address of a running one'''
+
+        server = ForkServer(self.address)
+        self.assertRaises(IOError, server.remove_stale)
+
+def submit_quiet(address, cwd, script):
+    "status of a job, dropping its output"
+    return submit(address, [script], cwd=cwd, stdout=StringIO(),
+                  stderr=StringIO())
+
+if __name__ == '__main__': # pragma: no cover
+    for case in (TestForkServer,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(verbosity=2).run(suite)
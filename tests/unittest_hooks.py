@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import unittest
+import os
+import tempfile
+
+import larch
+from larch.larchcov import Coverage, statement_lines, line_ranges
+from unittest_util import *
+
+class TestHooks(TestCase):
+    '''interpreter hooks'''
+
+    code = '''
+def f(x):
+    return x + 1
+#enddef
+a = f(1)
+b = a * 2
+'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.log = []
+
+    def hook(self, event):
+        def hook(node, fname, lineno, arg):
+            self.log.append((event, lineno, arg))
+        return hook
+
+    def test_no_hooks(self):
+        '''no tracing without hooks'''
+
+        self.assert_(not self.li.tracing)
+        self.assert_('interp' not in self.li.__dict__)
+        hook = self.hook('statement')
+        self.li.add_hook('statement', hook)
+        self.assert_(self.li.tracing)
+        self.li.remove_hook('statement', hook)
+        self.assert_(not self.li.tracing)
+        self.assert_('interp' not in self.li.__dict__)
+        self.assertRaises(ValueError, self.li.add_hook, 'line', hook)
+
+    def test_statements(self):
+        '''statement, call and return hooks'''
+
+        for event in ('statement', 'statement_done', 'call', 'return'):
+            self.li.add_hook(event, self.hook(event))
+        self.li(self.code)
+        self.assert_(self.li.error == [])
+        lines = [(event, lineno) for event, lineno, arg in self.log]
+        self.assert_(lines == [('statement', 2), ('statement_done', 2),
+                               ('statement', 5), ('call', 2),
+                               ('statement', 3), ('statement_done', 3),
+                               ('return', 2), ('statement_done', 5),
+                               ('statement', 6), ('statement_done', 6)])
+        self.assert_(self.log[6][2] == 2)
+
+    def test_exception(self):
+        '''exception hook'''
+
+        self.li.add_hook('exception', self.hook('exception'))
+        self.li('x = 1\ny = 1/0')
+        event, lineno, err = self.log[0]
+        self.assert_(isinstance(err.py_exc[1], ZeroDivisionError))
+
+    def test_values(self):
+        '''value hook'''
+
+        self.li.add_hook('value', self.hook('value'))
+        self.li('a = 2*3')
+        self.assert_(('value', 0, 6) in self.log)
+
+class TestCoverage(TestCase):
+    '''line coverage of larch files'''
+
+    code = '''def f(x):
+    return x + 1
+#enddef
+def g(x):
+    return x - 1
+#enddef
+a = f(1)
+'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        fd, self.fname = tempfile.mkstemp(suffix='.lar')
+        with os.fdopen(fd, 'w') as outf:
+            outf.write(self.code)
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        for fname in (self.fname, self.fname + 'c'):
+            if os.path.exists(fname):
+                os.unlink(fname)
+
+    def test_statement_lines(self):
+        '''statements of a file'''
+
+        lines = statement_lines(self.fname)
+        self.assert_(len(lines) == 5)
+        self.assert_(set([1, 4, 7]) <= lines)
+        self.assert_(line_ranges([1, 2, 3, 6, 8, 9]) == '1-3, 6, 8-9')
+
+    def test_run(self):
+        '''coverage of a file'''
+
+        cover = Coverage()
+        self.assert_(cover.run_file(self.fname, quiet=True))
+        statements, run, missed = cover.analysis(self.fname)
+        # only the body of g is not run
+        self.assert_(len(missed) == 1 and 4 < list(missed)[0] < 7)
+        report = cover.report().split('\n')
+        self.assert_(report[1].split()[1:4] == ['5', '1', '80%'])
+
+if __name__ == '__main__': # pragma: no cover
+    for case in (TestHooks, TestCoverage):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(verbosity=2).run(suite)
@@ -10,7 +10,7 @@ import pdb
 import tempfile
 
 import larch
-from larch.symboltable import isgroup
+from larch.symboltable import isgroup, Group
 from unittest_util import *
 
 class TestLarchEval(TestCase):
@@ -149,6 +149,291 @@ class TestParse(TestCase):
         self.assertTrue(ast.dump(ast.parse(larchcode)) == 
                 ast.dump(self.li.compile(larchcode)))
 
+class TestParseCache(TestCase):
+    '''parsed ASTs are cached and safe to reuse'''
+
+    def test_hits(self):
+        '''repeated compiles hit the cache'''
+
+        stats = self.s._sys.parse_cache
+        hits, misses = stats.hits, stats.misses
+        tree = self.li.compile('n = 5')
+        self.assert_(self.li.compile('n = 5') is tree)
+        self.assert_(stats.misses == misses + 1)
+        self.assert_(stats.hits == hits + 1)
+
+    def test_bounded(self):
+        '''least recently used trees are dropped'''
+
+        self.li.parse_cache_size = 2
+        for text in ('a = 1', 'b = 2', 'c = 3'):
+            self.li.compile(text)
+        self.assert_(len(self.li.parse_cache) == 2)
+        self.assert_(('a = 1', None) not in self.li.parse_cache)
+
+    def test_boolop_reuse(self):
+        '''boolean operators can be evaluated repeatedly'''
+
+        self.li('yes = True')
+        for i in range(3):
+            self.true('yes and 1 and 2')
+        self.li('''
+n = 0
+while n < 5 and yes:
+    n += 1
+''')
+        self.assert_(self.s.n == 5)
+
+    def test_procedure_reuse(self):
+        '''procedure definitions can be evaluated repeatedly'''
+
+        text = '''
+def f(a, b=2):
+    "doc for f"
+    return a*b
+'''
+        for i in range(2):
+            self.li(text)
+            self.assert_(self.s.f.__doc__ == 'doc for f')
+            self.assert_(self.s.f.argnames == ['a'])
+            self.assert_(self.s.f.kwargs == [('b', 2)])
+            self.assert_(self.li('f(3)') == 6)
+
+    def test_procedure_args(self):
+        '''procedure arguments'''
+
+        self.li('''
+def f(a, b=2, *c, **kw):
+    return (a, b, c, kw)
+#enddef
+''')
+        self.assert_(self.li('f(1)') == (1, 2, (), {}))
+        self.assert_(self.li('f(1, 3, 4, x=5)') == (1, 3, (4,), {'x': 5}))
+        self.assert_(self.li('f(1, b=4)') == (1, 4, (), {}))
+        self.assert_(len(self.li.error) == 0)
+        self.li('f()')
+        self.assert_(self.li.error[0].msg.startswith('not enough arguments'))
+
+    def test_procedure_too_many_args(self):
+        '''procedure called with too many arguments'''
+
+        self.li('''
+def g(a):
+    return a
+#enddef
+''')
+        self.li('g(1, 2)')
+        self.assert_(self.li.error[0].msg.startswith('too many arguments'))
+
+    def test_procedure_recursion(self):
+        '''recursive procedure has its own locals on each call'''
+
+        self.li('''
+def fact(n):
+    return n < 2 and 1 or n*fact(n-1)
+#enddef
+''')
+        self.assert_(self.li('fact(10)') == 3628800)
+        self.assert_(self.s._sys.localGroup is self.s)
+
+class TestIteration(TestCase):
+    '''lazy loops, generator expressions and generator procedures'''
+
+    gen = '''
+def countdown(n):
+    "count down from n"
+    while n > 0:
+        yield n
+        n = n - 1
+    #endwhile
+#enddef
+'''
+
+    def run_both(self, func):
+        "run a test with the interpreter and the compiler"
+        for use_compiler in (False, True):
+            self.li = larch.Interpreter(writer=self.stdout,
+                                        use_compiler=use_compiler)
+            self.s = self.li.symtable
+            func()
+            self.assert_(self.li.error == [])
+
+    def test_lazy_range(self):
+        '''for loops over range() do not build a list'''
+
+        def check():
+            self.li('''
+n = 0
+for i, (j, k) in enumerate(zip(range(10**12), range(5, 10**12))):
+    n = n + j*k
+    if i >= 3: break
+''')
+            self.assert_(self.s.n == 0*5 + 1*6 + 2*7 + 3*8)
+            self.assert_(self.li('[(i, j) for i in range(4) if i != 2 '
+                                 'for j in range(i) if j > 0]') ==
+                         [(3, 1), (3, 2)])
+            self.assert_(self.li('range(3)') == [0, 1, 2])
+        self.run_both(check)
+
+    def test_redefined_range(self):
+        '''only the builtin range() is replaced'''
+
+        self.li('def range(n):\n    return [n]\n')
+        self.assert_(self.li('[i for i in range(4)]') == [4])
+
+    def test_generator_expression(self):
+        '''generator expressions run as they are iterated over'''
+
+        def check():
+            self.li('def scaled(k):\n    return (k*x for x in range(10**12))\n')
+            self.li('g = scaled(3)')
+            self.assert_(self.li('[g.next() for i in range(3)]') == [0, 3, 6])
+            self.assert_(self.li('sum(x*x for x in range(4))') == 14)
+        self.run_both(check)
+
+    def test_generator_procedure(self):
+        '''procedures with yield return generators'''
+
+        def check():
+            self.li(self.gen)
+            self.assert_(self.li('list(countdown(3))') == [3, 2, 1])
+            self.li('''
+total = 0
+for i in countdown(5):
+    if i == 4: continue
+    if i == 2: break
+    total = total + i
+''')
+            self.assert_(self.s.total == 5 + 3)
+            self.li('''
+def evens(n):
+    for i in range(n):
+        if i % 2: continue
+        yield i
+        if i >= 4: return
+    yield -1
+''')
+            self.assert_(self.li('list(evens(3))') == [0, 2, -1])
+            self.assert_(self.li('list(evens(10))') == [0, 2, 4])
+            self.assert_(self.s._sys.localGroup is self.s)
+        self.run_both(check)
+
+    def test_yield_errors(self):
+        '''yield outside of a statement'''
+
+        self.li('def f():\n    x = yield 1\n')
+        self.li('list(f())')
+        self.assert_(self.li.error[0].msg.startswith('yield is only supported'))
+
+class TestAugAssign(TestCase):
+    '''augmented assignment works in place, as in Python'''
+
+    code = '''
+a = arange(10.)
+alias = a
+view = a[2:6]
+g = group(mu=ones(4))
+mu = g.mu
+a += 1
+view *= 2
+g.mu -= 0.5
+a[0] += 100
+a[7:] /= 4
+n = 3
+n += 2
+'''
+
+    def run_both(self, text):
+        "run code with the interpreter and in a compiled block"
+        for use_compiler in (False, True):
+            self.li = larch.Interpreter(writer=self.stdout,
+                                        use_compiler=use_compiler)
+            self.s = self.li.symtable
+            if use_compiler:
+                text = 'if True:\n' + ''.join(['    %s\n' % line for line
+                                               in text.strip().split('\n')])
+            self.li(text)
+            self.assert_(self.li.error == [])
+            yield self.s
+
+    def test_aliases(self):
+        '''aliases and views see the change, as in Python'''
+
+        expected = dict(numpy.__dict__)
+        expected['group'] = Group
+        exec(self.code, expected)
+        for stable in self.run_both(self.code):
+            self.assert_(stable.alias is stable.a)
+            self.assert_(stable.mu is stable.g.mu)
+            for name in ('a', 'view', 'mu', 'n'):
+                self.assert_(numpy.all(stable.get_symbol(name) ==
+                                       expected[name]))
+
+    def test_errors(self):
+        '''failed in-place operations leave the target alone'''
+
+        self.li('b = arange(4)')
+        self.li('b += 1.5')
+        self.assert_(len(self.li.error) > 0)
+        self.assert_(list(self.s.b) == [0, 1, 2, 3])
+        self.li('g = group()')
+        self.li('g.x += 1')
+        self.assert_(len(self.li.error) > 0)
+
+class TestDefinedVariable(TestCase):
+    '''defined variables keep their value until a symbol they read changes'''
+
+    code = '''
+x = arange(5)
+k = 2
+def scaled(a):
+    return a*k
+#enddef
+definevar('y', 'scaled(x).sum()')
+definevar('z', 'y + 1')
+'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.li(self.code)
+
+    def test_cache(self):
+        '''values are kept between reads'''
+
+        self.assert_(self.li('y') == 20 and self.li('y') == 20)
+        y = self.s.get_symbol('y')
+        self.assert_((y.hits, y.misses) == (1, 1))
+        self.assert_(y.depends >= set(['x', 'k', 'scaled', 'a']))
+        stats = self.s._sys.definedvars
+        self.assert_((stats.hits, stats.misses) == (1, 1))
+
+    def test_invalidate(self):
+        '''values are evaluated again after a change'''
+
+        self.assert_(self.li('z') == 21)
+        self.li('k = 3')
+        self.assert_(self.li('z') == 31)
+        self.li('x = arange(3)')
+        self.assert_(self.li('z') == 10)
+        self.li('g = group(k=1)')
+        self.li('g.k = 2')
+        self.assert_(self.li('z') == 10)
+        self.assert_(self.s.get_symbol('z').misses == 4)
+        self.li('del k')
+        self.li('z')
+        self.assert_(len(self.li.error) > 0)
+
+    def test_no_cache(self):
+        '''cache=False and procedure frames'''
+
+        self.li("definevar('w', 'x.sum()', cache=False)")
+        self.li('w')
+        self.li('w')
+        self.assert_(self.s.get_symbol('w').misses == 2)
+        self.li('def f():\n    x = arange(3)\n    return y\n#enddef')
+        self.assert_(self.li('f()') == 6)
+        self.assert_(self.li('y') == 20)
+
 class TestBuiltins(TestCase):
 
     # These probably aren't unit tests any more, but going through the eval
@@ -291,6 +576,7 @@ class TestBuiltins(TestCase):
         pass
 
 if __name__ == '__main__':  # pragma: no cover
-    for suite in (TestParse, TestLarchEval):
+    for suite in (TestParse, TestLarchEval, TestIteration,
+                  TestAugAssign, TestDefinedVariable):
         suite = unittest.TestLoader().loadTestsFromTestCase(suite)
         unittest.ColoredTextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import sys
+import time
+import shutil
+import unittest
+import tempfile
+
+import larch
+from larch.modulepath import ModuleIndex, PACKAGE
+from unittest_util import *
+
+class TestModuleIndex(TestCase):
+    '''index of module files along the search path'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.tmpdir = tempfile.mkdtemp(prefix='larch')
+        self.dirs = []
+        for name in ('a', 'b'):
+            dirname = os.path.join(self.tmpdir, name)
+            os.mkdir(dirname)
+            self.dirs.append(dirname)
+        self.write('a', 'mod1.lar')
+        self.write('b', 'mod1.lar')
+        self.write('b', 'mod2.py')
+        os.mkdir(os.path.join(self.dirs[1], 'pkg'))
+        self.write('b', os.path.join('pkg', '__init__.py'))
+        self.age()
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, dirname, fname, text='x = 1\n'):
+        fname = os.path.join(self.tmpdir, dirname, fname)
+        with open(fname, 'w') as outf:
+            outf.write(text)
+        return fname
+
+    def age(self, *names):
+        "set the times of the directories (default all) to a minute ago"
+        past = time.time() - 60
+        for name in names or ('a', 'b'):
+            os.utime(os.path.join(self.tmpdir, name), (past, past))
+
+    def test_find(self):
+        '''modules are found in the first directory holding them'''
+
+        index = ModuleIndex()
+        self.assert_(index.update(self.dirs + ['/no/such/dir']))
+        self.assert_(index.find('mod1') == os.path.join(self.dirs[0],
+                                                         'mod1.lar'))
+        self.assert_(index.find('mod2', '.py') == os.path.join(self.dirs[1],
+                                                                'mod2.py'))
+        self.assert_(index.find('pkg', PACKAGE) ==
+                     os.path.join(self.dirs[1], 'pkg'))
+        self.assert_(index.find('mod2') is None)
+        self.assert_(index.update(self.dirs[::-1]))
+        self.assert_(index.find('mod1') == os.path.join(self.dirs[1],
+                                                         'mod1.lar'))
+        self.assert_(index.reads == 2)
+
+    def test_find_python(self):
+        '''python modules are found as import finds them:  in the first
+        directory holding them, packages first, and not after a file
+        that cannot be listed'''
+
+        self.write('a', 'mod2.pyc')
+        os.mkdir(os.path.join(self.dirs[1], 'mod3'))
+        self.write('b', os.path.join('mod3', '__init__.py'))
+        self.write('b', 'mod3.py')
+        index = ModuleIndex()
+        index.update(self.dirs)
+        self.assert_(index.find_python('mod2') == self.dirs[0])
+        self.assert_(index.find_python('pkg') == self.dirs[1])
+        self.assert_(index.find_python('mod3') == self.dirs[1])
+        self.assert_(index.find_python('mod1') is None)
+        zipname = self.write('a', 'lib.zip')
+        index.update([zipname] + self.dirs)
+        self.assert_(index.find_python('mod2') is None)
+        index.update(self.dirs + [zipname])
+        self.assert_(index.find_python('mod2') == self.dirs[0])
+
+    def test_update(self):
+        '''directories are read again only when they change'''
+
+        index = ModuleIndex()
+        index.update(self.dirs[:1])
+        self.assert_(not index.update(self.dirs[:1]) and index.reads == 1)
+        self.assert_(index.update(self.dirs) and index.reads == 2)
+        self.write('a', 'mod3.lar')
+        self.age('a')
+        self.assert_(index.update(self.dirs) and index.reads == 3)
+        self.assert_(index.find('mod3') is not None)
+        self.write('a', 'mod4.lar')
+        self.assert_(index.update(self.dirs) and index.find('mod4'))
+        self.assert_(not index.update(self.dirs) and index.reads == 4)
+        # a time in whole seconds within RACY_SECONDS of now may miss
+        # files added in the same second:  the directory is read again
+        now = int(time.time())
+        os.utime(self.dirs[0], (now, now))
+        self.assert_(not index.update(self.dirs) and index.reads == 5)
+        self.assert_(not index.update(self.dirs) and index.reads == 6)
+
+    def test_import(self):
+        '''the interpreter imports larch modules found by the index'''
+
+        self.s._sys.path.insert(0, self.dirs[1])
+        self.li('''
+def f():
+    import mod1
+    return mod1.x
+#enddef
+''')
+        self.assert_(self.li('f()') == 1)
+        index = self.li.module_index
+        reads = index.reads
+        self.assert_(self.li('f() + f()') == 2 and index.reads == reads)
+        self.write('b', 'mod5.lar', 'y = 2\n')
+        self.li('import mod5')
+        self.assert_(self.li('mod5.y') == 2)
+
+    def test_import_python(self):
+        '''the interpreter imports python modules found by the index,
+        leaving to python those found earlier along sys.path'''
+
+        self.write('b', 'lmi_pymod.py', 'x = 2\n')
+        self.write('b', 'colorsys.py', 'x = 2\n')
+        self.s._sys.path.insert(0, self.dirs[1])
+        try:
+            self.li('import lmi_pymod')
+            self.assert_(self.li('lmi_pymod.x') == 2)
+            self.assert_(sys.modules['lmi_pymod'].__file__.startswith(
+                os.path.join(self.dirs[1], 'lmi_pymod.py')))
+            self.assert_(self.li.python_index.find_python('lmi_pymod') ==
+                         self.dirs[1])
+            self.li('import colorsys')
+            self.assert_(not hasattr(sys.modules['colorsys'], 'x'))
+            self.li('import lmi_nomod')
+            self.assert_(self.li.error)
+        finally:
+            sys.modules.pop('lmi_pymod', None)
+            sys.path.remove(self.dirs[1])
+
+if __name__ == '__main__': # pragma: no cover
+    for case in (TestModuleIndex,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(verbosity=2).run(suite)
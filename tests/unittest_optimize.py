@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import unittest
+import numpy
+
+import os
+import ast
+import pickle
+import larch
+from larch.optimize import VectorFor, Folded, Fused, FUSE_MIN_SIZE
+from unittest_util import *
+from unittest_larchEval import TestLarchEval
+
+class TestVectorize(TestCase):
+    '''elementwise loops run as array operations'''
+
+    setup = '''
+x = linspace(0, 1, 21)
+y = zeros(21)
+z = ones(21)
+a = 2.0
+'''
+
+    loops = ('''
+for i in range(len(x)):
+    y[i] = a*x[i] + sqrt(x[i]) - i
+''', '''
+for i in range(2, 20, 3):
+    y[i] = x[i+1] - x[i-1]
+    z[i] += y[i] / 2
+''', '''
+for j in range(1, 21):
+    y[j] = y[j-1] + x[j]
+''', '''
+for i in range(5):
+    z[i] = a
+    n = i
+''')
+
+    def run_loops(self, **kws):
+        li = larch.Interpreter(writer=self.stdout, **kws)
+        li(self.setup)
+        for loop in self.loops:
+            li(loop)
+            self.assert_(li.error == [])
+        return li
+
+    def test_same_results(self):
+        '''vectorized loops agree with the interpreter'''
+
+        ref = self.run_loops().symtable
+        for use_compiler in (False, True):
+            vec = self.run_loops(vectorize=True,
+                                 use_compiler=use_compiler).symtable
+            for name in ('y', 'z'):
+                self.assert_(numpy.allclose(getattr(ref, name),
+                                            getattr(vec, name)))
+            for name in ('i', 'j', 'n'):
+                self.assert_(getattr(ref, name) == getattr(vec, name))
+
+    def test_report(self):
+        '''vectorized loops are reported'''
+
+        li = self.run_loops(vectorize=True)
+        results = [result for fname, lineno, result
+                   in li.symtable._sys.vectorize.loops]
+        self.assert_(results[:2] == ['vectorized', 'vectorized'])
+        self.assert_(results[2] == "'y' is written and read at an offset")
+        self.assert_(results[3] == "assignment is not to array[i]")
+        self.assert_(li.symtable._sys.vectorize.fallbacks == 0)
+
+    def test_tree_unchanged(self):
+        '''parsed trees are not changed by vectorizing'''
+
+        li = larch.Interpreter(writer=self.stdout, vectorize=True)
+        tree = li.parse(self.loops[0])
+        self.assert_(isinstance(li.optimize(tree).body[0], VectorFor))
+        self.assert_(li.optimize(tree) is li.optimize(tree))
+        self.assert_(not isinstance(tree.body[0], VectorFor))
+
+    def test_fallback(self):
+        '''loops that fail run-time checks are run by the interpreter'''
+
+        li = larch.Interpreter(writer=self.stdout, vectorize=True)
+        li(self.setup)
+        # w is a view of x shifted by one, so this is a recurrence
+        li('w = x[1:]')
+        li('''
+for i in range(10):
+    w[i] = x[i] * 2
+''')
+        self.assert_(li.symtable._sys.vectorize.fallbacks == 1)
+        self.assert_(li('x[10]') == 0)
+
+        # out of range: the interpreter reports the error as usual
+        li('''
+for k in range(25):
+    y[k] = 1.0
+''')
+        self.assert_(li.symtable._sys.vectorize.fallbacks == 2)
+        self.assert_(len(li.error) > 0)
+        self.assert_(li.symtable.k == 21)
+
+class TestFoldedEval(TestLarchEval):
+    '''rerun evaluation tests with constant folding'''
+
+    def setUp(self):
+        TestLarchEval.setUp(self)
+        self.li.fold_constants = True
+
+class TestFoldConstants(TestCase):
+    '''constant folding and dead-branch elimination'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.li = larch.Interpreter(writer=self.stdout, fold_constants=True)
+        self.s = self.li.symtable
+
+    def body(self, text):
+        return self.li.compile(text).body
+
+    def test_evaltest1(self):
+        '''tests/evaltest1.lar gives the same results folded'''
+
+        fname = os.path.join(os.path.dirname(__file__), 'evaltest1.lar')
+        plain = larch.Interpreter(writer=self.stdout)
+        for use_compiler in (False, True):
+            self.li.use_compiler = use_compiler
+            with open(fname) as inf:
+                for line in inf:
+                    if line.strip():
+                        ref, out = plain(line.strip()), self.li(line.strip())
+                        self.assert_(repr(ref) == repr(out))
+                        self.assert_(type(ref) == type(out))
+
+    def test_fold(self):
+        '''constant expressions are folded'''
+
+        self.assert_(isinstance(self.body('2*(3+4)')[0].value, ast.Num))
+        self.assert_(isinstance(self.body('"a" + "b"')[0].value, ast.Str))
+        self.assert_(isinstance(self.body('1 < 2 < 3')[0].value, ast.Num))
+        self.assert_(isinstance(self.body('x*(3+4)')[0].value.right, ast.Num))
+        # errors are left for run time
+        self.assert_(isinstance(self.body('1/0')[0].value, ast.BinOp))
+        self.li('1/0')
+        self.assert_(len(self.li.error) > 0)
+
+    def test_fold_long_strings(self):
+        '''long repeated strings are not made while folding'''
+
+        from larch.compiler import OPERATORS
+        calls = []
+        def mult(a, b):
+            calls.append((a, b))
+            return a * b
+        saved = OPERATORS[ast.Mult]
+        OPERATORS[ast.Mult] = mult
+        try:
+            self.assert_(isinstance(self.body('"ab"*10**8')[0].value,
+                                    ast.BinOp))
+            self.assert_(isinstance(self.body('10**8*"ab"')[0].value,
+                                    ast.BinOp))
+            self.assert_(calls == [])
+            self.assert_(self.body('3*"ab"')[0].value.s == 'ababab')
+        finally:
+            OPERATORS[ast.Mult] = saved
+
+    def test_math_names(self):
+        '''names from _math are folded, and checked when run'''
+
+        node = self.body('2*pi/360')[0].value
+        self.assert_(isinstance(node, Folded))
+        self.assert_(isinstance(self.body('pi')[0].value, ast.Name))
+        self.assert_(self.li('2*pi/360') == 2*numpy.pi/360)
+        self.li('pi = 180')
+        self.assert_(self.li('2*pi/360') == 1)
+        self.li('def f(pi):\n    return sqrt(pi)\n#enddef')
+        self.assert_(self.li('f(4.)') == 2)
+        self.li('del pi')
+        self.assert_(self.li('2*pi/360') == 2*numpy.pi/360)
+
+    def test_dead_branches(self):
+        '''if and while blocks with constant tests are removed'''
+
+        body = self.body('if 0:\n    x = 1\nelse:\n    x = 2\n')
+        self.assert_(len(body) == 1 and isinstance(body[0], ast.Assign))
+        self.assert_(isinstance(self.body('while 0:\n    x = 1\n')[0],
+                                ast.Pass))
+        # statements after break still run in an if block
+        self.li('''
+n = 0
+while n < 3:
+    n += 1
+    if 1:
+        break
+        n = 10
+''')
+        self.assert_(self.s.n == 10)
+
+class TestFusedEval(TestLarchEval):
+    '''rerun evaluation tests with fused expressions'''
+
+    def setUp(self):
+        TestLarchEval.setUp(self)
+        self.li.fuse = True
+
+class TestFuse(TestCase):
+    '''elementwise expressions over large arrays run in blocks'''
+
+    setup = '''
+x = linspace(0, 1, %i)
+a, b, c = 2.0, -3, 0.5
+''' % (3*FUSE_MIN_SIZE + 7)
+
+    exprs = ('a*x**2 + b*x + c',
+             'sqrt(abs(x - 0.5)) * -x',
+             '(x*a - 1) / (x + c)')
+
+    def interp(self, **kws):
+        li = larch.Interpreter(writer=self.stdout, **kws)
+        li(self.setup)
+        return li
+
+    def test_same_results(self):
+        '''fused expressions agree with the interpreter'''
+
+        plain = self.interp()
+        for use_compiler in (False, True):
+            for nthreads in (1, 3):
+                li = self.interp(fuse=True, use_compiler=use_compiler,
+                                 fuse_threads=nthreads)
+                for expr in self.exprs:
+                    ref, out = plain(expr), li(expr)
+                    self.assert_(li.error == [])
+                    self.assert_(ref.dtype == out.dtype)
+                    self.assert_(numpy.allclose(ref, out))
+                stats = li.symtable._sys.fuse
+                self.assert_(stats.runs == 3 and stats.fallbacks == 0)
+
+    def test_fuse(self):
+        '''only elementwise expressions of two or more operations fuse'''
+
+        li = larch.Interpreter(writer=self.stdout, fuse=True)
+        body = li.compile('y = a*x + sum(x*x)\nz = -x').body
+        self.assert_(isinstance(body[0].value, ast.BinOp))
+        self.assert_(isinstance(body[0].value.left, ast.BinOp))
+        self.assert_(isinstance(body[0].value.right.args[0], ast.BinOp))
+        self.assert_(isinstance(body[1].value, ast.UnaryOp))
+        node = li.compile('sin(x)*a + b').body[0].value
+        self.assert_(isinstance(node, Fused))
+        self.assert_(node.names == {'sin': 'func', 'x': 'value',
+                                    'a': 'value', 'b': 'value'})
+
+    def test_fallback(self):
+        '''small arrays, other shapes and non-elementwise functions are
+        run by the interpreter'''
+
+        li = self.interp(fuse=True)
+        li('s = arange(5.)')
+        li('w = x[::2]')
+        li('def f(t):\n    return t[:3]\n#enddef')
+        self.assert_(li('s*a + 1').tolist() == [1, 3, 5, 7, 9])
+        self.assert_(li('x*w + 1') is None and len(li.error) > 0)
+        self.assert_(li('f(x)*2 + 1').shape == (3,))
+        self.assert_(li('w*2 + 1').shape == li.symtable.w.shape)
+        self.assert_(li.symtable._sys.fuse.runs == 0)
+        # f(x)*2 + 1 is not fused, as f is not a ufunc
+        self.assert_(li.symtable._sys.fuse.fallbacks == 3)
+
+    def test_scalars(self):
+        '''fused expressions found to use scalars are run as written
+        until they give large arrays, and names are evaluated once'''
+
+        li = self.interp(fuse=True)
+        li('''
+def f(v):
+    return v*a + b
+#enddef
+t, u = 0.0, 0.0
+for i in range(100):
+    t = t + f(i)
+    u = u + i*2.0 + 1.0
+#endfor
+''')
+        self.assert_(li.error == [])
+        self.assert_(li.symtable.t == 9600 and li.symtable.u == 10000)
+        stats = li.symtable._sys.fuse
+        self.assert_(stats.runs == 0 and stats.fallbacks == 2)
+        node = li.symtable.f.body[0].value
+        self.assert_(isinstance(node, Fused) and not node.blocks)
+        for i in range(2):
+            self.assert_(numpy.allclose(li('f(x)'), li.symtable.x*2.0 - 3))
+        self.assert_(node.blocks and stats.runs == 1)
+        copied = pickle.loads(pickle.dumps(node, pickle.HIGHEST_PROTOCOL))
+        self.assert_(copied.names == node.names and copied.code is None)
+        li.set_definedvariable('dv', 'a * 2')
+        defvars = li.symtable._sys.definedvars
+        for i in range(2):
+            evals = defvars.hits + defvars.misses
+            self.assert_(li('dv*c + 1') == 3.0)
+            self.assert_(defvars.hits + defvars.misses == evals + 1)
+
+if __name__ == '__main__': # pragma: no cover
+    for case in (TestVectorize, TestFoldConstants, TestFoldedEval,
+                 TestFuse, TestFusedEval):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(verbosity=2).run(suite)
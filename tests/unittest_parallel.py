@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import unittest
+
+import larch
+from larch.parallel import used_names, collect_symbols
+from unittest_util import *
+
+class TestParallel(TestCase):
+    '''parallel map of procedures'''
+
+    code = '''
+import os
+scale = 3
+def helper(x):
+    return x*scale
+#enddef
+def f(x):
+    "scaled value"
+    if x == 5:
+        return 1/0
+    return helper(x) + len(os.sep) + sqrt(4)
+#enddef
+'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.li(self.code)
+
+    def test_symbols(self):
+        '''symbols sent to workers'''
+
+        self.assert_(used_names(self.s.f) == ['helper', 'len', 'os', 'sqrt'])
+        symbols = collect_symbols(self.li, self.s.f)
+        self.assert_(sorted(symbols.keys()) == ['helper', 'os', 'scale'])
+        self.assert_(symbols['os'] == ('module', 'os'))
+        self.assert_(symbols['scale'] == ('value', 3))
+        self.assert_(symbols['helper'][1]['args'] == ['x'])
+
+    def test_pmap(self):
+        '''results in order, with errors per item'''
+
+        expected = [3*x + 3.0 for x in range(10)]
+        expected[5] = None
+        for nworkers in (1, 3):
+            out = self.li('pmap(f, range(10), nworkers=%i, chunksize=2)'
+                          % nworkers)
+            self.assert_(out == expected)
+            msgs = [err.msg for err in self.li.error]
+            self.assert_(msgs[0].startswith('pmap item 5: '))
+            self.assert_('ZeroDivisionError' in msgs[0])
+
+        out = self.li('pmap(f, range(6), nworkers=2, errors="ignore")')
+        self.assert_(out == expected[:6])
+        self.assert_(self.li.error == [])
+
+    def test_generator(self):
+        '''generator procedures cannot be mapped'''
+
+        self.li('def g(x):\n    yield x\n')
+        self.li('pmap(g, range(3), nworkers=2)')
+        self.assert_(isinstance(self.li.error[0].py_exc[1], TypeError))
+
+if __name__ == '__main__': # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestParallel)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import ast
+import sys
+import unittest
+
+import larch
+from larch.plugins import Plugin, PLUGINS
+from larch.symboltable import LazyGroup
+from unittest_util import *
+
+# this module is also the plugin module used by the tests
+registered = []
+
+def _double(x, larch=None):
+    return 2*x
+
+def _scale(x, factor=3, larch=None):
+    return factor*x
+
+def registerPlugin():
+    registered.append(1)
+    return ('_sample', True, {'double': _double, 'scale': _scale,
+                              'factor': 3})
+
+SAMPLE = Plugin(__name__, '_sample', True, ('double', 'scale', 'factor'))
+
+class TestPlugins(TestCase):
+    '''plugins loaded when first used'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        del registered[:]
+
+    def test_lazy(self):
+        '''the plugin module is used when a symbol is first looked up'''
+
+        self.s.AddPlugins([SAMPLE], larch=self.li)
+        group = self.s._sample
+        self.assert_(isinstance(group, LazyGroup) and registered == [])
+        self.assert_(dir(group) == ['double', 'factor', 'scale'])
+        self.assert_(self.li('double(4)') == 8 and registered == [1])
+        self.assert_(group.scale.keywords == {'larch': self.li})
+        self.assert_(self.li('scale(2) + factor') == 9)
+        self.assert_(registered == [1])
+
+    def test_set_first(self):
+        '''symbols set before the plugin is loaded are kept'''
+
+        self.s.AddPlugins([SAMPLE])
+        self.li('_sample.factor = 5')
+        self.assert_(self.li('double(1) + factor') == 7)
+
+    def test_missing(self):
+        '''a plugin that cannot be imported leaves its symbols deferred'''
+
+        plugin = Plugin('no_such_plugin_module', '_missing', True, ('gone',))
+        self.s.AddPlugins([plugin])
+        self.assert_(not hasattr(self.s._missing, 'gone'))
+        self.assert_(dir(self.s._missing) == ['gone'])
+        self.li('gone(1)')
+        self.assert_(len(self.li.error) > 0)
+
+    def test_eager(self):
+        '''registerPlugin functions are still called at once'''
+
+        self.s.AddPlugins([registerPlugin], larch=self.li)
+        self.assert_(registered == [1] and self.li('double(2)') == 4)
+
+    def test_metadata(self):
+        '''the names listed for each plugin are those it registers,
+        read from the source so that wx is not imported'''
+
+        plugins = os.path.dirname(larch.plugins.__file__)
+        for plugin in PLUGINS:
+            fname = os.path.join(plugins, '%s.py' %
+                                 plugin.module.split('.')[-1])
+            with open(fname) as inf:
+                tree = ast.parse(inf.read())
+            module = dict([(node.targets[0].id, node.value)
+                           for node in tree.body
+                           if isinstance(node, ast.Assign)])
+            func = [node for node in tree.body
+                    if isinstance(node, ast.FunctionDef) and
+                    node.name == 'registerPlugin'][0]
+            group, insearch, syms = func.body[-1].value.elts
+            if isinstance(group, ast.Name):
+                group = module[group.id]
+            self.assert_(group.s == plugin.group)
+            self.assert_(sorted([key.s for key in syms.keys]) ==
+                         sorted(plugin.names))
+        self.assert_('wx' not in sys.modules)
+
+if __name__ == '__main__': # pragma: no cover
+    for case in (TestPlugins,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import unittest
+import os
+import pstats
+import tempfile
+
+import larch
+from unittest_util import *
+
+class TestProfiler(TestCase):
+    '''timing of larch statements and procedures'''
+
+    code = '''
+def f(x):
+    return x*2 + 1
+#enddef
+x = linspace(0, 1, 100)
+y = 0
+for i in range(5):
+    y = y + f(x)
+'''
+
+    def run_code(self, **kws):
+        li = larch.Interpreter(writer=self.stdout, **kws)
+        li('profile_on()')
+        li(self.code)
+        li('profile_off()')
+        self.assert_(li.error == [])
+        return li
+
+    def test_off(self):
+        '''the profiler is only used when on'''
+
+        li = self.run_code()
+        self.assert_(not li.tracing)
+        self.assert_('interp' not in li.__dict__)
+        ncalls = li.profile_data.lines[('<StdInput>', 8)].ncalls
+        li(self.code)
+        self.assert_(li.profile_data.lines[('<StdInput>', 8)].ncalls == ncalls)
+
+    def test_lines(self):
+        '''statements are timed by line'''
+
+        lines = self.run_code().profile_data.lines
+        self.assert_(lines[('<StdInput>', 7)].ncalls == 1)
+        self.assert_(lines[('<StdInput>', 8)].ncalls == 5)
+        self.assert_(lines[('<StdInput>', 3)].ncalls == 5)
+        self.assert_(lines[('<StdInput>', 3)].func == 'f')
+        # x*2 and x*2 + 1 are both new arrays
+        self.assert_(lines[('<StdInput>', 3)].bytes == 5*2*800)
+        loop = lines[('<StdInput>', 7)]
+        self.assert_(loop.cumtime >= lines[('<StdInput>', 8)].cumtime)
+
+    def test_procedures(self):
+        '''procedures are timed by name'''
+
+        for use_compiler in (False, True):
+            procs = self.run_code(use_compiler=use_compiler).profile_data.procs
+            self.assert_(procs.keys() == [('<StdInput>', 2, 'f')])
+            self.assert_(procs.values()[0].ncalls == 5)
+
+    def test_report(self):
+        '''text, pstats and callgrind reports'''
+
+        li = self.run_code()
+        lines = li('profile_report(sort="line")').split('\n')
+        self.assert_(len(lines) == 8)
+        self.assert_(lines[1].endswith('<StdInput>:1 (<module>)'))
+        self.assert_('f (<StdInput>:2)' in li('profile_report(procedures=True)'))
+
+        fname = tempfile.mktemp()
+        li('profile_report(output="%s", format="pstats")' % fname)
+        stats = pstats.Stats(fname).stats
+        self.assert_(stats[('<StdInput>', 2, 'f')][1] == 5)
+        li('profile_report(output="%s", format="callgrind")' % fname)
+        with open(fname) as inf:
+            self.assert_('calls=5 2' in inf.read())
+        os.unlink(fname)
+
+if __name__ == '__main__': # pragma: no cover
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestProfiler)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import unittest
+
+import numpy
+import larch
+from unittest_util import *
+
+class TestReactive(TestCase):
+    '''values recomputed when the symbols they read change'''
+
+    code = '''
+x = arange(5.)
+k = 2
+definevar('y', 'x*k')
+definevar('z', 'y.sum() + 1')
+'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.li(self.code)
+        self.graph = self.li.reactive
+        self.log = []
+
+    def logger(self, tag):
+        def update(*values):
+            self.log.append((tag,) + values)
+        return update
+
+    def test_update(self):
+        '''dirty nodes are recomputed after each statement'''
+
+        node = self.graph.add(['x', 'z'], update=self.logger('trace'))
+        provides = sorted([tnode.provides for tnode in self.graph.nodes
+                           if tnode is not node])
+        self.assert_(provides == ['y', 'z'])
+        self.li('k = 3')
+        self.assert_(self.log == [('trace', self.s.x, 31.0)])
+        self.assert_(node.updates == 1 and self.graph.flushes == 1)
+        self.li('a = 1')
+        self.assert_(len(self.log) == 1 and self.graph.flushes == 1)
+        self.li('k = 1/0')
+        self.assert_(len(self.log) == 1)
+        self.li("k = 'a'")
+        self.assert_(len(self.log) == 1 and len(node.error) > 0)
+        self.graph.remove(node)
+        self.li('k = 1')
+        self.assert_(len(self.log) == 1)
+
+    def test_order(self):
+        '''nodes are recomputed after the nodes they depend on'''
+
+        self.graph.add(['z'], update=self.logger('z'))
+        self.graph.add(['y'], update=self.logger('y'))
+        nodes = self.graph.order(self.graph.nodes)
+        provides = [node.provides for node in nodes]
+        self.assert_(provides.index('y') < provides.index('z'))
+        self.li('x = arange(3.)')
+        self.assert_([entry[0] for entry in self.log] == ['z', 'y'])
+        self.assert_(self.log[0][1] == 7)
+
+    def test_schedule(self):
+        '''changes are batched until the scheduled flush'''
+
+        pending = []
+        self.graph.schedule = pending.append
+        self.graph.add(['z'], update=self.logger('z'))
+        self.s.k = 3
+        self.s.x = numpy.arange(3.)
+        self.assert_(len(pending) == 1 and self.log == [])
+        self.assert_(pending[0]() == 3)
+        self.assert_(self.log == [('z', 10.0)])
+
+if __name__ == '__main__': # pragma: no cover
+    for case in (TestReactive,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(verbosity=2).run(suite)
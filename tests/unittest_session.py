@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import stat
+import shutil
+import unittest
+import tempfile
+
+import numpy
+import larch
+from larch.session import save_session, load_session, ARRAY_DIR
+from larch.util import Procedure
+from unittest_util import *
+
+class TestSession(TestCase):
+    '''saving and restoring sessions'''
+
+    def setUp(self):
+        TestCase.setUp(self)
+        self.tmpdir = tempfile.mkdtemp(prefix='larch')
+        self.dirname = os.path.join(self.tmpdir, 'session')
+
+    def tearDown(self):
+        TestCase.tearDown(self)
+        shutil.rmtree(self.tmpdir)
+
+    def restore(self):
+        "a new interpreter with the session saved in self.dirname"
+        li = larch.Interpreter(writer=self.stdout)
+        li('load_session(%r)' % self.dirname)
+        self.assert_(not li.error)
+        return li
+
+    def test_groups(self):
+        '''groups and their members are restored, staying shared'''
+
+        self.li('''
+x = linspace(0, 1, 100000)
+small = arange(4)
+g = group(a=1, s='text', arr=x, small=small, sub=group(b=[1, 2]))
+g.parent = g
+h = g.sub
+''')
+        self.li('save_session(%r)' % self.dirname)
+        self.assert_(not self.li.error)
+        self.assert_(os.listdir(os.path.join(self.dirname, ARRAY_DIR)) ==
+                     ['0.npy'])
+        li = self.restore()
+        s = li.symtable
+        self.assert_(li('g.a == 1 and g.s == "text" and g.sub.b == [1, 2]'))
+        self.assert_(s.g.parent is s.g and s.h is s.g.sub)
+        self.assert_(isinstance(s.x, numpy.memmap) and s.g.arr is s.x)
+        self.assert_(numpy.all(s.x == self.s.x))
+        self.assert_(not isinstance(s.small, numpy.memmap))
+        self.assert_(li('small[3] == 3 and len(small) == 4'))
+
+    def test_arrays_copy_on_write(self):
+        '''restored arrays can be changed, leaving the saved session'''
+
+        self.li('x = zeros(100000)')
+        save_session(self.dirname, self.li)
+        li = self.restore()
+        li('x[0] = 5')
+        self.assert_(li('x[0] == 5'))
+        self.assert_(self.restore()('x[0] == 0'))
+        # saving over the session the arrays are mapped from
+        save_session(self.dirname, li)
+        self.assert_(self.restore()('x[0] == 5'))
+
+    def test_procedures(self):
+        '''procedures and defined variables are made again'''
+
+        self.li('''
+scale = 3
+def f(a, b=2, *args, **kws):
+    "doc of f"
+    return a * b * scale
+#enddef
+def gen(n):
+    for i in range(n):
+        yield i * scale
+    #endfor
+#enddef
+''')
+        self.li.set_definedvariable('dv', 'scale * 10')
+        save_session(self.dirname, self.li)
+        li = self.restore()
+        s = li.symtable
+        self.assert_(isinstance(s.f, Procedure) and s.f.larch is li)
+        self.assert_(s.f.modgroup is s and s.f.__doc__ == 'doc of f')
+        self.assert_(li('f(2) == 12 and f(2, b=1) == 6'))
+        self.assert_(li('list(gen(3)) == [0, 3, 6]'))
+        self.assert_(li('dv == 30'))
+        li('scale = 1')
+        self.assert_(li('dv == 10 and f(1) == 2'))
+
+    def test_modules(self):
+        '''larch modules are restored to _sys.modules'''
+
+        with open(os.path.join(self.tmpdir, 'sessmod.lar'), 'w') as outf:
+            outf.write('y = 2\ndef g(x):\n    return x * y\n#enddef\n')
+        self.li.symtable._sys.path.insert(0, self.tmpdir)
+        self.li('import sessmod')
+        self.li('import os')
+        save_session(self.dirname, self.li)
+        li = self.restore()
+        s = li.symtable
+        mod = s._sys.modules['sessmod']
+        self.assert_(s.sessmod is mod and s.sessmod.g.modgroup is mod)
+        self.assert_(li('sessmod.g(3) == 6') and s.os is os)
+
+    def test_skipped(self):
+        '''members that cannot be saved are left out and reported'''
+
+        self.li('fh = open(%r, "w")' % os.path.join(self.tmpdir, 'out'))
+        self.li('g = group(fh=fh, a=1)')
+        self.li('save_session(%r)' % self.dirname)
+        self.li('fh.close()')
+        with self.get_stdout() as out:
+            self.assert_('fh, g.fh' in out)
+        li = self.restore()
+        self.assert_(li('g.a == 1'))
+        self.assert_(not hasattr(li.symtable, 'fh') and
+                     not hasattr(li.symtable.g, 'fh'))
+
+    def test_not_session(self):
+        '''restoring a directory that is not a session fails'''
+
+        os.mkdir(self.dirname)
+        with open(os.path.join(self.dirname, 'session.pkl'), 'wb') as outf:
+            outf.write(b'S"junk"\np0\n.')
+        self.assertRaises(ValueError, load_session, self.dirname, self.li)
+
+    def test_not_replaced(self):
+        '''saving over a directory that is not a session fails, leaving
+        it as it was'''
+
+        os.mkdir(self.dirname)
+        keep = os.path.join(self.dirname, 'important.txt')
+        with open(keep, 'w') as outf:
+            outf.write('data')
+        self.li('x = 1')
+        self.assertRaises(ValueError, save_session, self.dirname, self.li)
+        self.assert_(os.listdir(self.dirname) == ['important.txt'])
+        self.assert_(os.listdir(self.tmpdir) == ['session'])
+
+    def test_mode(self):
+        '''the session directory has the mode given by the umask'''
+
+        umask = os.umask(0o022)
+        try:
+            save_session(self.dirname, self.li)
+        finally:
+            os.umask(umask)
+        self.assert_(stat.S_IMODE(os.stat(self.dirname).st_mode) == 0o755)
+
+if __name__ == '__main__': # pragma: no cover
+    for case in (TestSession,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(verbosity=2).run(suite)
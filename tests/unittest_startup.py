@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+from __future__ import print_function
+import os
+import unittest
+import tempfile
+
+import numpy
+import larch
+from larch import builtins, help
+from unittest_util import *
+
+class TestStartup(TestCase):
+    '''interpreter startup'''
+
+    def test_lazy_builtins(self):
+        '''_builtin and _math members are made when first used'''
+
+        math = self.s._math
+        self.assert_('sin' not in math.__dict__ and 'sin' in dir(math))
+        self.assert_(self.li('sin(0)') == 0)
+        self.assert_(math.__dict__['sin'] is numpy.sin)
+        self.assert_(math.ln is numpy.log and math.atan2 is numpy.arctan2)
+        self.assert_(self.s._builtin.len is len)
+        names = set(builtins.from_numpy) | set(builtins.numpy_renames)
+        self.assert_(set(dir(math)) == names)
+        self.li('del _math.e')
+        self.assert_(not hasattr(math, 'e'))
+
+    def test_rcfile(self):
+        '''the file named by $LARCHRC is run'''
+
+        fd, fname = tempfile.mkstemp(suffix='.lar')
+        os.write(fd, 'rcvalue = 4\n')
+        os.close(fd)
+        old = os.environ.get('LARCHRC')
+        os.environ['LARCHRC'] = fname
+        try:
+            li = larch.Interpreter(writer=self.stdout)
+        finally:
+            if old is None:
+                del os.environ['LARCHRC']
+            else:
+                os.environ['LARCHRC'] = old
+            os.unlink(fname)
+        self.assert_(li.symtable.rcvalue == 4)
+
+    def test_phases(self):
+        '''the time of each phase of startup is kept in _sys.startup'''
+
+        phases = self.s._sys.startup
+        self.assert_([name for name, dt in phases] ==
+                     ['symtable', 'builtins', 'rcfiles'])
+        self.assert_(all([dt >= 0 for name, dt in phases]))
+
+    def test_help_topics(self):
+        '''help topics are made when help is first used'''
+
+        topics = help.help_topics()
+        self.assert_(help.help_topics() is topics and 'topics' in topics)
+        self.assert_('Help topics' in self.li('help("topics")'))
+
+if __name__ == '__main__': # pragma: no cover
+    for case in (TestStartup,):
+        suite = unittest.TestLoader().loadTestsFromTestCase(case)
+        unittest.TextTestRunner(verbosity=2).run(suite)